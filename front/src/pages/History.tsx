@@ -4,11 +4,46 @@ import { CodeOutlined, ClockCircleOutlined, RiseOutlined, EyeOutlined } from '@a
 import { format } from 'date-fns';
 import { ru } from 'date-fns/locale';
 
-import mockAnalyses from '../mock/mockAnalyses.json';
 import type { Analysis } from '../components/analyzer/types';
 
 const { Title } = Typography;
 
+const API_URL = 'http://127.0.0.1:8000';
+
+interface HistoryItem {
+  id: number;
+  created_at: number;
+  sql_text: string | null;
+  risk_score: number | null;
+  severity: string | null;
+  total_cost: number | null;
+  rule_ids: string[];
+}
+
+const SEVERITY_TYPE: Record<string, Analysis['recommendations'][number]['type']> = {
+  critical: 'critical',
+  warning: 'warning',
+  info: 'info',
+};
+
+// запись истории бэкенда (/history) -> модель страницы
+const toAnalysis = (item: HistoryItem): Analysis => ({
+  id: String(item.id),
+  query: item.sql_text ?? '',
+  created_date: new Date(item.created_at * 1000).toISOString(),
+  estimated_cost: item.total_cost ?? 0,
+  execution_time: 0,
+  complexity_score: Math.round((item.risk_score ?? 0) / 10),
+  recommendations: item.rule_ids.map((ruleId) => ({
+    type: SEVERITY_TYPE[item.severity ?? ''] ?? 'info',
+    title: ruleId,
+    description: '',
+    impact: 'medium',
+  })),
+  performance_insights: { scan_operations: [], index_usage: '', join_operations: [], potential_bottlenecks: [] },
+  optimization_suggestions: [],
+});
+
 export default function HistoryPage() {
   const [analyses, setAnalyses] = useState<Analysis[]>([]);
   const [selectedAnalysis, setSelectedAnalysis] = useState<Analysis | null>(null);
@@ -20,8 +55,12 @@ export default function HistoryPage() {
 
   const loadAnalyses = async () => {
     try {
-      await new Promise(resolve => setTimeout(resolve, 800));
-      setAnalyses(mockAnalyses as Analysis[]);
+      const response = await fetch(`${API_URL}/history?limit=50`);
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const page: { items: HistoryItem[]; next_cursor: string | null } = await response.json();
+      setAnalyses(page.items.map(toAnalysis));
     } catch (error) {
       console.error('Ошибка загрузки истории:', error);
       message.error('Не удалось загрузить историю анализов');
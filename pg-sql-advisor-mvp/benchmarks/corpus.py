@@ -0,0 +1,77 @@
+# benchmarks/corpus.py
+# Генератор синтетических EXPLAIN (FORMAT JSON) планов для бенчмарков.
+# Планы детерминированы (зависят только от формы и числа узлов), поэтому
+# результаты разных прогонов сравнимы между собой.
+from typing import Any, Callable, Dict, List
+
+SIZES = (10, 100, 1_000, 10_000, 50_000)
+
+
+def _seq_scan(i: int, to_char: bool = False) -> Dict[str, Any]:
+    node = {
+        "Node Type": "Seq Scan",
+        "Relation Name": f"orders_p{i}",
+        "Alias": f"o{i}",
+        "Plan Rows": 500_000,
+        "Total Cost": 10_000.0 + i,
+        "Filter": "(status = 'new'::text)",
+    }
+    if to_char:
+        node["Filter"] = ("((to_char(created_at, 'YYYY-MM-DD'::text) >= '2024-01-01'::text) AND "
+                          "(to_char(created_at, 'YYYY-MM-DD'::text) <= '2024-01-31'::text))")
+    return node
+
+def deep_nested_loop(n: int) -> Dict[str, Any]:
+    """Цепочка Nested Loop глубиной ~n/2: внешняя сторона — следующий NL, внутренняя — Seq Scan."""
+    depth = max(1, (n - 1) // 2)
+    node: Dict[str, Any] = {"Node Type": "Index Scan", "Relation Name": "users", "Index Name": "users_pkey",
+                            "Plan Rows": 1, "Total Cost": 8.0}
+    for i in range(depth):
+        inner = _seq_scan(i)
+        inner["Filter"] = f"(o{i}.user_id = u.id)"
+        node = {"Node Type": "Nested Loop", "Join Type": "Inner", "Plan Rows": 1000,
+                "Total Cost": 1e6 + i, "Join Filter": f"(o{i}.user_id = u.id)", "Plans": [node, inner]}
+    return {"Plan": node}
+
+def wide_append(n: int) -> Dict[str, Any]:
+    """Append над n-1 партициями с Seq Scan, сверху Sort по времени."""
+    scans = [_seq_scan(i) for i in range(max(1, n - 2))]
+    append = {"Node Type": "Append", "Plan Rows": 500_000 * len(scans), "Total Cost": 1e7, "Plans": scans}
+    return {"Plan": {"Node Type": "Sort", "Sort Key": ["created_at DESC"], "Plan Rows": 500_000 * len(scans),
+                     "Plan Width": 64, "Total Cost": 2e7, "Plans": [append]}}
+
+def to_char_scans(n: int) -> Dict[str, Any]:
+    """Много Seq Scan с фильтром to_char(created_at) по диапазону дат."""
+    scans = [_seq_scan(i, to_char=True) for i in range(max(1, n - 1))]
+    return {"Plan": {"Node Type": "Append", "Plan Rows": 1000, "Total Cost": 1e6, "Plans": scans}}
+
+SHAPES: Dict[str, Callable[[int], Dict[str, Any]]] = {
+    "deep_nested_loop": deep_nested_loop,
+    "wide_append": wide_append,
+    "to_char_scans": to_char_scans,
+}
+
+
+def count_nodes(plan_root: Dict[str, Any]) -> int:
+    stack, n = [plan_root.get("Plan", plan_root)], 0
+    while stack:
+        node = stack.pop()
+        n += 1
+        stack.extend(node.get("Plans") or [])
+    return n
+
+def synthetic_rules(base: List[Dict[str, Any]], n: int) -> List[Dict[str, Any]]:
+    """
+    n правил: реальный набор + копии с недостижимым порогом. Как в большом
+    каталоге, предикаты проверяются на каждой фиче своего kind, но
+    срабатывают только реальные правила — меряем диспетчеризацию, а не
+    объём вывода.
+    """
+    out = []
+    for i in range(n):
+        r = dict(base[i % len(base)])
+        if i >= len(base):
+            r["id"] = f"{r.get('id', 'R')}_{i}"
+            r["match"] = {**(r.get("match") or {}), "selectivity_lt": 0.0}
+        out.append(r)
+    return out
@@ -0,0 +1,146 @@
+# benchmarks/run.py
+# Бенчмарк конвейера на синтетических планах, без PostgreSQL:
+#   python -m benchmarks.run --out benchmarks/baseline.json
+#   python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.25
+# Время — лучшее из --repeat прогонов; пиковая память — отдельным прогоном
+# под tracemalloc (он сам замедляет код, поэтому в замер времени не входит).
+import argparse, json, platform, sys, time, tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.models import AdviseInput, Feature
+from src.advisor.explainer import render_report
+from src.advisor.risk_score import aggregate_score
+from src.advisor.rule_engine import apply_rules
+from src.advisor.rules_loader import load_rules
+from src.advisor.ruleset import RuleSet
+from src.analyzer.extract import plan_to_features
+from benchmarks.corpus import SHAPES, SIZES, count_nodes, synthetic_rules
+
+RULE_COUNTS = (10, 100, 1_000)
+
+
+def _best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _peak_kb(fn: Callable[[], Any]) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+def _measure(fn: Callable[[], Any], repeat: int, items: int) -> Dict[str, Any]:
+    best = _best_of(fn, repeat)
+    return {
+        "best_s": round(best, 6),
+        "items_per_s": round(items / best, 1) if best else None,
+        "peak_kb": _peak_kb(fn),
+    }
+
+def _payload(plan_root: Dict[str, Any], feats: List[Dict[str, Any]]) -> AdviseInput:
+    # без валидации вложенного плана: на 50k узлов это отдельная (и нерелевантная) стоимость
+    return AdviseInput.model_construct(features=[Feature(**f) for f in feats], plan=plan_root,
+                                       statsUsed=[], dbSettings={}, sqlText=None)
+
+
+def run(sizes=SIZES, shapes=None, rule_counts=RULE_COUNTS, repeat: int = 3) -> Dict[str, Any]:
+    base_rules = list(load_rules().rules)
+    rulesets = {n: RuleSet(synthetic_rules(base_rules, n)) for n in rule_counts}
+    results: Dict[str, Any] = {}
+    for shape in shapes or SHAPES:
+        for size in sizes:
+            plan_root = SHAPES[shape](size)
+            nodes = count_nodes(plan_root)
+            feats = plan_to_features(plan_root, "")
+            payload = _payload(plan_root, feats)
+            key = f"{shape}/{size}"
+            results[f"plan_to_features/{key}"] = {
+                "nodes": nodes, **_measure(lambda: plan_to_features(plan_root, ""), repeat, nodes)}
+            for n_rules, rs in rulesets.items():
+                results[f"apply_rules/{key}/rules={n_rules}"] = {
+                    "features": len(feats), **_measure(lambda: apply_rules(payload, rs), repeat, max(1, len(feats)))}
+            recs, contribs = apply_rules(payload, rulesets[min(rulesets)] if rulesets else base_rules)
+            risk = aggregate_score(contribs, payload)
+            results[f"render_report/{key}"] = {
+                "recommendations": len(recs),
+                **_measure(lambda: render_report(recs, risk, payload), repeat, max(1, len(recs)))}
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float,
+            min_s: float = 0.001) -> List[Tuple[str, float, float, float]]:
+    """
+    Регрессии: стадии, где best_s вырос больше чем на threshold (0.25 = +25%).
+    Замеры короче min_s секунд не сравниваем — там шум больше сигнала.
+    """
+    bad = []
+    for key, cur in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base:
+            continue
+        b, c = base["best_s"], cur["best_s"]
+        if max(b, c) < min_s:
+            continue
+        ratio = c / b if b else float("inf")
+        if ratio > 1 + threshold:
+            bad.append((key, b, c, ratio))
+    return bad
+
+
+def _print_table(res: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    base = (baseline or {}).get("results", {})
+    print(f"{'stage':60} {'best ms':>10} {'peak KB':>10} {'vs base':>8}")
+    for key, r in res["results"].items():
+        delta = ""
+        if key in base and base[key]["best_s"]:
+            delta = f"{r['best_s'] / base[key]['best_s']:.2f}x"
+        print(f"{key:60} {r['best_s'] * 1000:10.2f} {r['peak_kb']:10.1f} {delta:>8}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Offline benchmark of plan_to_features / apply_rules / render_report")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    ap.add_argument("--quick", action="store_true", help="только планы до 1000 узлов (CI)")
+    ap.add_argument("--shapes", nargs="+", choices=sorted(SHAPES), default=None)
+    ap.add_argument("--rules", type=int, nargs="+", default=list(RULE_COUNTS))
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", help="записать результаты (baseline) в JSON")
+    ap.add_argument("--compare", help="сравнить с baseline JSON; exit 1 при регрессии")
+    ap.add_argument("--threshold", type=float, default=0.25, help="допустимый рост времени (0.25 = +25%%)")
+    args = ap.parse_args(argv)
+
+    sizes = [s for s in args.sizes if s <= 1_000] if args.quick else args.sizes
+    res = run(sizes=sizes, shapes=args.shapes, rule_counts=args.rules, repeat=args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_table(res, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2, ensure_ascii=False)
+    if baseline is not None:
+        bad = compare(baseline, res, args.threshold)
+        for key, b, c, ratio in bad:
+            print(f"REGRESSION {key}: {b * 1000:.2f} ms -> {c * 1000:.2f} ms ({ratio:.2f}x)", file=sys.stderr)
+        return 1 if bad else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+# gunicorn -c gunicorn.conf.py src.app:app
+# Правила и каталог грузятся один раз в мастере до fork; пулы БД каждый
+# воркер открывает сам при первом запросе.
+import os
+
+bind = f"0.0.0.0:{os.getenv('APP_PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def on_starting(server):
+    from src.lifecycle import preload
+    preload(freeze=True)
@@ -1,6 +1,8 @@
 # src/advisor/explainer.py
 from typing import List, Dict, Any, Optional
 import re
+from src.advisor.templates import render_with
+from src.advisor.measure import rewritten_time_where
 
 # ---------- utils ----------
 
@@ -24,14 +26,10 @@ def _to_dict(obj: Any) -> Dict[str, Any]:
         return {k: v for k, v in vars(obj).items() if not k.startswith("_")}
     return {}
 
-class _SafeDict(dict):
-    def __missing__(self, key):
-        return "{"+key+"}"
-
 def _fmt_with_ctx(txt: str, ctx: Dict[str, Any]) -> str:
-    if not isinstance(txt, str):
-        return txt
-    return txt.format_map(_SafeDict(ctx))
+    # действия уже отрендерены движком; здесь дозаполняются только оставшиеся
+    # плейсхолдеры (например, даты из соседней фичи того же узла)
+    return render_with(txt, ctx)
 
 def _human_severity(sev: str) -> str:
     s = (sev or "info").lower()
@@ -95,34 +93,44 @@ def _sort_key(rec: Dict[str, Any]) -> tuple:
 
 # ---------- plan evidence ----------
 
-def _walk_plan_nodes(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
-    out = []
-    if not plan:
-        return out
-    node = plan.get("Plan") or plan
-    def dfs(n):
-        out.append(n)
-        for ch in n.get("Plans", []) or []:
-            dfs(ch)
-    dfs(node)
-    return out
-
-def _find_nodes_by_relation(plan: Dict[str, Any], relation: str) -> List[Dict[str, Any]]:
-    if not plan or not relation:
-        return []
-    nodes = _walk_plan_nodes(plan)
-    rel_low = relation.strip('"').split('.')[-1].lower()
-    hits = []
-    for n in nodes:
-        rn = (n.get("Relation Name") or n.get("Alias") or "")
-        if rn and rn.strip('"').split('.')[-1].lower() == rel_low:
-            hits.append(n)
-    return hits
-
-def _render_plan_evidence(plan: Dict[str, Any], relation: Optional[str]) -> List[str]:
-    if not plan or not relation:
-        return []
-    nodes = _find_nodes_by_relation(plan, relation)
+def _rel_key(name: str) -> str:
+    return name.strip('"').split('.')[-1].lower()
+
+class _PlanIndex:
+    """
+    Индекс плана на один отчёт: узлы по relation и по nodeId (pre-order,
+    как в extract.plan_to_features) плюс контекст фич по nodeId.
+    Строится за один проход и переиспользуется всеми рекомендациями.
+    """
+    __slots__ = ("by_relation", "by_node_id", "ctx_by_node")
+
+    def __init__(self, plan: Dict[str, Any], payload):
+        self.by_relation: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_node_id: Dict[int, Dict[str, Any]] = {}
+        self.ctx_by_node = _ctx_by_node(payload)
+        if not plan:
+            return
+        stack = [plan.get("Plan") or plan]
+        node_id = 0
+        while stack:
+            n = stack.pop()
+            self.by_node_id[node_id] = n
+            node_id += 1
+            rn = n.get("Relation Name") or n.get("Alias")
+            if rn:
+                self.by_relation.setdefault(_rel_key(rn), []).append(n)
+            kids = n.get("Plans")
+            if kids:
+                stack.extend(reversed(kids))
+
+    def nodes_for(self, relation: Optional[str], node_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        if relation:
+            return self.by_relation.get(_rel_key(relation), [])
+        n = self.by_node_id.get(node_id) if node_id is not None else None
+        return [n] if n is not None else []
+
+def _render_plan_evidence(index: _PlanIndex, relation: Optional[str], node_id: Optional[int] = None) -> List[str]:
+    nodes = index.nodes_for(relation, node_id)
     if not nodes:
         return []
     lines = ["  - Доказательства из плана:"]
@@ -144,7 +152,18 @@ def _render_plan_evidence(plan: Dict[str, Any], relation: Optional[str]) -> List
 
 # ---------- rec rendering ----------
 
-def _render_one_rec(r: Dict[str, Any], ctx_node: Dict[str, Any], full_plan: Dict[str, Any]) -> List[str]:
+def _fmt_gain(v: Any) -> str:
+    # измеренная дельта плана (src/advisor/measure.py) -> "cost 1200 → 80 (-93.3%); rows 5000 → 120"
+    if not isinstance(v, dict) or "cost_before" not in v:
+        return str(v)
+    out = f"cost {v['cost_before']:g} → {v['cost_after']:g}"
+    if v.get("cost_delta_pct") is not None:
+        out += f" ({v['cost_delta_pct']:+g}%)"
+    if v.get("rows_before") is not None and v.get("rows_after") is not None:
+        out += f"; rows {v['rows_before']} → {v['rows_after']}"
+    return out
+
+def _render_one_rec(r: Dict[str, Any], ctx_node: Dict[str, Any], index: _PlanIndex) -> List[str]:
     lines: List[str] = []
     title = r.get("title") or "Recommendation"
     act = r.get("action") or {}
@@ -192,7 +211,7 @@ def _render_one_rec(r: Dict[str, Any], ctx_node: Dict[str, Any], full_plan: Dict
         fd = ctx_node.get("fromDate")
         tn = ctx_node.get("toDate_next")
         if tc and fd and tn:
-            rewritten_where = f"\"{tc}\" >= DATE '{fd}' AND \"{tc}\" < DATE '{tn}'"
+            rewritten_where = rewritten_time_where(tc, fd, tn)
             what_blk.append("    - Rewritten WHERE:")
             what_blk.append(_code_block(rewritten_where))
     if "ddl" in act_fmt:
@@ -216,12 +235,12 @@ def _render_one_rec(r: Dict[str, Any], ctx_node: Dict[str, Any], full_plan: Dict
         eff = []
         if exp.get("kind"): eff.append(f"тип: {exp['kind']}")
         if exp.get("source"): eff.append(f"оценка: {exp['source']}")
-        if exp.get("value") is not None: eff.append(f"эффект: {exp['value']}")
+        if exp.get("value") is not None: eff.append(f"эффект: {_fmt_gain(exp['value'])}")
         if eff:
             lines.append("  - Как это поможет: " + "; ".join(eff))
 
     # Plan evidence (по relation)
-    pe = _render_plan_evidence(full_plan, ctx_node.get("relation"))
+    pe = _render_plan_evidence(index, ctx_node.get("relation"), ctx_node.get("nodeId"))
     if pe:
         lines.extend(pe)
 
@@ -239,10 +258,11 @@ def _render_one_rec(r: Dict[str, Any], ctx_node: Dict[str, Any], full_plan: Dict
 # ---------- main ----------
 
 def render_report(recs: List[Dict[str, Any]], risk: Dict[str, Any], payload) -> str:
-    ctx_map = _ctx_by_node(payload)
     recs = _dedupe_index_recs(recs)
     recs = sorted(recs, key=_sort_key)
     plan = _to_dict(getattr(payload, "plan", None)) or _to_dict(getattr(payload, "plan_json", None)) or (_to_dict(payload).get("plan") or {})
+    index = _PlanIndex(plan, payload)
+    ctx_map = index.ctx_by_node
 
     sev = _human_severity(risk.get("severity", "info"))
     score = risk.get("score", 0)
@@ -277,7 +297,7 @@ def render_report(recs: List[Dict[str, Any]], risk: Dict[str, Any], payload) ->
                 ev0 = _to_dict(r["evidence"][0])
                 node_id = ev0.get("nodeId")
             ctx_node = ctx_map.get(node_id, {}) if node_id is not None else {}
-            lines.extend(_render_one_rec(r, ctx_node, plan))
+            lines.extend(_render_one_rec(r, ctx_node, index))
     else:
         lines.append("_Проблем не найдено._")
 
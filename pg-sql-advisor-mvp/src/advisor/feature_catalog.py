@@ -1,16 +1,21 @@
-import os, yaml
+import logging, os, yaml
 from functools import lru_cache
-from typing import Set
+from typing import FrozenSet
+
+logger = logging.getLogger("pg_sql_advisor")
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feature_kinds.yaml")
 
 @lru_cache
-def load_feature_kinds() -> Set[str]:
-    path = os.environ.get("FEATURE_KINDS_FILE", "src/advisor/feature_kinds.yaml")
+def load_feature_kinds() -> FrozenSet[str]:
+    # загружается один раз на процесс (в мастере до fork — см. src/lifecycle.py)
+    path = os.environ.get("FEATURE_KINDS_FILE", _DEFAULT_PATH)
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
             data = yaml.safe_load(f) or []
-        return set(map(str, data))
-    # fallback + предупреждение в лог
-    print(f"[feature_catalog] WARNING: {path} not found; using fallback list.")
+        return frozenset(map(str, data))
+    logger.warning("[feature_catalog] %s not found; no feature kinds available.", path)
+    return frozenset()
 
 def is_valid_feature_kind(kind: str) -> bool:
     return kind in load_feature_kinds()
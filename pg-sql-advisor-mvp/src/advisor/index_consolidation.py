@@ -0,0 +1,228 @@
+# src/advisor/index_consolidation.py
+# Сведение индексных рекомендаций нескольких запросов в минимальный набор.
+# Каждый лишний индекс — это цена на запись, поэтому:
+#   * btree-индекс с ключами-префиксом поглощается более длинным индексом
+#     той же таблицы (тот же метод и WHERE);
+#   * INCLUDE-колонки поглощённых индексов переносятся в поглотивший;
+#   * не-btree индексы (gin/gist/...) сливаются только при совпадении ключей;
+#   * UNIQUE и неразобранный DDL не трогаем — только точные дубли.
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .templates import _flat_for_idx, _safe_name
+
+_CREATE_INDEX = re.compile(
+    r"""^\s*CREATE\s+(?P<unique>UNIQUE\s+)?INDEX\s+(?P<conc>CONCURRENTLY\s+)?
+        (?:IF\s+NOT\s+EXISTS\s+)?(?P<name>(?!ON\b)[\w".]+\s+)?
+        ON\s+(?:ONLY\s+)?(?P<table>[\w".]+)\s*
+        (?:USING\s+(?P<method>\w+)\s*)?
+        \((?P<rest>.*)$""",
+    re.I | re.X | re.S,
+)
+
+
+def _split_top(s: str) -> List[str]:
+    """Разбить по запятым верхнего уровня (скобки и кавычки учитываются)."""
+    out, depth, quote, buf = [], 0, None, []
+    for ch in s:
+        if quote:
+            buf.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch in ("'", '"'):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            out.append("".join(buf).strip())
+            buf = []
+            continue
+        buf.append(ch)
+    tail = "".join(buf).strip()
+    if tail:
+        out.append(tail)
+    return out
+
+def _close_paren(s: str) -> int:
+    """Индекс закрывающей скобки для уже открытой '(' (s начинается после неё)."""
+    depth, quote = 1, None
+    for i, ch in enumerate(s):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+def _norm_key(k: str) -> str:
+    k = re.sub(r"\s+", " ", k.strip())
+    k = re.sub(r"\s+ASC$", "", k, flags=re.I)
+    return k
+
+def _key_id(k: str) -> str:
+    # сравниваем без кавычек и регистра: "email" == email
+    return _norm_key(k).replace('"', "").lower()
+
+def parse_index_ddl(ddl: str) -> Optional[Dict[str, Any]]:
+    """CREATE INDEX ... -> {table, method, keys, include, where, ...} или None."""
+    if not ddl:
+        return None
+    m = _CREATE_INDEX.match(ddl)
+    if not m:
+        return None
+    rest = m.group("rest")
+    end = _close_paren(rest)
+    if end < 0:
+        return None
+    keys = [_norm_key(k) for k in _split_top(rest[:end])]
+    tail = rest[end + 1:].strip().rstrip(";").strip()
+    include: List[str] = []
+    mi = re.match(r"INCLUDE\s*\(", tail, re.I)
+    if mi:
+        inner = tail[mi.end():]
+        e = _close_paren(inner)
+        if e < 0:
+            return None
+        include = [_norm_key(c) for c in _split_top(inner[:e])]
+        tail = inner[e + 1:].strip()
+    where = None
+    mw = re.match(r"WHERE\s+(.+)$", tail, re.I | re.S)
+    if mw:
+        where = re.sub(r"\s+", " ", mw.group(1)).strip()
+    elif tail:
+        return None  # WITH (...), TABLESPACE и пр. — не берёмся переписывать
+    if not keys:
+        return None
+    return {
+        "name": (m.group("name") or "").strip() or None,
+        "unique": bool(m.group("unique")),
+        "concurrently": bool(m.group("conc")),
+        "table": m.group("table"),
+        "method": (m.group("method") or "btree").lower(),
+        "keys": keys,
+        "include": include,
+        "where": where,
+    }
+
+def render_index_ddl(ix: Dict[str, Any]) -> str:
+    name = ix.get("name") or "idx_" + _safe_name(ix["table"]) + "_" + _safe_name(_flat_for_idx(ix["keys"]))
+    parts = ["CREATE", "UNIQUE" if ix.get("unique") else None, "INDEX",
+             "CONCURRENTLY" if ix.get("concurrently") else None, name, "ON", ix["table"]]
+    if ix.get("method") and ix["method"] != "btree":
+        parts += ["USING", ix["method"]]
+    ddl = " ".join(p for p in parts if p) + "(" + ", ".join(ix["keys"]) + ")"
+    if ix.get("include"):
+        ddl += " INCLUDE(" + ", ".join(ix["include"]) + ")"
+    if ix.get("where"):
+        ddl += " WHERE " + ix["where"]
+    return ddl + ";"
+
+
+def _group_key(ix: Dict[str, Any]) -> Tuple[str, str, str]:
+    return (ix["table"].replace('"', "").lower(), ix["method"], (ix["where"] or "").lower())
+
+def _absorbs(big: Dict[str, Any], small: Dict[str, Any]) -> bool:
+    bk, sk = big["_kid"], small["_kid"]
+    if big["unique"] or small["unique"]:
+        return bk == sk and big["unique"] == small["unique"]
+    if big["method"] != "btree":
+        return bk == sk
+    return len(sk) <= len(bk) and bk[:len(sk)] == sk
+
+def _fold_include(big: Dict[str, Any], small: Dict[str, Any]) -> None:
+    have = set(big["_kid"]) | {_key_id(c) for c in big["include"]}
+    for c in small["include"]:
+        if _key_id(c) not in have:
+            big["include"].append(c)
+            have.add(_key_id(c))
+
+def _add_ref(target: Dict[str, Any], c: Dict[str, Any]) -> None:
+    q, r = c.get("query"), c.get("rule_id")
+    if q is not None and q not in target["queries"]:
+        target["queries"].append(q)
+    if r and r not in target["rule_ids"]:
+        target["rule_ids"].append(r)
+
+def consolidate_indexes(candidates: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    candidates: {"ddl", "query", "rule_id"} — по одному на индексную рекомендацию.
+    Возвращает минимальный набор индексов и запросы, которые обслуживает каждый.
+    """
+    parsed: List[Dict[str, Any]] = []
+    unparsed: Dict[str, Dict[str, Any]] = {}
+    total = 0
+    for c in candidates:
+        ddl = (c.get("ddl") or "").strip()
+        if not ddl:
+            continue
+        total += 1
+        ix = parse_index_ddl(ddl)
+        if ix is None:
+            u = unparsed.setdefault(ddl.lower(), {"ddl": ddl, "queries": [], "rule_ids": []})
+            _add_ref(u, c)
+            continue
+        ix.update(_kid=[_key_id(k) for k in ix["keys"]], queries=[], rule_ids=[], merged_from=[ddl])
+        _add_ref(ix, c)
+        parsed.append(ix)
+
+    chosen: List[Dict[str, Any]] = []
+    # длинные ключи первыми: короткие индексы поглощаются ими
+    for ix in sorted(parsed, key=lambda i: -len(i["keys"])):
+        gk = _group_key(ix)
+        host = next((h for h in chosen if _group_key(h) == gk and _absorbs(h, ix)), None)
+        if host is None:
+            chosen.append(ix)
+            continue
+        # у не-btree и уникальных индексов набор колонок не расширяем
+        if host["method"] == "btree" and not host["unique"]:
+            _fold_include(host, ix)
+        for q in ix["queries"]:
+            if q not in host["queries"]:
+                host["queries"].append(q)
+        for r in ix["rule_ids"]:
+            if r not in host["rule_ids"]:
+                host["rule_ids"].append(r)
+        if ix["merged_from"][0] not in host["merged_from"]:
+            host["merged_from"].append(ix["merged_from"][0])
+
+    indexes = []
+    for ix in chosen:
+        indexes.append({
+            "ddl": render_index_ddl(ix),
+            "table": ix["table"],
+            "method": ix["method"],
+            "keys": ix["keys"],
+            "include": ix["include"],
+            "where": ix["where"],
+            "unique": ix["unique"],
+            "queries": ix["queries"],
+            "rule_ids": ix["rule_ids"],
+            "merged_from": ix["merged_from"],
+        })
+    indexes.sort(key=lambda i: (-len(i["queries"]), i["table"], i["ddl"]))
+    return {
+        "input": total,
+        "output": len(indexes) + len(unparsed),
+        "indexes": indexes,
+        "unparsed": list(unparsed.values()),
+    }
+
+def index_candidates(items: Iterable[Dict[str, Any]], query_key: str = "query") -> List[Dict[str, Any]]:
+    """Индексные рекомендации из результатов batch/workload: {query_key, recommendations}."""
+    out = []
+    for it in items:
+        if it.get("ok") is False:
+            continue
+        for rec in it.get("recommendations") or []:
+            ddl = (rec.get("action") or {}).get("ddl")
+            if rec.get("type") == "index" and ddl and re.match(r"\s*CREATE\b", ddl, re.I):
+                out.append({"ddl": ddl, "query": it.get(query_key), "rule_id": rec.get("rule_id")})
+    return out
@@ -0,0 +1,144 @@
+# src/advisor/measure.py
+# Измеренный эффект рекомендаций вместо статической метки expected_gain:
+#   * sql_rewrite — EXPLAIN исходного и переписанного запроса (параллельно);
+#   * db_setting  — EXPLAIN под предлагаемым SET LOCAL в откатываемой транзакции.
+# В expected_gain.value попадает дельта Total Cost и оценки строк корня плана.
+import asyncio, re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# параметры, которые разрешено менять на время замера (только планировщик/память)
+MEASURABLE_SETTINGS = frozenset({
+    "work_mem", "hash_mem_multiplier", "maintenance_work_mem",
+    "random_page_cost", "seq_page_cost", "effective_cache_size",
+    "cpu_tuple_cost", "cpu_index_tuple_cost", "cpu_operator_cost",
+    "jit", "enable_seqscan", "enable_indexscan", "enable_bitmapscan",
+    "enable_hashjoin", "enable_mergejoin", "enable_nestloop", "enable_hashagg", "enable_sort",
+})
+# правила, чья рекомендация — именно переписывание to_char(...) в диапазон по колонке;
+# другие sql_rewrite на том же узле (LIKE '%x' и т.п.) этот замер не описывает
+RANGE_REWRITE_RULES = frozenset({"R_CAST_PREVENTS_INDEX"})
+_SET_LOCAL = re.compile(r"^\s*SET\s+LOCAL\s+(\w+)\s*(?:=|\bTO\b)\s*(?:'([^']*)'|([\w.]+))\s*;?\s*$", re.I)
+_SETTING_VALUE = re.compile(r"^[\w.]+$")
+
+
+def parse_set_local(alter: str) -> Optional[Tuple[str, str]]:
+    """"SET LOCAL work_mem = '128MB';" -> ("work_mem", "128MB"); чужое/опасное -> None."""
+    m = _SET_LOCAL.match(alter or "")
+    if not m:
+        return None
+    name, value = m.group(1).lower(), m.group(2) if m.group(2) is not None else m.group(3)
+    if name not in MEASURABLE_SETTINGS or not _SETTING_VALUE.match(value or ""):
+        return None
+    return name, value
+
+def rewritten_time_where(col: str, from_date: str, to_date_next: str) -> str:
+    return f"\"{col}\" >= DATE '{from_date}' AND \"{col}\" < DATE '{to_date_next}'"
+
+def rewrite_time_range(sql: str, col: str, from_date: str, to_date_next: str) -> Optional[str]:
+    """Заменить to_char(col, fmt) BETWEEN/>=..<= на полуинтервал по самой колонке."""
+    expr = r"to_char\(\s*\"?%s\"?\s*,\s*'[^']*'(?:\s*::\s*text)?\s*\)(?:\s*::\s*text)?" % re.escape(col)
+    lit = r"'[^']*'(?:\s*::\s*\w+)?"
+    patterns = (
+        rf"{expr}\s+BETWEEN\s+{lit}\s+AND\s+{lit}",
+        rf"{expr}\s*>=\s*{lit}\s+AND\s+{expr}\s*<=\s*{lit}",
+        rf"{expr}\s*<=\s*{lit}\s+AND\s+{expr}\s*>=\s*{lit}",
+    )
+    new_where = rewritten_time_where(col, from_date, to_date_next)
+    for p in patterns:
+        out, n = re.subn(p, new_where, sql, flags=re.I)
+        if n:
+            return out
+    return None
+
+
+def _root(plan: Any) -> Dict[str, Any]:
+    if isinstance(plan, list):
+        plan = plan[0] if plan else {}
+    return (plan or {}).get("Plan") or plan or {}
+
+def plan_delta(before: Any, after: Any) -> Dict[str, Any]:
+    b, a = _root(before), _root(after)
+    cb, ca = float(b.get("Total Cost") or 0), float(a.get("Total Cost") or 0)
+    rb, ra = b.get("Plan Rows"), a.get("Plan Rows")
+    return {
+        "cost_before": cb,
+        "cost_after": ca,
+        "cost_delta": round(ca - cb, 2),
+        "cost_delta_pct": round((ca - cb) / cb * 100, 1) if cb else None,
+        "rows_before": rb,
+        "rows_after": ra,
+        "rows_delta": (ra - rb) if rb is not None and ra is not None else None,
+    }
+
+
+def _range_by_node(features: List[Any]) -> Dict[Any, Dict[str, Any]]:
+    out = {}
+    for f in features or []:
+        d = f if isinstance(f, dict) else f.model_dump()
+        if d.get("kind") == "range_time_query" and d.get("fromDate") and d.get("toDate_next"):
+            out[d.get("nodeId")] = d
+    return out
+
+def _rewrite_for(rec: Dict[str, Any], sql: str, ranges: Dict[Any, Dict[str, Any]]) -> Optional[str]:
+    if rec.get("rule_id") not in RANGE_REWRITE_RULES:
+        return None
+    for ev in rec.get("evidence") or []:
+        rng = ranges.get((ev or {}).get("nodeId"))
+        if rng:
+            new_sql = rewrite_time_range(sql, rng["timeCol"], rng["fromDate"], rng["toDate_next"])
+            if new_sql and new_sql != sql:
+                return new_sql
+    return None
+
+
+ExplainFn = Callable[[str], Awaitable[Dict[str, Any]]]
+ExplainSetFn = Callable[[str, Dict[str, str]], Awaitable[Dict[str, Any]]]
+
+async def measure_gains(sql: str,
+                        recs: List[Dict[str, Any]],
+                        features: List[Any],
+                        explain: ExplainFn,
+                        explain_with_settings: ExplainSetFn) -> int:
+    """
+    Заполняет expected_gain.value/source="measured" у рекомендаций, для которых
+    есть что замерить. Исходный и все варианты EXPLAIN идут параллельно;
+    одинаковый вариант (тот же переписанный SQL или SET) — один EXPLAIN.
+    Возвращает число измеренных рекомендаций.
+    """
+    ranges = _range_by_node(features)
+    variants: Dict[Tuple, Awaitable[Dict[str, Any]]] = {}
+    jobs: List[Tuple[Dict[str, Any], Tuple]] = []
+    for rec in recs:
+        act = rec.get("action") or {}
+        if rec.get("type") == "sql_rewrite":
+            new_sql = _rewrite_for(rec, sql, ranges)
+            if new_sql:
+                key = ("sql", new_sql)
+                if key not in variants:
+                    variants[key] = explain(new_sql)
+                jobs.append((rec, key))
+        elif rec.get("type") == "db_setting" and act.get("alter"):
+            setting = parse_set_local(act["alter"])
+            if setting:
+                key = ("set", setting)
+                if key not in variants:
+                    variants[key] = explain_with_settings(sql, dict([setting]))
+                jobs.append((rec, key))
+    if not jobs:
+        return 0
+
+    base, *results = await asyncio.gather(explain(sql), *variants.values(), return_exceptions=True)
+    if isinstance(base, BaseException):
+        raise base
+    by_key = dict(zip(variants, results))
+    measured = 0
+    for rec, key in jobs:
+        res = by_key[key]
+        gain = rec.setdefault("expected_gain", {})
+        if isinstance(res, BaseException):
+            gain["error"] = str(res)
+            continue
+        gain["value"] = plan_delta(base.get("plan"), res.get("plan"))
+        gain["source"] = "measured"
+        measured += 1
+    return measured
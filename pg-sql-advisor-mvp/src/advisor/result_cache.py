@@ -0,0 +1,98 @@
+# src/advisor/result_cache.py
+# Мемоизация результата /advise (рекомендации + риск + markdown).
+# Ключ — версия правил + дайджест payload ровно в том виде, в каком его
+# читает apply_rules (model_dump фич без нормализации): нормализация
+# округляет числа и схлопывает фичи с общим fingerprint, а правила
+# различают memEstMB=4.0 и 4.9 или fkCol=b и c.
+import hashlib, json, os, threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _dump(model: Any, name: str) -> Any:
+    v = getattr(model, name, None)
+    if isinstance(v, list):
+        return [x.model_dump() if hasattr(x, "model_dump") else x for x in v]
+    return v
+
+def make_key(payload: Any, ruleset_version: Any) -> Tuple:
+    h = hashlib.blake2b(digest_size=16)
+    body = {
+        "features": [f.model_dump() if hasattr(f, "model_dump") else dict(f) for f in payload.features or []],
+        "statsUsed": _dump(payload, "statsUsed"),
+        "dbSettings": getattr(payload, "dbSettings", None),
+        "sqlText": getattr(payload, "sqlText", None),
+        "plan": getattr(payload, "plan", None),
+    }
+    h.update(json.dumps(body, sort_keys=True, default=str, separators=(",", ":")).encode())
+    return (ruleset_version, h.hexdigest())
+
+def _size_of(value: Any) -> int:
+    return len(json.dumps(value, default=str, separators=(",", ":")).encode())
+
+
+class ResultCache:
+    """LRU с лимитом по суммарному размеру значений в байтах (оценка — длина JSON)."""
+
+    def __init__(self, max_bytes: int = 64 << 20):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Tuple, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.oversized = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Tuple, value: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        size = _size_of(value)
+        with self._lock:
+            if size > self.max_bytes:
+                self.oversized += 1
+                return
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, sz) = self._data.popitem(last=False)
+                self._bytes -= sz
+                self.evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._data)
+            self._data.clear()
+            self._bytes = 0
+            return n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "oversized": self.oversized,
+            }
+
+
+result_cache = ResultCache(max_bytes=int(os.getenv("ADVISE_CACHE_MAX_BYTES", str(64 << 20))))
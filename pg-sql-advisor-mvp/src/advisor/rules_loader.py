@@ -1,7 +1,10 @@
 # src/advisor/rules_loader.py
-import os, yaml
+import logging, os, yaml
 from typing import List, Dict, Any
 from .feature_catalog import is_valid_feature_kind
+from .ruleset import RuleSet
+
+logger = logging.getLogger("pg_sql_advisor")
 
 ALLOWED_TYPES = {"index", "db_setting", "sql_rewrite", "stats"}
 
@@ -20,12 +23,13 @@ def _rule_is_actionable(rule: Dict[str, Any]) -> bool:
         return bool(act.get("ddl_template") or act.get("alter"))
     return False
 
-def load_rules(dir_path: str | None = None) -> List[Dict[str, Any]]:
+def load_rules(dir_path: str | None = None) -> RuleSet:
     dir_path = dir_path or os.environ.get("RULES_DIR", "src/rules/ruleset-v1")
     collected: List[Dict[str, Any]] = []
+    skipped: List[str] = []
     if not os.path.isdir(dir_path):
-        print(f"[rules_loader] WARNING: rules dir not found: {dir_path}")
-        return collected
+        logger.warning("[rules_loader] rules dir not found: %s", dir_path)
+        return RuleSet(collected)
 
     for name in sorted(os.listdir(dir_path)):
         if not (name.endswith(".yaml") or name.endswith(".yml")):
@@ -35,7 +39,8 @@ def load_rules(dir_path: str | None = None) -> List[Dict[str, Any]]:
             with open(path, "r", encoding="utf-8") as f:
                 data = yaml.safe_load(f) or {}
         except Exception as e:
-            print(f"[rules_loader] skip {name}: read error: {e}")
+            logger.warning("[rules_loader] skip %s: read error: %s", name, e)
+            skipped.append(name)
             continue
 
         data.setdefault("id", os.path.splitext(name)[0])
@@ -44,24 +49,30 @@ def load_rules(dir_path: str | None = None) -> List[Dict[str, Any]]:
         match = data.get("match") or {}
         fk = (match.get("feature") or "").strip()
         if not fk:
-            print(f"[rules_loader] skip {name}: no match.feature")
+            logger.warning("[rules_loader] skip %s: no match.feature", name)
+            skipped.append(name)
             continue
         if not is_valid_feature_kind(fk):
-            print(f"[rules_loader] skip {name}: unknown feature '{fk}'")
+            logger.warning("[rules_loader] skip %s: unknown feature '%s'", name, fk)
+            skipped.append(name)
             continue
 
         # 2) валидный type
         t = (data.get("type") or "").strip()
         if t not in ALLOWED_TYPES:
-            print(f"[rules_loader] skip {name}: invalid type '{t}'")
+            logger.warning("[rules_loader] skip %s: invalid type '%s'", name, t)
+            skipped.append(name)
             continue
 
         # 3) есть «действие»
         if not _rule_is_actionable(data):
-            print(f"[rules_loader] skip {name}: rule not actionable (no ddl/alter/rewrite)")
+            logger.warning("[rules_loader] skip %s: rule not actionable (no ddl/alter/rewrite)", name)
+            skipped.append(name)
             continue
 
         collected.append(data)
 
-    print(f"[rules_loader] loaded {len(collected)} rules from {dir_path}")
-    return collected
+    ruleset = RuleSet(collected, skipped)
+    logger.info("[rules_loader] loaded %d rules (%d feature kinds) from %s",
+                len(collected), len(ruleset.by_feature), dir_path)
+    return ruleset
@@ -0,0 +1,133 @@
+# src/advisor/rules_manager.py
+# Горячая перезагрузка правил: фоновый поток опрашивает mtime файлов в
+# RULES_DIR, собирает и компилирует новый набор вне пути запроса и
+# атомарно подменяет ссылку. Запрос берёт manager.current один раз и
+# дорабатывает на той версии, с которой начал.
+import hashlib, logging, os, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+from .rules_loader import load_rules
+from .ruleset import RuleSet
+
+logger = logging.getLogger("pg_sql_advisor")
+
+RULES_POLL_S = float(os.getenv("RULES_POLL_S", "2"))
+
+
+def _rules_dir(dir_path: Optional[str]) -> str:
+    return dir_path or os.environ.get("RULES_DIR", "src/rules/ruleset-v1")
+
+def dir_signature(dir_path: str) -> str:
+    """Дешёвый отпечаток каталога: имена, размеры и mtime_ns yaml-файлов."""
+    if not os.path.isdir(dir_path):
+        return ""
+    h = hashlib.sha1()
+    with os.scandir(dir_path) as it:
+        entries: List[Tuple[str, int, int]] = []
+        for e in it:
+            if e.name.endswith((".yaml", ".yml")) and e.is_file():
+                st = e.stat()
+                entries.append((e.name, st.st_size, st.st_mtime_ns))
+    for name, size, mtime in sorted(entries):
+        h.update(f"{name}:{size}:{mtime};".encode())
+    return h.hexdigest()
+
+
+class RulesetManager:
+    def __init__(self, dir_path: Optional[str] = None, poll_s: float = RULES_POLL_S):
+        self.dir_path = _rules_dir(dir_path)
+        self.poll_s = poll_s
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._current: Optional[RuleSet] = None
+        self.last_error: Optional[str] = None
+        self.reloads = 0
+        self.rejected = 0
+
+    # ---- путь запроса: только чтение ссылки ----
+    @property
+    def current(self) -> RuleSet:
+        rs = self._current
+        if rs is None:
+            self.reload()
+            rs = self._current
+        return rs
+
+    # ---- перезагрузка ----
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        with self._reload_lock:
+            sig = dir_signature(self.dir_path)
+            old = self._current
+            if old is not None and not force and sig == old.digest:
+                return self.status()
+            t0 = time.perf_counter()
+            try:
+                new = load_rules(self.dir_path)
+            except Exception as e:
+                self._reject(f"load failed: {e}")
+                return self.status()
+            if old is not None and len(old) and not len(new):
+                self._reject(f"new ruleset in {self.dir_path} is empty; keeping v{old.version}")
+                return self.status()
+            # битый или недописанный файл не должен молча выкинуть правило из набора
+            broken = sorted(set(new.skipped) - set(old.skipped)) if old is not None else []
+            if broken:
+                self._reject(f"invalid rule files {', '.join(broken)}; keeping v{old.version}")
+                return self.status()
+            new.version = (old.version + 1) if old is not None else 1
+            new.digest = sig
+            new.loaded_at = time.time()
+            new.load_ms = round((time.perf_counter() - t0) * 1000, 2)
+            self._current = new          # атомарная подмена ссылки
+            self.reloads += 1
+            self.last_error = None
+            if old is not None:
+                logger.info("rules: reloaded v%s -> v%s (%s rules, %.1f ms)",
+                            old.version, new.version, len(new), new.load_ms)
+            return self.status()
+
+    def _reject(self, msg: str) -> None:
+        self.rejected += 1
+        self.last_error = msg
+        logger.warning("rules: reload rejected: %s", msg)
+
+    # ---- фоновый опрос ----
+    def start(self) -> None:
+        if self.poll_s <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="rules-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_s + 1)
+            self._thread = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_s):
+            try:
+                rs = self._current
+                if rs is None or dir_signature(self.dir_path) != rs.digest:
+                    self.reload()
+            except Exception as e:  # поток не должен умирать из-за одной ошибки
+                logger.exception("rules watcher error: %s", e)
+
+    def status(self) -> Dict[str, Any]:
+        rs = self._current
+        return {
+            "version": rs.version if rs else None,
+            "digest": rs.digest if rs else None,
+            "rules": len(rs) if rs else 0,
+            "feature_kinds": len(rs.by_feature) if rs else 0,
+            "skipped": list(rs.skipped) if rs else [],
+            "loaded_at": rs.loaded_at if rs else None,
+            "load_ms": rs.load_ms if rs else None,
+            "dir": self.dir_path,
+            "watching": self._thread is not None and self._thread.is_alive(),
+            "poll_s": self.poll_s,
+            "reloads": self.reloads,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,104 @@
+# src/advisor/ruleset.py
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from src.advisor.templates import CompiledAction, compile_action
+
+# Предикат правила: feature -> bool
+Predicate = Callable[[Any], bool]
+
+
+def _always(feat: Any) -> bool:
+    return True
+
+
+def compile_match(match: Dict[str, Any]) -> Predicate:
+    """
+    Собирает условия match (кроме feature) в один предикат.
+    Пороги приводятся к float один раз — на загрузке, а не на каждом запросе.
+    """
+    checks: List[Predicate] = []
+
+    if "selectivity_lt" in match:
+        sel_lt = float(match["selectivity_lt"])
+
+        def _sel(feat, _lt=sel_lt):
+            sel = getattr(feat, "selectivity", None)
+            return sel is not None and sel < _lt
+        checks.append(_sel)
+
+    if match.get("mem_gt_workmem"):
+        def _mem(feat):
+            mem = getattr(feat, "memEstMB", None)
+            wm = getattr(feat, "workMemMB", None)
+            return mem is not None and wm is not None and mem > wm
+        checks.append(_mem)
+
+    if "mem_ratio_gt" in match:
+        ratio_gt = float(match["mem_ratio_gt"])
+
+        def _ratio(feat, _gt=ratio_gt):
+            mem = getattr(feat, "memEstMB", None)
+            wm = getattr(feat, "workMemMB", None)
+            return mem is not None and wm not in (None, 0) and (mem / wm) > _gt
+        checks.append(_ratio)
+
+    if not checks:
+        return _always
+    if len(checks) == 1:
+        return checks[0]
+    return lambda feat: all(c(feat) for c in checks)
+
+
+class CompiledRule:
+    __slots__ = ("index", "rule", "id", "feature", "predicate", "risk_base", "action")
+
+    def __init__(self, index: int, rule: Dict[str, Any]):
+        rule.setdefault("id", rule.get("id") or "RULE")
+        match = rule.get("match", {}) or {}
+        self.index = index          # порядок в исходном наборе — для стабильного вывода
+        self.rule = rule
+        self.id = rule["id"]
+        self.feature = match.get("feature") or None
+        self.predicate = compile_match(match)
+        self.risk_base = int(rule.get("risk", {}).get("base", 0))
+        self.action: CompiledAction = compile_action(rule)
+
+
+class RuleSet:
+    """
+    Скомпилированный набор правил: индекс feature.kind -> правила.
+    Итерация отдаёт исходные dict-правила (обратная совместимость со списком).
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], skipped: Optional[List[str]] = None):
+        self.rules = list(rules)
+        self.skipped = list(skipped or [])   # файлы, не прошедшие валидацию
+        # метаданные версии заполняет RulesetManager
+        self.version = 0
+        self.digest = ""
+        self.loaded_at: Optional[float] = None
+        self.load_ms: Optional[float] = None
+        self.compiled = [CompiledRule(i, r) for i, r in enumerate(self.rules)]
+        self.by_feature: Dict[str, List[CompiledRule]] = {}
+        # правила без match.feature применимы к любому kind
+        self.wildcard: List[CompiledRule] = []
+        for cr in self.compiled:
+            if cr.feature:
+                self.by_feature.setdefault(cr.feature, []).append(cr)
+            else:
+                self.wildcard.append(cr)
+
+    def for_kind(self, kind: Optional[str]) -> List[CompiledRule]:
+        specific = self.by_feature.get(kind, []) if kind else []
+        if not self.wildcard:
+            return specific
+        return sorted(specific + self.wildcard, key=lambda cr: cr.index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+
+def compile_rules(rules: Any) -> RuleSet:
+    return rules if isinstance(rules, RuleSet) else RuleSet(rules)
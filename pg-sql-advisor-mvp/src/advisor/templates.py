@@ -0,0 +1,250 @@
+# src/advisor/templates.py
+# Шаблоны действий правил (ddl_template / alter / rewrite_sql_hint / title)
+# разбираются один раз при загрузке правил. Скомпилированный шаблон знает
+# свои плейсхолдеры, поэтому на запросе вычисляются только они.
+import re
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+_FORMATTER = Formatter()
+
+def _safe_name(s: str) -> str:
+    # в имени индекса точка/кавычки недопустимы
+    return re.sub(r'[^a-zA-Z0-9_]+', '_', s or 'obj').strip('_') or 'obj'
+
+
+class Template:
+    """Шаблон str.format, разобранный на сегменты (literal, field, conversion, spec)."""
+    __slots__ = ("source", "segments", "fields")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.segments: List[Tuple[str, Optional[str], Optional[str], str]] = []
+        fields: List[str] = []
+        for literal, field, conv, spec in _FORMATTER.parse(source):
+            self.segments.append((literal, field, conv, spec or ""))
+            if field is not None and field not in fields:
+                fields.append(field)
+        self.fields = tuple(fields)
+
+    def render(self, values: Dict[str, Any]) -> str:
+        out: List[str] = []
+        for literal, field, conv, spec in self.segments:
+            out.append(literal)
+            if field is None:
+                continue
+            if field not in values:
+                # не роняем движок, если плейсхолдер необязательный
+                out.append("{" + field + "}")
+                continue
+            v = values[field]
+            if conv == "r":
+                v = repr(v)
+            elif conv == "s":
+                v = str(v)
+            out.append(format(v, spec))
+        return "".join(out)
+
+
+@lru_cache(maxsize=4096)
+def compile_template(source: str) -> Template:
+    return Template(source)
+
+def render_with(source: Any, values: Dict[str, Any]) -> Any:
+    """Дорендерить строку контекстом (explainer); строки без '{' не трогаем."""
+    if not isinstance(source, str) or "{" not in source:
+        return source
+    return compile_template(source).render(values)
+
+
+# ---------- плейсхолдеры ----------
+
+def _norm_cols(val) -> List[str]:
+    """
+    Нормализует список колонок:
+      - "name" -> ["name"]
+      - ["a","b"] -> ["a","b"]
+      - [{"name":"ts","dir":"DESC"}] -> ["ts DESC"]
+    """
+    if val is None:
+        return []
+    if isinstance(val, str):
+        return [val]
+    if isinstance(val, (list, tuple)):
+        out = []
+        for v in val:
+            if isinstance(v, str):
+                out.append(v)
+            elif isinstance(v, dict):
+                nm = v.get("name") or v.get("col") or v.get("column")
+                dr = v.get("dir") or v.get("direction")
+                if nm:
+                    if dr:
+                        dr = "DESC" if str(dr).upper().startswith("DESC") else "ASC"
+                    out.append(f"{nm} {dr}".strip() if dr else nm)
+        return out
+    # всё остальное — строкой
+    return [str(val)]
+
+def _flat_for_idx(cols: List[str]) -> str:
+    """Готовит часть имени индекса: 'a DESC, b' -> 'a_b'"""
+    names = []
+    for c in cols:
+        for part in c.split(","):  # "a, b" — составной ключ одной строкой (FK)
+            if part.strip():
+                names.append(part.split()[0].replace('"', ''))  # убираем DESC/ASC
+    return "_".join(names) if names else "col"
+
+def _feat_get(feat: Any, key: str) -> Any:
+    if isinstance(feat, dict):
+        return feat.get(key)
+    return getattr(feat, key, None)
+
+def _split_table(table: Optional[str]) -> Tuple[str, str]:
+    if not table:
+        return "public", ""
+    tbl = str(table).replace('"', '')
+    if '.' in tbl:
+        schema, name = tbl.split('.', 1)
+        return schema, name
+    return "public", tbl
+
+
+class _Resolver:
+    """
+    Ленивое вычисление плейсхолдеров для одной фичи с учётом action.context.
+    Незаполненные значения (None) в шаблон не попадают.
+    """
+    __slots__ = ("feat", "ctx", "idx", "memo")
+
+    def __init__(self, feat: Any, ctx: Dict[str, Any], idx: Optional[Template]):
+        self.feat = feat
+        self.ctx = ctx
+        self.idx = idx
+        self.memo: Dict[str, Any] = {}
+
+    def get(self, name: str) -> Any:
+        if name in self.memo:
+            return self.memo[name]
+        fn = _RESOLVERS.get(name)
+        v = fn(self) if fn else _feat_get(self.feat, name)
+        self.memo[name] = v
+        return v
+
+    def values(self, names: Iterable[str]) -> Dict[str, Any]:
+        out = {}
+        for n in names:
+            v = self.get(n)
+            if v is not None:
+                out[n] = v
+        return out
+
+    # источники с учётом context.*_from_feature / *_fallback
+    def from_ctx(self, key: str, default_fields: Tuple[str, ...]) -> Any:
+        src = self.ctx.get(f"{key}_from_feature")
+        fields = (src,) if src else default_fields
+        for f in fields:
+            v = _feat_get(self.feat, f)
+            if v not in (None, "", []):
+                return v
+        return self.ctx.get(f"{key}_fallback")
+
+    def table_parts(self) -> Tuple[str, str]:
+        return _split_table(self.from_ctx("table", ("relation", "table")))
+
+    def col_list(self) -> List[str]:
+        if "cols_from_feature" in self.ctx or "cols_fallback" in self.ctx:
+            return _norm_cols(self.from_ctx("cols", ("cols",)))
+        if "col_from_feature" in self.ctx or "col_fallback" in self.ctx:
+            return _norm_cols(self.get("col"))
+        cols = _norm_cols(_feat_get(self.feat, "cols"))
+        return cols or _norm_cols(self.get("col"))
+
+
+def _r_table(r: _Resolver) -> str:
+    schema, name = r.table_parts()
+    return f"{schema}.{name}" if name else ""
+
+def _r_table_safe(r: _Resolver) -> str:
+    schema, name = r.table_parts()
+    return _safe_name(f"{schema}_{name}") if name else "tbl"
+
+def _r_col(r: _Resolver) -> Any:
+    return r.from_ctx("col", ("col", "timeCol", "fkCol", "column"))
+
+def _r_cols(r: _Resolver) -> Optional[str]:
+    cols = r.col_list()
+    return ", ".join(cols) if cols else None
+
+def _r_include_cols(r: _Resolver) -> str:
+    return ", ".join(_norm_cols(r.from_ctx("include_cols", ("includeCols", "include_cols"))))
+
+def _r_order_by_list(r: _Resolver) -> List[str]:
+    return _norm_cols(r.from_ctx("order_by_cols", ("orderByCols",)))
+
+def _r_idx(r: _Resolver) -> Optional[str]:
+    if r.idx is None:
+        return None
+    # в имени индекса таблица — в безопасной форме schema_table
+    vals = r.values(r.idx.fields)
+    if "table" in vals:
+        vals["table"] = r.get("table_safe")
+    return re.sub(r"_+", "_", _safe_name(r.idx.render(vals)))
+
+_RESOLVERS = {
+    "schema": lambda r: r.table_parts()[0],
+    "table_name": lambda r: r.table_parts()[1],
+    "table": _r_table,
+    "table_safe": _r_table_safe,
+    "col": _r_col,
+    "cols": _r_cols,
+    "cols_flat": lambda r: _flat_for_idx(r.col_list()),
+    "include_cols": _r_include_cols,
+    "includeCols": _r_include_cols,
+    "order_by_cols": lambda r: ", ".join(_r_order_by_list(r)) or None,
+    "orderByCols": lambda r: ", ".join(_r_order_by_list(r)) or None,
+    "order_by_cols_flat": lambda r: _flat_for_idx(_r_order_by_list(r)),
+    "idx": _r_idx,
+}
+
+_EMPTY_INCLUDE = re.compile(r"\s*INCLUDE\s*\(\s*\)", re.I)
+
+# ключ в rule.action -> ключ в recommendation.action
+ACTION_OUTPUTS = (("ddl_template", "ddl"), ("alter", "alter"), ("rewrite_sql_hint", "rewrite_sql_hint"))
+
+
+class CompiledAction:
+    """Все шаблоны правила + контекст; render(feat) -> (action, title)."""
+    __slots__ = ("outputs", "title", "ctx", "idx", "fields")
+
+    def __init__(self, rule: Dict[str, Any]):
+        action = rule.get("action") or {}
+        self.ctx: Dict[str, Any] = dict(action.get("context") or {})
+        self.outputs = [(out, compile_template(str(action[src]))) for src, out in ACTION_OUTPUTS if src in action]
+        title = rule.get("title")
+        self.title = compile_template(title) if isinstance(title, str) else None
+        idx_tmpl = self.ctx.get("idx_template")
+        self.idx = compile_template(idx_tmpl) if idx_tmpl else None
+        fields: Set[str] = set()
+        for _, t in self.outputs:
+            fields.update(t.fields)
+        if self.title is not None:
+            fields.update(self.title.fields)
+        self.fields = tuple(sorted(fields))
+
+    def render(self, feat: Any) -> Tuple[Dict[str, str], Optional[str]]:
+        r = _Resolver(feat, self.ctx, self.idx)
+        vals = r.values(self.fields)
+        res = {}
+        for out, t in self.outputs:
+            txt = t.render(vals)
+            if "INCLUDE" in txt:
+                txt = _EMPTY_INCLUDE.sub("", txt)
+            res[out] = txt
+        title = self.title.render(vals) if self.title is not None else None
+        return res, title
+
+
+def compile_action(rule: Dict[str, Any]) -> CompiledAction:
+    return CompiledAction(rule)
@@ -0,0 +1,205 @@
+# src/advisor/workload.py
+# Анализ нагрузки по снимку pg_stat_statements: ранжируем запросы по
+# total_exec_time, прогоняем top N через EXPLAIN + правила и сводим
+# рекомендации в один отчёт с весом = доля общего времени БД.
+import asyncio, csv, io, json, re, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from .index_consolidation import consolidate_indexes, index_candidates
+from src.analyzer.query_fingerprint import fingerprint
+
+# колонки снимка и их синонимы в разных версиях/выгрузках
+_ALIASES = {
+    "total_exec_time": ("total_exec_time", "total_time"),
+    "mean_exec_time": ("mean_exec_time", "mean_time"),
+    "calls": ("calls",),
+    "rows": ("rows",),
+    "queryid": ("queryid", "query_id"),
+    "query": ("query",),
+    # sum(total_exec_time) по всему pg_stat_statements, а не только по выгруженным строкам
+    "db_total_exec_time": ("db_total_exec_time",),
+}
+_EXPLAINABLE = re.compile(r"^\s*(select|with|insert|update|delete|values|table)\b", re.I)
+_PARAM = re.compile(r"\$\d+")
+
+
+def _num(v: Any) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0.0
+
+def normalize_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for key, names in _ALIASES.items():
+        for n in names:
+            if n in row and row[n] not in (None, ""):
+                out[key] = row[n]
+                break
+    out["query"] = str(out.get("query") or "")
+    for k in ("total_exec_time", "mean_exec_time", "calls", "rows", "db_total_exec_time"):
+        out[k] = _num(out.get(k))
+    if out.get("queryid") is not None:
+        out["queryid"] = str(out["queryid"])
+    # в офлайн-выгрузке рядом с запросом может лежать готовый EXPLAIN JSON
+    plan = row.get("plan")
+    if isinstance(plan, str) and plan.strip():
+        try:
+            plan = json.loads(plan)
+        except ValueError as e:
+            # битый план — ошибка этой строки, а не всего анализа
+            out["plan_error"] = f"invalid plan JSON: {e}"
+            plan = None
+    if plan:
+        out["plan"] = plan if isinstance(plan, list) else [plan]
+    return out
+
+def load_snapshot(data: Any = None, csv_text: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Офлайн-снимок: список строк (JSON) или CSV-выгрузка pg_stat_statements."""
+    if csv_text:
+        rows = list(csv.DictReader(io.StringIO(csv_text)))
+    elif isinstance(data, str):
+        try:
+            rows = json.loads(data)
+        except ValueError as e:
+            raise ValueError(f"snapshot: invalid JSON: {e}") from None
+    else:
+        rows = data or []
+    if isinstance(rows, dict):
+        rows = rows.get("rows") or rows.get("statements") or []
+    return [normalize_row(r) for r in rows if isinstance(r, dict)]
+
+def group_by_fingerprint(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Слить строки одного запроса «с точностью до констант»: до PG18 разные
+    длины IN (...) дают разные queryid, а снимки разных БД/ролей — дубли.
+    Текст и план берём у самой тяжёлой строки группы.
+    """
+    groups: Dict[int, Dict[str, Any]] = {}
+    for r in sorted(rows, key=lambda r: r["total_exec_time"], reverse=True):
+        fid, _ = fingerprint(r["query"])
+        g = groups.get(fid)
+        if g is None:
+            groups[fid] = dict(r, fingerprint=str(fid), queryids=[r.get("queryid")])
+            continue
+        for k in ("calls", "total_exec_time", "rows"):
+            g[k] += r[k]
+        g["queryids"].append(r.get("queryid"))
+    for g in groups.values():
+        if g["calls"]:
+            g["mean_exec_time"] = g["total_exec_time"] / g["calls"]
+    return list(groups.values())
+
+def rank(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(rows, key=lambda r: r["total_exec_time"], reverse=True)
+
+
+def _rec_key(rec: Dict[str, Any]) -> tuple:
+    act = rec.get("action") or {}
+    return (rec.get("rule_id"), tuple(sorted((k, str(v)) for k, v in act.items())))
+
+def consolidate(items: List[Dict[str, Any]], total_time: float) -> List[Dict[str, Any]]:
+    """Одинаковые рекомендации разных запросов сливаются; вес — сумма долей времени."""
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    for it in items:
+        if not it.get("ok"):
+            continue
+        seen = set()
+        for rec in it.get("recommendations") or []:
+            key = _rec_key(rec)
+            if key in seen:   # одна и та же рекомендация внутри запроса учитывается один раз
+                continue
+            seen.add(key)
+            m = merged.get(key)
+            if m is None:
+                m = merged[key] = {
+                    "rule_id": rec.get("rule_id"),
+                    "type": rec.get("type"),
+                    "title": rec.get("title"),
+                    "action": rec.get("action"),
+                    "expected_gain": rec.get("expected_gain"),
+                    "total_exec_time_ms": 0.0,
+                    "weight": 0.0,
+                    "queries": [],
+                }
+            m["total_exec_time_ms"] += it["total_exec_time"]
+            m["queries"].append(it.get("queryid"))
+    out = list(merged.values())
+    for m in out:
+        m["total_exec_time_ms"] = round(m["total_exec_time_ms"], 2)
+        m["weight"] = round(m["total_exec_time_ms"] / total_time, 4) if total_time else 0.0
+    out.sort(key=lambda m: (-m["weight"], m["rule_id"] or ""))
+    return out
+
+
+ExplainFn = Callable[[str, bool], Awaitable[Dict[str, Any]]]
+AdviseFn = Callable[[str, Dict[str, Any], Optional[Dict[str, Any]]], Dict[str, Any]]
+CatalogFn = Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+async def analyze_workload(rows: List[Dict[str, Any]],
+                           explain: ExplainFn,
+                           advise: AdviseFn,
+                           *,
+                           top_n: int = 20,
+                           concurrency: int = 5,
+                           source: str = "snapshot",
+                           catalog: Optional[CatalogFn] = None) -> Dict[str, Any]:
+    """
+    explain(sql, generic_plan) -> результат EXPLAIN JSON (не вызывается, если
+    в строке снимка уже есть plan); catalog(explain_result) -> снимок каталога
+    по таблицам плана или None; advise(sql, explain_result, catalog) -> {risk, recommendations, ...}.
+    """
+    t0 = time.perf_counter()
+    ranked = rank(group_by_fingerprint(rows))
+    # доля считается от всего времени БД: live-снимок ограничен LIMIT
+    total_time = max(sum(r["total_exec_time"] for r in ranked),
+                     max((r.get("db_total_exec_time") or 0.0 for r in rows), default=0.0))
+    top = [r for r in ranked if _EXPLAINABLE.match(r["query"])][:max(0, top_n)]
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(row: Dict[str, Any]) -> Dict[str, Any]:
+        share = round(row["total_exec_time"] / total_time, 4) if total_time else 0.0
+        item = {
+            "queryid": row.get("queryid"),
+            "fingerprint": row.get("fingerprint"),
+            "queryids": row.get("queryids"),
+            "query": row["query"],
+            "calls": row["calls"],
+            "total_exec_time": row["total_exec_time"],
+            "mean_exec_time": row["mean_exec_time"],
+            "share": share,
+        }
+        try:
+            if row.get("plan_error"):
+                raise ValueError(row["plan_error"])
+            if row.get("plan"):
+                exp = {"plan": row["plan"]}
+            else:
+                async with sem:
+                    exp = await explain(row["query"], bool(_PARAM.search(row["query"])))
+            # правила и рендеринг — CPU: в поток, чтобы top N не блокировал event loop
+            facts = await catalog(exp) if catalog is not None else None
+            res = await asyncio.to_thread(advise, row["query"], exp, facts)
+            item.update({"ok": True, "risk": res.get("risk"), "recommendations": res.get("recommendations") or []})
+        except Exception as e:
+            item.update({"ok": False, "error": str(getattr(e, "detail", None) or e)})
+        return item
+
+    analyzed = await asyncio.gather(*(_one(r) for r in top))
+    covered = sum(it["total_exec_time"] for it in analyzed)
+    return {
+        "snapshot": {
+            "source": source,
+            "statements": len(rows),
+            "fingerprints": len(ranked),
+            "total_exec_time_ms": round(total_time, 2),
+        },
+        "coverage": round(covered / total_time, 4) if total_time else 0.0,
+        "recommendations": consolidate(analyzed, total_time),
+        # минимальный набор индексов, покрывающий все запросы из top N
+        "index_plan": consolidate_indexes(index_candidates(analyzed, query_key="queryid")),
+        "queries": [{k: v for k, v in it.items() if k != "recommendations"}
+                    | {"rule_ids": sorted({r.get("rule_id") for r in it.get("recommendations") or []})}
+                    for it in analyzed],
+        "failed": sum(1 for it in analyzed if not it["ok"]),
+        "timings": {"total_ms": round((time.perf_counter() - t0) * 1000, 2)},
+    }
@@ -1,6 +1,7 @@
-import re
-from typing import Any, Dict, List
+import math, re
+from typing import Any, Callable, Dict, Iterable, List, Optional
 from datetime import datetime, timedelta
+from src.analyzer.selectivity import actual_selectivity, estimate_selectivity, filter_columns, parse_filter
 def _emit(node_id: int, kind: str, **kw) -> Dict[str, Any]:
     d = {"nodeId": node_id, "kind": kind}
     d.update({k: v for k, v in kw.items() if v is not None})
@@ -37,27 +38,270 @@ def _detect_time_cast_features(filter_text: str, relation: str, node_id: int) ->
                            fromDate=fromDate, toDate=toDate, toDate_next=toDate_next))
     return feats
 
-def _walk(node: Dict[str, Any], acc: List[Dict[str, Any]]):
-    ntype = node.get("Node Type")
-    if ntype == "Seq Scan":
+# ---------- реестр детекторов ----------
+# Детектор объявляет интересующие его Node Type и вызывается только для них:
+#   fn(node, node_id, ctx) -> Iterable[feature] | None
+Detector = Callable[[Dict[str, Any], int, Dict[str, Any]], Optional[Iterable[Dict[str, Any]]]]
+
+_DETECTORS: Dict[str, List[Detector]] = {}
+_ANY_NODE: List[Detector] = []   # детекторы без фильтра по типу узла
+
+def detector(*node_types: str):
+    def deco(fn: Detector) -> Detector:
+        if not node_types:
+            _ANY_NODE.append(fn)
+        for nt in node_types:
+            _DETECTORS.setdefault(nt, []).append(fn)
+        return fn
+    return deco
+
+def _detectors_for(ntype: Optional[str]) -> List[Detector]:
+    specific = _DETECTORS.get(ntype, ()) if ntype else ()
+    return [*specific, *_ANY_NODE] if _ANY_NODE else list(specific)
+
+_MEM_UNITS = {"kb": 1 / 1024, "mb": 1.0, "gb": 1024.0, "tb": 1024.0 * 1024}
+
+def _parse_mem_mb(val: Any) -> Optional[float]:
+    if val is None:
+        return None
+    m = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]b)?\s*$", str(val), re.I)
+    if not m:
+        return None
+    # без единиц work_mem задаётся в килобайтах
+    return float(m.group(1)) * _MEM_UNITS[(m.group(2) or "kb").lower()]
+
+def _est_mem_mb(node: Dict[str, Any]) -> Optional[float]:
+    rows, width = node.get("Plan Rows"), node.get("Plan Width")
+    if rows is None or width is None:
+        return None
+    # ширина строки + накладные расходы на tuple header/указатель
+    return round(rows * (width + 32) / (1024 * 1024), 2)
+
+# ---------- детекторы ----------
+
+@detector("Seq Scan")
+def _seq_scan(node, node_id, ctx):
+    rel = node.get("Relation Name")
+    plan_rows = node.get("Plan Rows") or 0
+    has_filter = "Filter" in node
+    out: List[Dict[str, Any]] = []
+
+    # seq_scan_big_table — только если есть фильтр ИЛИ таблица заметно велика
+    if has_filter or plan_rows >= 100_000:
+        sel, source, cols = (None, None, None) if has_filter else (1.0, None, None)
+        facts = (ctx.get("catalog") or {}).get(rel)
+        # фильтр разбираем, только если есть чем его оценить: pg_stats или ANALYZE
+        if has_filter and (facts or actual_selectivity(node) is not None):
+            preds = parse_filter(node["Filter"])
+            sel, source = estimate_selectivity(node, facts, preds)
+            cols = filter_columns(preds) or None
+        out.append(_emit(node_id, "seq_scan_big_table",
+                         relation=rel, estRows=plan_rows,
+                         selectivity=sel, selectivitySource=source, filterCols=cols))
+
+    # разбор фильтра
+    out.extend(_detect_time_cast_features(node.get("Filter", ""), rel, node_id))
+    return out
+
+_LIKE_LEADING = re.compile(r"\(?\"?(\w+)\"?\)?(?:::[\w ]+)?\s+~~\*?\s+'%", re.I)
+
+@detector("Seq Scan", "Bitmap Heap Scan", "Index Scan")
+def _like_leading_wildcard(node, node_id, ctx):
+    flt = node.get("Filter")
+    if not flt:
+        return None
+    rel = node.get("Relation Name")
+    return [_emit(node_id, "like_leading_wildcard", relation=rel, col=m.group(1), cols=[m.group(1)])
+            for m in _LIKE_LEADING.finditer(flt)]
+
+_JOIN_COL = re.compile(r"\"?(\w+)\"?\.\"?(\w+)\"?")
+
+@detector("Nested Loop")
+def _nested_loop_inner(node, node_id, ctx):
+    kids = node.get("Plans") or []
+    if len(kids) < 2:
+        return None
+    inner = kids[1]
+    if inner.get("Node Type") != "Seq Scan":
+        return None
+    rel = inner.get("Relation Name")
+    alias = inner.get("Alias") or rel
+    cond = node.get("Join Filter") or inner.get("Filter") or ""
+    cols = sorted({c for a, c in _JOIN_COL.findall(cond) if a == alias})
+    return [_emit(node_id, "nested_loop_no_inner_index",
+                  relation=rel, innerRelation=rel, innerJoinCols=cols or None,
+                  estRows=inner.get("Plan Rows"))]
+
+@detector("Sort")
+def _sort_spill(node, node_id, ctx):
+    work_mem = ctx["workMemMB"]
+    if node.get("Sort Space Type") == "Disk":
+        mem = round((node.get("Sort Space Used") or 0) / 1024, 2)
+    else:
+        mem = _est_mem_mb(node)
+    if mem is None or mem <= work_mem:
+        return None
+    keys = node.get("Sort Key") or []
+    return [_emit(node_id, "sort_spill_risk", memEstMB=mem, workMemMB=work_mem,
+                  sortKey=keys or None, actual=node.get("Sort Space Type") == "Disk")]
+
+@detector("Aggregate")
+def _hashagg_spill(node, node_id, ctx):
+    if node.get("Strategy") != "Hashed":
+        return None
+    work_mem = ctx["workMemMB"]
+    if (node.get("HashAgg Batches") or 0) > 1 or node.get("Disk Usage"):
+        mem = round((node.get("Disk Usage") or 0) / 1024 + (node.get("Peak Memory Usage") or 0) / 1024, 2)
+    else:
+        mem = _est_mem_mb(node)
+    if mem is None or mem <= work_mem:
+        return None
+    return [_emit(node_id, "hashagg_spill_risk", memEstMB=mem, workMemMB=work_mem,
+                  groupKey=node.get("Group Key"))]
+
+# ---------- факты каталога (src.db.catalog) ----------
+# пороги близки к тому, что сам PostgreSQL считает поводом для autovacuum/analyze
+OUTDATED_MOD_RATIO = 0.2      # изменено строк с последнего ANALYZE / живых строк
+DEAD_TUP_RATIO = 0.2
+DEAD_TUP_MIN = 10_000
+BLOAT_RATIO = 2.0             # фактических страниц / ожидаемых по reltuples и ширине строки
+BLOAT_MIN_PAGES = 1_000       # ~8 МБ: маленькие таблицы не трогаем
+MISESTIMATE_RATIO = 10.0
+_PAGE_USABLE = 8168           # 8 КБ минус заголовок страницы
+_TUPLE_OVERHEAD = 28          # заголовок кортежа + указатель
+
+_EQ_COL = re.compile(r"\(\s*(?:\"?\w+\"?\.)?\"?(\w+)\"?(?:::[\w ]+)?\s*=\s*")
+
+def condition_columns(text: Optional[str]) -> List[str]:
+    """Колонки слева от '=' в Filter/Index Cond, в порядке появления, без повторов."""
+    if not text:
+        return []
+    return list(dict.fromkeys(_EQ_COL.findall(text)))
+
+def _node_conditions(node: Dict[str, Any]) -> str:
+    return " AND ".join(node[k] for k in ("Index Cond", "Recheck Cond", "Filter") if node.get(k))
+
+@detector("Seq Scan", "Index Scan", "Bitmap Heap Scan", "Index Only Scan")
+def _multicol_stats(node, node_id, ctx):
+    # несколько равенств по одной таблице без расширенной статистики: планировщик
+    # перемножает селективности как независимые и ошибается в оценке строк
+    catalog = ctx.get("catalog")
+    if not catalog:
+        return None
+    rel = node.get("Relation Name")
+    facts = catalog.get(rel)
+    if not facts:
+        return None
+    cols = [c for c in condition_columns(_node_conditions(node)) if c in facts["columns"]]
+    if len(cols) < 2 or any(set(cols) <= set(ext) for ext in facts["ext_stats"]):
+        return None
+    est, actual = node.get("Plan Rows"), node.get("Actual Rows")
+    if actual is not None:
+        ratio = max(actual, 1) / max(est or 0, 1)
+        if max(ratio, 1 / ratio) < MISESTIMATE_RATIO:
+            return None
+    elif (est or 0) > 1 or (facts.get("reltuples") or 0) < 10_000:
+        # без ANALYZE: подозрительна только оценка «~1 строка» на большой таблице
+        return None
+    return [_emit(node_id, "missing_multicol_stats", relation=_qualified(rel, facts), cols=cols,
+                  estRows=est, actualRows=actual)]
+
+def _qualified(rel: str, facts: Dict[str, Any]) -> str:
+    return f"{facts['schema']}.{rel}" if facts.get("schema") else rel
+
+def _table_features(rel: str, node_id: int, t: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    relation = _qualified(rel, t)
+    live, dead = t.get("n_live_tup") or 0, t.get("n_dead_tup") or 0
+    reltuples = max(t.get("reltuples") or 0, 0)   # -1 — таблица ещё ни разу не анализировалась
+    mod = t.get("n_mod_since_analyze") or 0
+    last = max(filter(None, (t.get("last_analyze"), t.get("last_autoanalyze"))), default=None)
+    if (live or mod) and (last is None or mod > OUTDATED_MOD_RATIO * max(live, reltuples, 1)):
+        out.append(_emit(node_id, "outdated_stats", relation=relation, modSinceAnalyze=mod,
+                         liveTup=live, lastAnalyze=last))
+
+    if dead >= DEAD_TUP_MIN and dead / (live + dead) >= DEAD_TUP_RATIO:
+        out.append(_emit(node_id, "dead_tuples_high", relation=relation, deadTup=dead,
+                         deadRatio=round(dead / (live + dead), 3)))
+
+    pages = t.get("relpages") or 0
+    width = sum((c.get("avg_width") or 0) for c in t["columns"].values())
+    if pages >= BLOAT_MIN_PAGES and width and reltuples:
+        expected = max(1, math.ceil(reltuples * (width + _TUPLE_OVERHEAD) / _PAGE_USABLE))
+        if pages / expected >= BLOAT_RATIO:
+            out.append(_emit(node_id, "table_bloat_high", relation=relation, relPages=pages,
+                             expectedPages=expected, bloatRatio=round(pages / expected, 2)))
+
+    for fk in t["fks"]:
+        cols = fk["cols"]
+        covered = any(not ix["partial"] and sorted(ix["cols"][:len(cols)]) == sorted(cols) for ix in t["indexes"])
+        if cols and not covered:
+            out.append(_emit(node_id, "fk_missing_index", relation=relation, fkCol=", ".join(cols),
+                             fkCols=cols, refTable=fk["refTable"], constraint=fk["name"]))
+    return out
+
+def plan_stats_used(plan_root: Dict[str, Any], catalog: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """statsUsed для AdviseInput: pg_stats колонок из условий сканирований плана."""
+    if not catalog:
+        return []
+    seen: Dict[tuple, Dict[str, Any]] = {}
+    stack = [plan_root.get("Plan", plan_root)]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.get("Plans") or [])
         rel = node.get("Relation Name")
-        plan_rows = node.get("Plan Rows") or 0
-        has_filter = "Filter" in node
+        facts = catalog.get(rel) if rel else None
+        if not facts:
+            continue
+        for col in condition_columns(_node_conditions(node)):
+            st = facts["columns"].get(col)
+            if st is not None and (rel, col) not in seen:
+                seen[(rel, col)] = {"table": _qualified(rel, facts), "columns": [col], "n_distinct": st.get("n_distinct")}
+    return list(seen.values())
 
-        # seq_scan_big_table — только если есть фильтр ИЛИ таблица заметно велика
-        if has_filter or plan_rows >= 100_000:
-            acc.append(_emit(id(node) % 10_000_000, "seq_scan_big_table",
-                             relation=rel, estRows=plan_rows,
-                             selectivity=None if has_filter else 1.0))
+# ---------- обход ----------
 
-        # разбор фильтра
-        acc.extend(_detect_time_cast_features(node.get("Filter", ""), rel, id(node) % 10_000_000))
+def _walk(root: Dict[str, Any], acc: List[Dict[str, Any]], ctx: Dict[str, Any]) -> int:
+    """
+    Один итеративный pre-order проход: nodeId — порядковый номер узла,
+    стабилен между запусками и не зависит от глубины плана.
+    """
+    stack = [root]
+    node_id = 0
+    rels = ctx.get("relations")   # relation -> nodeId первого сканирования (только с каталогом)
+    while stack:
+        node = stack.pop()
+        if rels is not None:
+            rn = node.get("Relation Name")
+            if rn and rn not in rels:
+                rels[rn] = node_id
+        for fn in _detectors_for(node.get("Node Type")):
+            found = fn(node, node_id, ctx)
+            if found:
+                acc.extend(found)
+        node_id += 1
+        kids = node.get("Plans")
+        if kids:
+            stack.extend(reversed(kids))
+    return node_id
 
-    for ch in node.get("Plans", []) or []:
-        _walk(ch, acc)
+DEFAULT_WORK_MEM_MB = 4.0
 
-def plan_to_features(plan_root: Dict[str, Any], sql: str) -> List[Dict[str, Any]]:
+def plan_to_features(plan_root: Dict[str, Any], sql: str,
+                     catalog: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """catalog — снимок src.db.catalog {relname: факты}; без него только фичи из плана."""
     feats: List[Dict[str, Any]] = []
     root = plan_root.get("Plan", plan_root)
-    _walk(root, feats)
-    return feats
\ No newline at end of file
+    # EXPLAIN (SETTINGS) показывает только изменённые параметры
+    settings = plan_root.get("Settings") or {}
+    ctx = {
+        "sql": sql,
+        "workMemMB": _parse_mem_mb(settings.get("work_mem")) or DEFAULT_WORK_MEM_MB,
+        "catalog": catalog,
+        "relations": {} if catalog else None,
+    }
+    _walk(root, feats, ctx)
+    for rel, node_id in (ctx["relations"] or {}).items():
+        if catalog.get(rel):
+            feats.extend(_table_features(rel, node_id, catalog[rel]))
+    return feats
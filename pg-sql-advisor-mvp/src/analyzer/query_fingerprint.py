@@ -0,0 +1,84 @@
+# src/analyzer/query_fingerprint.py
+# Отпечаток запроса «с точностью до констант», по духу как
+# pg_stat_statements.queryid: литералы и $n -> ?, списки IN (...) и
+# ARRAY[...] схлопываются до одного элемента, ключевые слова и
+# неквотированные идентификаторы — в нижний регистр, комментарии и
+# пробелы выбрасываются.
+# Токенизатор — один проход re.finditer по master-регулярке без
+# возвратов, поэтому время линейно и на многомегабайтных запросах.
+import hashlib, re
+from typing import List, Tuple
+
+_TOKEN = re.compile(r"""
+      (?P<ws>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>[EeBbXxNnUu]?'[^']*(?:''[^']*)*')
+    | (?P<dollar>\$\$.*?\$\$|\$(?P<tag>[A-Za-z_][A-Za-z_0-9]*)\$.*?\$(?P=tag)\$)
+    | (?P<param>\$\d+)
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<qident>"[^"]*(?:""[^"]*)*")
+    | (?P<ident>[A-Za-z_\x80-\U0010ffff][\w$\x80-\U0010ffff]*)
+    | (?P<op>::|<=|>=|<>|!=|\|\||->>|->|[^\s\w])
+""", re.X | re.S)
+
+_LITERALS = frozenset({"string", "dollar", "param", "number"})
+_NO_SPACE_BEFORE = frozenset({",", ")", "]", ".", "::", ";"})
+_NO_SPACE_AFTER = frozenset({"(", "[", ".", "::"})
+
+
+def tokenize(sql: str) -> List[str]:
+    """Нормализованные токены: литералы -> '?', регистр и пробелы унифицированы."""
+    out: List[str] = []
+    append = out.append
+    for m in _TOKEN.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        if kind in _LITERALS:
+            append("?")
+        elif kind == "ident":
+            append(m.group().lower())
+        else:
+            append(m.group())
+    return _collapse_lists(out)
+
+def _collapse_lists(tokens: List[str]) -> List[str]:
+    """IN (?, ?, ?) -> IN (?), ARRAY[?, ?] -> ARRAY[?]: длина списка на отпечаток не влияет."""
+    out: List[str] = []
+    i, n = 0, len(tokens)
+    while i < n:
+        t = tokens[i]
+        out.append(t)
+        i += 1
+        if t in ("(", "[") and i < n and tokens[i] == "?" and out[-2:-1] and out[-2] in ("in", "array"):
+            close = ")" if t == "(" else "]"
+            j = i
+            # ? , ? , ... ?  и закрывающая скобка
+            while j + 2 < n and tokens[j + 1] == "," and tokens[j + 2] == "?":
+                j += 2
+            if j + 1 < n and tokens[j + 1] == close:
+                out.extend(("?", close))
+                i = j + 2
+    return out
+
+def normalize_query(sql: str) -> str:
+    tokens = tokenize(sql)
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    parts: List[str] = []
+    prev = None
+    for t in tokens:
+        if parts and t not in _NO_SPACE_BEFORE and prev not in _NO_SPACE_AFTER:
+            parts.append(" ")
+        parts.append(t)
+        prev = t
+    return "".join(parts)
+
+def query_id(normalized: str) -> int:
+    """Стабильный signed 64-bit id (как bigint queryid) от нормализованного текста."""
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def fingerprint(sql: str) -> Tuple[int, str]:
+    norm = normalize_query(sql)
+    return query_id(norm), norm
@@ -0,0 +1,290 @@
+# src/analyzer/selectivity.py
+# Оценка селективности Filter по pg_stats (снимок src.db.catalog) — по
+# мотивам selfuncs.c PostgreSQL:
+#   * col = const      — частота из MCV, иначе остаток, делённый поровну
+#                        между не-MCV значениями (n_distinct);
+#   * col <, <=, >, >= — MCV, удовлетворяющие условию, + доля гистограммы
+#                        ниже/выше константы (бинпоиск по границам корзин и
+#                        линейная интерполяция внутри корзины);
+#   * col = ANY(...)   — сумма по элементам (IN-список);
+#   * IS [NOT] NULL    — null_frac.
+# Форма «const op col» разворачивается в «col op' const».
+# Конъюнкты AND перемножаются как независимые. Непонятые конъюнкты не
+# учитываются: оценка получается сверху, т.е. осторожной для правил вида
+# «selectivity < X». Если в плане есть ANALYZE, берём фактическую долю
+# Actual Rows / (Actual Rows + Rows Removed by Filter).
+import re
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# константы планировщика (src/include/utils/selfuncs.h)
+DEFAULT_EQ_SEL = 0.005
+DEFAULT_INEQ_SEL = 1 / 3
+
+_PRED = re.compile(r"""^\(?(?:"?\w+"?\.)?"?(?P<col>\w+)"?\)?(?:::[\w ]+)?\s*
+                       (?P<op>=|<>|!=|<=|>=|<|>)\s*(?P<rhs>.+)$""", re.X | re.S)
+_PRED_CONST_FIRST = re.compile(r"""^(?P<lhs>.+?)\s*(?P<op>=|<>|!=|<=|>=|<|>)\s*
+                                   \(?(?:"?\w+"?\.)?"?(?P<col>\w+)"?\)?(?:::[\w ]+)?$""", re.X | re.S)
+_NULL_TEST = re.compile(r"""^\(?(?:"?\w+"?\.)?"?(?P<col>\w+)"?\)?(?:::[\w ]+)?\s+IS\s+(?P<neg>NOT\s+)?NULL$""", re.I)
+_STRING = re.compile(r"^'((?:[^']|'')*)'(?:::[\w ]+(?:\[\])?)?$")
+_NUMBER = re.compile(r"^\(?(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\)?(?:::[\w ]+)?$")
+_ANY = re.compile(r"^ANY\s*\((.+)\)$", re.I | re.S)
+_FLIP = {"<": ">", ">": "<", "<=": ">=", ">=": "<="}
+
+
+# ---------- разбор Filter ----------
+
+def _strip_parens(s: str) -> str:
+    s = s.strip()
+    while s.startswith("(") and s.endswith(")") and _closing(s, 0) == len(s) - 1:
+        s = s[1:-1].strip()
+    return s
+
+def _closing(s: str, start: int) -> int:
+    depth, quoted = 0, False
+    for i in range(start, len(s)):
+        ch = s[i]
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted:
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth -= 1
+                if depth == 0:
+                    return i
+    return -1
+
+def _split_top(s: str, word: str) -> List[str]:
+    """Разбить по AND/OR верхнего уровня (вне скобок и строк)."""
+    parts, depth, quoted, start = [], 0, False, 0
+    token = f" {word} "
+    i, n = 0, len(s)
+    while i < n:
+        ch = s[i]
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted:
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth -= 1
+            elif depth == 0 and s.startswith(token, i):
+                parts.append(s[start:i])
+                i += len(token)
+                start = i
+                continue
+        i += 1
+    parts.append(s[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+def _literal(text: str) -> Optional[str]:
+    text = text.strip()
+    m = _STRING.match(text)
+    if m:
+        return m.group(1).replace("''", "'")
+    m = _NUMBER.match(text)
+    return m.group(1) if m else None
+
+def _array_items(text: str) -> Optional[List[str]]:
+    """'{a,"b c",3}'::text[] -> ['a', 'b c', '3']"""
+    lit = _literal(text)
+    if lit is None or not (lit.startswith("{") and lit.endswith("}")):
+        return None
+    items, cur, quoted, i, body = [], [], False, 0, lit[1:-1]
+    while i < len(body):
+        ch = body[i]
+        if ch == '"':
+            quoted = not quoted
+        elif ch == "\\" and i + 1 < len(body):
+            i += 1
+            cur.append(body[i])
+        elif ch == "," and not quoted:
+            items.append("".join(cur))
+            cur = []
+        else:
+            cur.append(ch)
+        i += 1
+    items.append("".join(cur))
+    return items
+
+def _split_pred(conj: str) -> Optional[Tuple[str, str, str]]:
+    """Конъюнкт-сравнение -> (col, op, rhs); константа слева переносится направо."""
+    m = _PRED.match(conj)
+    if m:
+        rhs = _strip_parens(m.group("rhs"))
+        if _ANY.match(rhs) or _literal(rhs) is not None:
+            return m.group("col"), m.group("op"), rhs
+    m = _PRED_CONST_FIRST.match(conj)
+    if m and _literal(m.group("lhs")) is not None:
+        op = m.group("op")
+        return m.group("col"), _FLIP.get(op, op), m.group("lhs").strip()
+    return None
+
+def parse_filter(text: Optional[str]) -> List[Tuple[str, str, Any]]:
+    """
+    Filter -> [(col, op, value)] для понятых конъюнктов; op: '=', '<>', '<',
+    '<=', '>', '>=', 'any' (value — список), 'null', 'notnull'.
+    """
+    if not text:
+        return []
+    out: List[Tuple[str, str, Any]] = []
+    for conj in _split_top(_strip_parens(text), "AND"):
+        conj = _strip_parens(conj)
+        if _split_top(conj, "OR")[1:]:
+            continue
+        m = _NULL_TEST.match(conj)
+        if m:
+            out.append((m.group("col"), "notnull" if m.group("neg") else "null", None))
+            continue
+        pred = _split_pred(conj)
+        if pred is None:
+            continue
+        col, op, rhs = pred
+        op = "<>" if op == "!=" else op
+        any_m = _ANY.match(rhs)
+        if any_m:
+            items = _array_items(_strip_parens(any_m.group(1)))
+            if items is not None and op == "=":
+                out.append((col, "any", items))
+            continue
+        value = _literal(rhs)
+        if value is not None:
+            out.append((col, op, value))
+    return out
+
+
+# ---------- сравнение значений pg_stats (текст) с константой ----------
+
+def _coerce(v: Any) -> Any:
+    """Число или момент времени -> float, иначе строка как есть."""
+    if v is None:
+        return None
+    s = str(v)
+    if s[:1].isdigit() or s[:1] in "-+.":   # 'nan'/'Infinity' остаются строками
+        try:
+            return float(s)
+        except ValueError:
+            pass
+    if s[:1].isdigit() and "-" in s[:5]:
+        try:
+            dt = datetime.fromisoformat(s)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return dt.timestamp()
+        except ValueError:
+            pass
+    return s
+
+def _prepared(st: Dict[str, Any]) -> Dict[str, Any]:
+    """MCV-словарь и типизированные границы гистограммы — один раз на колонку снимка."""
+    prep = st.get("_prepared")
+    if prep is None:
+        mcv = [_coerce(v) for v in st.get("mcv") or []]
+        mcf = [float(f) for f in st.get("mcf") or []][:len(mcv)]
+        hist = [_coerce(v) for v in st.get("histogram") or []]
+        if len({type(x) for x in hist}) > 1:
+            hist = []
+        prep = st["_prepared"] = {
+            "mcv": dict(zip(mcv, mcf)),
+            "mcf_sum": sum(mcf),
+            "hist": hist,
+        }
+    return prep
+
+def _ndistinct(st: Dict[str, Any], reltuples: float) -> float:
+    nd = st.get("n_distinct") or 0
+    return -nd * reltuples if nd < 0 else nd
+
+def _eq_sel(st: Dict[str, Any], value: Any, reltuples: float) -> float:
+    prep = _prepared(st)
+    v = _coerce(value)
+    if v in prep["mcv"]:
+        return prep["mcv"][v]
+    rest = max(0.0, 1.0 - prep["mcf_sum"] - (st.get("null_frac") or 0.0))
+    others = _ndistinct(st, reltuples) - len(prep["mcv"])
+    if others >= 1:
+        return rest / others
+    return min(rest, DEFAULT_EQ_SEL) if rest else 0.0
+
+def _hist_fraction_below(hist: List[Any], v: Any, inclusive: bool) -> Optional[float]:
+    """Доля значений гистограммы < v (<= v): бинпоиск корзины + интерполяция внутри неё."""
+    n = len(hist)
+    if n < 2 or type(v) is not type(hist[0]):
+        return None
+    i = (bisect_right if inclusive else bisect_left)(hist, v)
+    if i == 0:
+        return 0.0
+    if i >= n:
+        return 1.0
+    lo, hi = hist[i - 1], hist[i]
+    frac = (v - lo) / (hi - lo) if isinstance(v, float) and hi != lo else 0.5
+    return (i - 1 + frac) / (n - 1)
+
+def _range_sel(st: Dict[str, Any], op: str, value: Any) -> float:
+    prep = _prepared(st)
+    v = _coerce(value)
+    below = op in ("<", "<=")
+    inclusive = op in ("<=", ">")   # доля «ниже» для > считается как <=
+    mcv_part = 0.0
+    for mv, f in prep["mcv"].items():
+        if type(mv) is not type(v):
+            continue
+        if (op == "<" and mv < v) or (op == "<=" and mv <= v) or (op == ">" and mv > v) or (op == ">=" and mv >= v):
+            mcv_part += f
+    rest = max(0.0, 1.0 - prep["mcf_sum"] - (st.get("null_frac") or 0.0))
+    frac = _hist_fraction_below(prep["hist"], v, inclusive)
+    if frac is None:
+        return mcv_part + rest * DEFAULT_INEQ_SEL
+    return mcv_part + rest * (frac if below else 1.0 - frac)
+
+def clause_selectivity(st: Dict[str, Any], op: str, value: Any, reltuples: float) -> float:
+    if op == "=":
+        return _eq_sel(st, value, reltuples)
+    if op == "<>":
+        return max(0.0, 1.0 - _eq_sel(st, value, reltuples) - (st.get("null_frac") or 0.0))
+    if op == "any":
+        return min(1.0, sum(_eq_sel(st, v, reltuples) for v in dict.fromkeys(value)))
+    if op == "null":
+        return st.get("null_frac") or 0.0
+    if op == "notnull":
+        return 1.0 - (st.get("null_frac") or 0.0)
+    return _range_sel(st, op, value)
+
+
+# ---------- оценка для узла плана ----------
+
+def actual_selectivity(node: Dict[str, Any]) -> Optional[float]:
+    """EXPLAIN ANALYZE: фактическая доля строк, прошедших Filter."""
+    actual, removed = node.get("Actual Rows"), node.get("Rows Removed by Filter")
+    if actual is None or removed is None or actual + removed <= 0:
+        return None
+    return actual / (actual + removed)
+
+def filter_columns(preds: List[Tuple[str, str, Any]]) -> List[str]:
+    """Колонки для индекса: сначала равенства, потом диапазоны (как в составном ключе)."""
+    eq = [c for c, op, _ in preds if op in ("=", "any")]
+    rng = [c for c, op, _ in preds if op in ("<", "<=", ">", ">=")]
+    return list(dict.fromkeys(eq + rng))
+
+def estimate_selectivity(node: Dict[str, Any], facts: Optional[Dict[str, Any]],
+                         preds: Optional[List[Tuple[str, str, Any]]] = None) -> Tuple[Optional[float], Optional[str]]:
+    """(selectivity, source): source — 'analyze' | 'stats' | None."""
+    sel = actual_selectivity(node)
+    if sel is not None:
+        return round(sel, 6), "analyze"
+    if not facts:
+        return None, None
+    if preds is None:
+        preds = parse_filter(node.get("Filter"))
+    reltuples = max(facts.get("reltuples") or 0, 0)
+    columns = facts.get("columns") or {}
+    sel, known = 1.0, False
+    for col, op, value in preds:
+        st = columns.get(col)
+        if st is None:
+            continue
+        sel *= clause_selectivity(st, op, value, reltuples)
+        known = True
+    return (round(min(max(sel, 0.0), 1.0), 6), "stats") if known else (None, None)
@@ -4,18 +4,39 @@ from src.models import AdviseInput, AdviseResponse
 from src.advisor.rule_engine import apply_rules
 from src.advisor.risk_score import aggregate_score
 from src.advisor.explainer import render_report
-from src.advisor.rules_loader import load_rules
-from fastapi import HTTPException
+from src.lifecycle import lifespan, rules_manager
+from fastapi import HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Any, List, Optional, Dict
+from pydantic import Field
+from typing import Any, List, Literal, Optional, Dict
+import asyncio
+import json
 import logging
-from src.db.pg import run_sql_sync, explain_sql_sync
+import os
+import time
+from contextlib import AsyncExitStack
 from src.db.pg import test_conn_with_params
-from src.analyzer.extract import plan_to_features
+from src.db.pg_async import run_sql_async, explain_sql_async, stream_sql_async, ASYNC_POOL_MAX_SIZE
+from src.db.pg_async import fetch_pg_stat_statements_async, explain_with_settings_async
+from src.advisor.workload import analyze_workload, load_snapshot
+from src.advisor.index_consolidation import consolidate_indexes, index_candidates
+from src.advisor.measure import measure_gains
+from src.advisor.result_cache import make_key as advise_cache_key, result_cache
+from src.db.plan_cache import plan_cache, plan_relations
+from src.db.catalog import CATALOG_ENABLED, catalog_cache
+from src.db.targets import targets, UnknownTarget
+from src.db.history import history, make_record
+from src.db.plan_store import plan_store
+from src.analyzer.extract import plan_stats_used, plan_to_features
+from src.analyzer.query_fingerprint import fingerprint as query_fingerprint
+from src.utils.admission import AdmissionRejected, admission
+from src.utils.cancellation import RequestAbandoned, run_cancellable
+from src.utils.metrics import METRICS_ENABLED, MetricsMiddleware, render_prometheus, stage
 
-app = FastAPI(title="PG SQL Advisor (MVP)")
-rules = load_rules()
+app = FastAPI(title="PG SQL Advisor (MVP)", lifespan=lifespan)
 
 # CORS: разрешить для всех источников
 app.add_middleware(
@@ -24,7 +45,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# тайминги этапов -> заголовок Server-Timing и /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Console logger
 logger = logging.getLogger("pg_sql_advisor")
@@ -35,17 +59,54 @@ if not logger.handlers:
     logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+@app.exception_handler(AdmissionRejected)
+async def _admission_rejected(request: Request, e: AdmissionRejected):
+    return JSONResponse(status_code=429, headers={"Retry-After": str(e.retry_after)},
+                        content={"detail": f"too many {e.klass} requests, retry later"})
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
-@app.post("/advise", response_model=AdviseResponse)
-def advise(payload: AdviseInput):
-    recs, contributions = apply_rules(payload, rules)
-    risk = aggregate_score(contributions, payload)
-    md   = render_report(recs, risk, payload)
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="metrics disabled (METRICS_ENABLED=0)")
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+def _advise_payload(payload: AdviseInput, rules=None) -> Dict[str, Any]:
+    # одна версия правил на весь запрос, даже если параллельно идёт перезагрузка
+    with stage("rules"):
+        recs, contributions = apply_rules(payload, rules if rules is not None else rules_manager.current)
+    with stage("score"):
+        risk = aggregate_score(contributions, payload)
+    with stage("render"):
+        md = render_report(recs, risk, payload)
     return {"risk": risk, "recommendations": recs, "explain_md": md}
 
+def _advise_cached(payload: AdviseInput) -> Dict[str, Any]:
+    # повторный payload (CI шлёт одни и те же фичи) отдаём без правил и рендеринга markdown
+    if not result_cache.enabled:
+        return _advise_payload(payload)
+    rs = rules_manager.current
+    with stage("cache"):
+        key = advise_cache_key(payload, rs.version)
+        hit = result_cache.get(key)
+    if hit is not None:
+        return dict(hit)
+    res = _advise_payload(payload, rs)
+    result_cache.put(key, res)
+    return dict(res)
+
+@app.post("/advise", response_model=AdviseResponse)
+async def advise(payload: AdviseInput):
+    # свой бюджет потоков: тяжёлые EXPLAIN ANALYZE не занимают слоты дешёвого /advise
+    async with admission.slot("advise"):
+        res = await run_in_threadpool(_advise_cached, payload)
+    qid = str(query_fingerprint(payload.sqlText)[0]) if payload.sqlText else None
+    history.record(make_record("advise", res, sql=payload.sqlText, query_id=qid))
+    return res
+
 
 # 1) Rule Engine: вход/выход
 class RuleEngineIn(AdviseInput):
@@ -61,6 +122,17 @@ class SqlRunIn(BaseModel):
     timeout_ms: int = 5000
     searchPath: Optional[str] = "public"
     allow_write: bool = False
+    target: Optional[str] = None   # имя БД из /api/settings/db/targets; None — DATABASE_URL
+    deadline_ms: Optional[int] = None   # по истечении запрос отменяется на сервере (504)
+
+class SqlStreamIn(BaseModel):
+    sql: str
+    params: Optional[Dict[str, Any]] = None
+    timeout_ms: int = 5000
+    searchPath: Optional[str] = "public"
+    max_rows: Optional[int] = None   # не больше SQL_STREAM_MAX_ROWS
+    itersize: Optional[int] = None
+    target: Optional[str] = None
 
 class SqlExplainIn(BaseModel):
     sql: str
@@ -71,37 +143,98 @@ class SqlExplainIn(BaseModel):
     timeout_ms: int = 5000
     searchPath: Optional[str] = "public"
     format: str = "json"   # "json" | "text"
+    target: Optional[str] = None
+    deadline_ms: Optional[int] = None
+
+def _abandoned(e: RequestAbandoned) -> HTTPException:
+    # 499 — клиент уже ушёл и ответ не прочтёт, но статус попадёт в метрики и логи
+    return HTTPException(status_code=504 if e.reason == "deadline" else 499, detail=f"query cancelled: {e.reason}")
 
 @app.post("/sql/run")
-async def sql_run(payload: SqlRunIn):
+async def sql_run(payload: SqlRunIn, request: Request):
+    async def _run() -> Dict[str, Any]:
+        async with admission.slot("run"):
+            return await run_sql_async(
+                payload.sql,
+                payload.params,
+                timeout_ms=payload.timeout_ms,
+                search_path=payload.searchPath,
+                allow_write=payload.allow_write,
+                target=payload.target,
+            )
+
     try:
-        res = await run_in_threadpool(
-            run_sql_sync,
-            payload.sql,
-            payload.params,
-            timeout_ms=payload.timeout_ms,
-            search_path=payload.searchPath,
-            allow_write=payload.allow_write,
-        )
+        res = await run_cancellable(request, _run(), payload.deadline_ms)
         return res
+    except RequestAbandoned as e:
+        raise _abandoned(e)
+    except AdmissionRejected:
+        raise
+    except UnknownTarget as e:
+        raise HTTPException(status_code=404, detail=f"unknown target: {e.args[0]}")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/sql/run/stream")
+async def sql_run_stream(payload: SqlStreamIn):
+    if payload.target and not targets.has(payload.target):
+        raise HTTPException(status_code=404, detail=f"unknown target: {payload.target}")
+    low = payload.sql.strip().lower()
+    if not (low.startswith("select") or low.startswith("with")):
+        raise HTTPException(status_code=400, detail="Only SELECT/WITH allowed in streaming mode.")
+
+    # поток держит соединение всё время выдачи — это тот же бюджет "run":
+    # отказ (429) — до заголовков, слот освобождается, когда поток закончился
+    slot = AsyncExitStack()
+    await slot.enter_async_context(admission.slot("run"))
+
+    async def _body():
+        try:
+            async for chunk in stream_sql_async(
+                payload.sql,
+                payload.params,
+                timeout_ms=payload.timeout_ms,
+                search_path=payload.searchPath,
+                max_rows=payload.max_rows,
+                itersize=payload.itersize,
+                target=payload.target,
+            ):
+                yield chunk
+        except Exception as e:
+            # заголовки уже отправлены — сообщаем об ошибке последней строкой потока
+            logger.warning("sql stream failed: %s", e)
+            yield (json.dumps({"_error": str(e)}, ensure_ascii=False) + "\n").encode("utf-8")
+        finally:
+            await slot.aclose()
+
+    # background — на случай, если генератор так и не был запущен (повторный aclose — no-op)
+    return StreamingResponse(_body(), media_type="application/x-ndjson", background=BackgroundTask(slot.aclose))
+
 @app.post("/sql/explain")
-async def sql_explain(payload: SqlExplainIn):
+async def sql_explain(payload: SqlExplainIn, request: Request):
+    async def _explain() -> Dict[str, Any]:
+        async with admission.slot("analyze" if payload.analyze else "explain"):
+            return await explain_sql_async(
+                payload.sql,
+                analyze=payload.analyze,
+                buffers=payload.buffers,
+                verbose=payload.verbose,
+                settings=payload.settings,
+                timeout_ms=payload.timeout_ms,
+                search_path=payload.searchPath,
+                fmt=payload.format,
+                target=payload.target,
+            )
+
     try:
-        res = await run_in_threadpool(
-            explain_sql_sync,
-            payload.sql,
-            analyze=payload.analyze,
-            buffers=payload.buffers,
-            verbose=payload.verbose,
-            settings=payload.settings,
-            timeout_ms=payload.timeout_ms,
-            search_path=payload.searchPath,
-            fmt=payload.format,
-        )
+        res = await run_cancellable(request, _explain(), payload.deadline_ms)
         return res
+    except RequestAbandoned as e:
+        raise _abandoned(e)
+    except AdmissionRejected:
+        raise
+    except UnknownTarget as e:
+        raise HTTPException(status_code=404, detail=f"unknown target: {e.args[0]}")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 class AdviseSqlIn(BaseModel):
@@ -109,39 +242,324 @@ class AdviseSqlIn(BaseModel):
     analyze: bool = False
     timeout_ms: int = 5000
     searchPath: Optional[str] = "public"
+    target: Optional[str] = None
+    measure_gain: bool = False   # замерить эффект rewrite/db_setting повторным EXPLAIN
+    plan_mode: Literal["inline", "hash"] = "inline"   # hash: в ответе только plan_hash, план — GET /plans/{hash}
+    deadline_ms: Optional[int] = None
 
-@app.post("/advise/sql")
-async def advise_sql(payload: AdviseSqlIn):
-    # 1) получаем EXPLAIN JSON из БД
-    exp = await run_in_threadpool(
-        explain_sql_sync,
-        payload.sql,
-        analyze=payload.analyze,
-        buffers=True,
-        verbose=False,
-        settings=False,
-        timeout_ms=payload.timeout_ms,
-        search_path=payload.searchPath,
-        fmt="json",
-    )
+def _advise_plan(sql: str, exp: Dict[str, Any], catalog: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     plan_list = exp.get("plan") or []
     if not plan_list:
         raise HTTPException(status_code=400, detail="Empty plan")
     plan_root = plan_list[0]
 
-    # 2) извлекаем features
-    feats = plan_to_features(plan_root, payload.sql)
+    # 2) извлекаем features (с каталогом — ещё и табличные: статистика, bloat, FK)
+    with stage("features"):
+        feats = plan_to_features(plan_root, sql, catalog=catalog)
+        stats_used = plan_stats_used(plan_root, catalog)
 
     # 3) прогоняем Advisor
-    advise_in = AdviseInput(sqlText=payload.sql, features=feats, statsUsed=[], dbSettings={})
-    recs, contributions = apply_rules(advise_in, rules)
-    risk = aggregate_score(contributions, advise_in)
-    md = render_report(recs, risk, advise_in)
-    return {"risk": risk, "recommendations": recs, "explain_md": md, "features": feats, "plan": plan_root}
+    advise_in = AdviseInput(sqlText=sql, features=feats, statsUsed=stats_used, dbSettings={}, plan=plan_root)
+    res = _advise_payload(advise_in)
+    # queryId — одинаков для запросов, отличающихся только константами
+    qid, _ = query_fingerprint(sql)
+    res.update({"queryId": str(qid), "features": feats, "plan": plan_root})
+    return res
+
+async def _catalog_for(exp: Dict[str, Any], target: Optional[str],
+                       search_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Факты каталога по всем таблицам плана одной пачкой; без каталога анализ всё равно идёт."""
+    rels = plan_relations(exp.get("plan"))
+    if not CATALOG_ENABLED or not rels:
+        return None
+    try:
+        with stage("catalog"):
+            return await catalog_cache.get(rels, target, search_path)
+    except Exception as e:
+        logger.warning("catalog snapshot failed: %s", e)
+        return None
+
+async def _explain_for_advise(sql: str, analyze: bool, timeout_ms: int, search_path: Optional[str],
+                             target: Optional[str] = None, generic_plan: bool = False,
+                             reject: bool = True) -> Dict[str, Any]:
+    async with admission.slot("analyze" if analyze else "explain", reject=reject):
+        with stage("explain"):
+            return await explain_sql_async(
+                sql,
+                analyze=analyze,
+                buffers=True,
+                verbose=False,
+                settings=False,
+                timeout_ms=timeout_ms,
+                search_path=search_path,
+                fmt="json",
+                target=target,
+                generic_plan=generic_plan,
+            )
+
+async def _measure(item: AdviseSqlIn, res: Dict[str, Any]) -> None:
+    """Заполнить expected_gain измеренными дельтами и перерисовать отчёт."""
+    # основной EXPLAIN уже прошёл: варианты ждут слот "explain", а не получают 429
+    async def _explain(sql: str) -> Dict[str, Any]:
+        return await _explain_for_advise(sql, False, item.timeout_ms, item.searchPath, item.target, reject=False)
+
+    async def _explain_set(sql: str, settings: Dict[str, str]) -> Dict[str, Any]:
+        async with admission.slot("explain", reject=False):
+            with stage("explain"):
+                return await explain_with_settings_async(sql, settings, timeout_ms=item.timeout_ms,
+                                                         search_path=item.searchPath, target=item.target)
+
+    if await measure_gains(item.sql, res["recommendations"], res["features"], _explain, _explain_set):
+        payload = AdviseInput(sqlText=item.sql, features=res["features"], plan=res["plan"])
+        res["explain_md"] = render_report(res["recommendations"], res["risk"], payload)
+
+async def _store_plan(item: AdviseSqlIn, res: Dict[str, Any]) -> None:
+    # повторяющиеся планы хранятся один раз; запись в SQLite — вне event loop
+    res["plan_hash"] = await run_in_threadpool(plan_store.put, res["plan"])
+
+def _strip_plan(item: AdviseSqlIn, res: Dict[str, Any]) -> None:
+    # после history.record: make_record берёт total_cost из самого плана
+    if item.plan_mode == "hash":
+        res.pop("plan", None)
+
+@app.post("/advise/sql")
+async def advise_sql(payload: AdviseSqlIn, request: Request):
+    if payload.target and not targets.has(payload.target):
+        raise HTTPException(status_code=404, detail=f"unknown target: {payload.target}")
+
+    async def _pipeline() -> Dict[str, Any]:
+        # 1) получаем EXPLAIN JSON из БД
+        exp = await _explain_for_advise(payload.sql, payload.analyze, payload.timeout_ms, payload.searchPath,
+                                        payload.target)
+        res = _advise_plan(payload.sql, exp, await _catalog_for(exp, payload.target, payload.searchPath))
+        if payload.measure_gain:
+            await _measure(payload, res)
+        return res
+
+    # ANALYZE реально выполняет запрос: ушедший клиент не должен держать соединение пула
+    try:
+        res = await run_cancellable(request, _pipeline(), payload.deadline_ms)
+    except RequestAbandoned as e:
+        raise _abandoned(e)
+    await _store_plan(payload, res)
+    history.record(make_record("advise_sql", res, sql=payload.sql, query_id=res["queryId"], target=payload.target))
+    _strip_plan(payload, res)
+    return res
+
+# ---------- Workload: анализ по снимку pg_stat_statements ----------
+class WorkloadIn(BaseModel):
+    source: str = "live"                          # "live" | "snapshot"
+    snapshot: Optional[List[Dict[str, Any]]] = None  # строки pg_stat_statements (JSON-выгрузка)
+    csv: Optional[str] = None                     # или CSV-выгрузка
+    top_n: int = Field(20, ge=1, le=500)
+    concurrency: Optional[int] = None
+    timeout_ms: int = 5000
+    searchPath: Optional[str] = "public"
+    target: Optional[str] = None
+
+@app.post("/advise/workload")
+async def advise_workload(payload: WorkloadIn):
+    if payload.target and not targets.has(payload.target):
+        raise HTTPException(status_code=404, detail=f"unknown target: {payload.target}")
+    if payload.source == "live":
+        try:
+            rows = load_snapshot(await fetch_pg_stat_statements_async(target=payload.target))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"pg_stat_statements: {e}")
+    elif payload.source == "snapshot":
+        try:
+            rows = load_snapshot(payload.snapshot, csv_text=payload.csv)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        raise HTTPException(status_code=400, detail="source must be 'live' or 'snapshot'")
+
+    async def _explain(sql: str, generic_plan: bool) -> Dict[str, Any]:
+        return await _explain_for_advise(sql, False, payload.timeout_ms, payload.searchPath,
+                                         payload.target, generic_plan=generic_plan, reject=False)
+
+    async def _catalog(exp: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await _catalog_for(exp, payload.target, payload.searchPath)
+
+    # файловый снимок мог быть снят с другой базы: каталог берём, только если база известна
+    with_catalog = payload.source == "live" or payload.target is not None
+    limit = max(1, min(payload.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    return await analyze_workload(rows, _explain, _advise_plan, top_n=payload.top_n,
+                                  concurrency=limit, source=payload.source,
+                                  catalog=_catalog if with_catalog else None)
+
+# ---------- Планы по хэшу ----------
+@app.get("/plans/stats")
+def plans_stats():
+    return plan_store.stats()
+
+@app.get("/plans/{plan_hash}")
+def plans_get(plan_hash: str):
+    plan = plan_store.get(plan_hash)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="plan not found")
+    return plan
+
+# ---------- История анализов ----------
+@app.get("/history")
+def history_list(limit: int = Query(50, ge=1, le=500),
+                 cursor: Optional[str] = None,
+                 severity: Optional[str] = None,
+                 rule: Optional[str] = None,
+                 query_id: Optional[str] = None,
+                 min_score: Optional[int] = None):
+    try:
+        return history.list(limit=limit, cursor=cursor, severity=severity, rule_id=rule,
+                            query_id=query_id, min_score=min_score)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+@app.get("/history/stats")
+def history_stats():
+    return history.stats()
+
+@app.get("/history/{analysis_id}")
+def history_get(analysis_id: int):
+    item = history.get(analysis_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="analysis not found")
+    return item
+
+# ---------- Правила: версия и перезагрузка ----------
+@app.get("/rules/version")
+def rules_version():
+    return rules_manager.status()
+
+@app.post("/rules/reload")
+def rules_reload(force: bool = False):
+    return rules_manager.reload(force=force)
+
+# ---------- Кэш планов EXPLAIN ----------
+class PlanCacheInvalidateIn(BaseModel):
+    relation: Optional[str] = None
+
+@app.get("/cache/plans")
+def plan_cache_stats():
+    return plan_cache.stats()
+
+@app.post("/cache/plans/invalidate")
+def plan_cache_invalidate(payload: Optional[PlanCacheInvalidateIn] = None):
+    dropped = plan_cache.invalidate(payload.relation if payload else None)
+    return {"invalidated": dropped, **plan_cache.stats()}
+
+# ---------- Admission control ----------
+@app.get("/admission")
+def admission_stats():
+    return admission.stats()
+
+# ---------- Кэш каталога ----------
+@app.get("/cache/catalog")
+def catalog_cache_stats():
+    return catalog_cache.stats()
+
+@app.post("/cache/catalog/invalidate")
+def catalog_cache_invalidate(payload: Optional[PlanCacheInvalidateIn] = None):
+    return {"invalidated": catalog_cache.invalidate(payload.relation if payload else None), **catalog_cache.stats()}
+
+# ---------- Кэш результатов /advise ----------
+@app.get("/cache/advise")
+def advise_cache_stats():
+    return result_cache.stats()
+
+@app.post("/cache/advise/invalidate")
+def advise_cache_invalidate():
+    return {"invalidated": result_cache.clear(), **result_cache.stats()}
+
+# ---------- Batch: пачка запросов за один HTTP round trip ----------
+BATCH_MAX_ITEMS = int(os.getenv("ADVISE_BATCH_MAX_ITEMS", "1000"))
+# по умолчанию не больше, чем соединений в пуле: лишние EXPLAIN всё равно ждали бы соединение
+BATCH_CONCURRENCY = int(os.getenv("ADVISE_BATCH_CONCURRENCY", str(ASYNC_POOL_MAX_SIZE)))
+
+class AdviseBatchIn(BaseModel):
+    items: List[AdviseInput] = Field(..., max_length=BATCH_MAX_ITEMS)
+
+class AdviseSqlBatchIn(BaseModel):
+    items: List[AdviseSqlIn] = Field(..., max_length=BATCH_MAX_ITEMS)
+    concurrency: Optional[int] = None
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+@app.post("/advise/batch")
+async def advise_batch(payload: AdviseBatchIn):
+    async with admission.slot("advise"):
+        return await run_in_threadpool(_advise_batch, payload)
+
+def _advise_batch(payload: AdviseBatchIn) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    results = []
+    for i, item in enumerate(payload.items):
+        t_item = time.perf_counter()
+        try:
+            res = _advise_cached(item)
+            results.append({"index": i, "ok": True, **res, "timings": {"advise_ms": _ms(t_item)}})
+        except Exception as e:
+            results.append({"index": i, "ok": False, "error": str(e), "timings": {"advise_ms": _ms(t_item)}})
+    return {"count": len(results), "results": results, "timings": {"total_ms": _ms(t0)}}
+
+@app.post("/advise/sql/batch")
+async def advise_sql_batch(payload: AdviseSqlBatchIn):
+    t0 = time.perf_counter()
+    limit = max(1, min(payload.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    sem = asyncio.Semaphore(limit)
+
+    async def _one(i: int, item: AdviseSqlIn) -> Dict[str, Any]:
+        timings: Dict[str, float] = {}
+        try:
+            async with sem:
+                t_exp = time.perf_counter()
+                exp = await _explain_for_advise(item.sql, item.analyze, item.timeout_ms, item.searchPath,
+                                                item.target, reject=False)
+                timings["explain_ms"] = _ms(t_exp)
+                catalog = await _catalog_for(exp, item.target, item.searchPath)
+            t_adv = time.perf_counter()
+            res = _advise_plan(item.sql, exp, catalog)
+            timings["advise_ms"] = _ms(t_adv)
+            if item.measure_gain:
+                async with sem:
+                    t_m = time.perf_counter()
+                    await _measure(item, res)
+                    timings["measure_ms"] = _ms(t_m)
+            await _store_plan(item, res)
+            history.record(make_record("advise_sql", res, sql=item.sql, query_id=res["queryId"], target=item.target))
+            _strip_plan(item, res)
+            return {"index": i, "ok": True, **res, "timings": timings}
+        except HTTPException as e:
+            return {"index": i, "ok": False, "error": e.detail, "timings": timings}
+        except Exception as e:
+            return {"index": i, "ok": False, "error": str(e), "timings": timings}
+
+    results = await asyncio.gather(*(_one(i, it) for i, it in enumerate(payload.items)))
+    failed = sum(1 for r in results if not r["ok"])
+    return {
+        "count": len(results),
+        "failed": failed,
+        "concurrency": limit,
+        "results": results,
+        "index_plan": consolidate_indexes(index_candidates(results, query_key="index")),
+        "timings": {"total_ms": _ms(t0)},
+    }
+
+# ---------- Индексы: сведение рекомендаций нескольких запросов ----------
+class IndexConsolidateItem(BaseModel):
+    query: Optional[Any] = None                   # идентификатор запроса (queryid, индекс в batch, ...)
+    recommendations: List[Dict[str, Any]] = []
+
+class IndexConsolidateIn(BaseModel):
+    items: List[IndexConsolidateItem] = Field(..., max_length=BATCH_MAX_ITEMS)
+
+@app.post("/advise/indexes/consolidate")
+def advise_indexes_consolidate(payload: IndexConsolidateIn):
+    return consolidate_indexes(index_candidates(it.model_dump() for it in payload.items))
 
 @app.post("/debug/rule_engine/apply", response_model=RuleEngineOut)
 def debug_rule_engine(payload: RuleEngineIn):
-    recs, contribs = apply_rules(payload, rules)
+    recs, contribs = apply_rules(payload, rules_manager.current)
     return {"recommendations": recs, "risk_contributions": contribs}
 
 # 2) Risk Score: вход/выход
@@ -178,6 +596,7 @@ class DbTestInput(BaseModel):
     database: str
     user: str
     password: str
+    name: Optional[str] = None   # если задано — после успешной проверки цель регистрируется
 
 
 @app.post("/api/settings/db/test")
@@ -187,6 +606,14 @@ async def settings_db_test(payload: DbTestInput):
             "DB test request: host=%s port=%s db=%s user=%s password=%s",
             payload.host, payload.port, payload.database, payload.user, "***" if payload.password else "",
         )
+        if payload.name:
+            # сначала проверка, потом регистрация: нерабочая цель не должна остаться в реестре
+            params = payload.model_dump(exclude={"name"})
+            res = await targets.probe(payload.name, params)
+            await targets.register(payload.name, params)
+            logger.info("DB test success (target %s): user=%s db=%s",
+                        payload.name, res.get("current_user"), res.get("database"))
+            return res
         res = await run_in_threadpool(
             test_conn_with_params,
             {
@@ -205,3 +632,22 @@ async def settings_db_test(payload: DbTestInput):
     except Exception as e:
         logger.exception("DB test failed: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
+
+
+# ---------- Settings: именованные целевые БД ----------
+class DbTargetIn(DbTestInput):
+    name: str
+
+@app.get("/api/settings/db/targets")
+def settings_db_targets():
+    return {"targets": targets.list()}
+
+@app.post("/api/settings/db/targets")
+async def settings_db_target_register(payload: DbTargetIn):
+    return await targets.register(payload.name, payload.model_dump(exclude={"name"}))
+
+@app.delete("/api/settings/db/targets/{name}")
+async def settings_db_target_delete(name: str):
+    if not await targets.unregister(name):
+        raise HTTPException(status_code=404, detail=f"unknown target: {name}")
+    return {"ok": True}
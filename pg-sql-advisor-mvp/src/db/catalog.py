@@ -0,0 +1,284 @@
+# src/db/catalog.py
+# Снимок каталога для таблиц плана: pg_class + pg_stat_user_tables, индексы
+# (pg_index), внешние ключи (pg_constraint), расширенная статистика
+# (pg_statistic_ext) и pg_stats по колонкам.
+#   * выборка пачкой: по одному запросу на каталог для всех таблиц плана,
+#     в pipeline-режиме все запросы уходят за один round trip;
+#   * запросы идут с search_path запроса: pg_table_is_visible выбирает ту же
+#     таблицу, что и планировщик, когда одно имя есть в нескольких схемах;
+#   * кэш по (target, search_path, relname) с TTL; раз в CATALOG_CHECK_S дешёвый probe
+#     сверяет отметки изменений (xmin строки pg_class, время ANALYZE/VACUUM,
+#     число ограничений) и перечитывает только изменившиеся таблицы.
+import os, threading, time
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from psycopg.rows import dict_row
+from src.db.pg import USE_PIPELINE, _ctx_query
+from src.db.pg_async import _connection, resolve_pool
+from src.utils.metrics import DB_SECONDS
+
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "1").lower() not in ("0", "false", "no")
+CATALOG_TTL_S = float(os.getenv("CATALOG_TTL_S", "300"))
+CATALOG_CHECK_S = float(os.getenv("CATALOG_CHECK_S", "10"))
+CATALOG_MAX_ENTRIES = int(os.getenv("CATALOG_MAX_ENTRIES", "5000"))
+
+_RELKINDS = "('r', 'p', 'm')"
+
+_RELATIONS_SQL = f"""
+    SELECT c.oid, n.nspname AS schema, c.relname, c.reltuples, c.relpages,
+           pg_table_is_visible(c.oid) AS visible,
+           s.n_live_tup, s.n_dead_tup, s.n_mod_since_analyze,
+           s.last_analyze::text AS last_analyze, s.last_autoanalyze::text AS last_autoanalyze
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE c.relname = ANY(%s) AND c.relkind IN {_RELKINDS}
+"""
+
+_INDEXES_SQL = """
+    SELECT x.indrelid AS oid, ic.relname AS name, x.indisunique AS unique, x.indpred IS NOT NULL AS partial,
+           ARRAY(SELECT a.attname::text
+                 FROM unnest(x.indkey::int2[]) WITH ORDINALITY k(attnum, ord)
+                 JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = k.attnum
+                 WHERE k.ord <= x.indnkeyatts
+                 ORDER BY k.ord) AS cols
+    FROM pg_index x
+    JOIN pg_class ic ON ic.oid = x.indexrelid
+    JOIN pg_class c ON c.oid = x.indrelid
+    WHERE c.relname = ANY(%s) AND x.indisvalid
+"""
+
+_FKS_SQL = """
+    SELECT k.conrelid AS oid, k.conname AS name, k.confrelid::regclass::text AS ref_table,
+           ARRAY(SELECT a.attname::text
+                 FROM unnest(k.conkey) WITH ORDINALITY u(attnum, ord)
+                 JOIN pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = u.attnum
+                 ORDER BY u.ord) AS cols
+    FROM pg_constraint k
+    JOIN pg_class c ON c.oid = k.conrelid
+    WHERE k.contype = 'f' AND c.relname = ANY(%s)
+"""
+
+_EXT_STATS_SQL = """
+    SELECT e.stxrelid AS oid, e.stxname AS name,
+           ARRAY(SELECT a.attname::text FROM unnest(e.stxkeys::int2[]) u(attnum)
+                 JOIN pg_attribute a ON a.attrelid = e.stxrelid AND a.attnum = u.attnum) AS cols
+    FROM pg_statistic_ext e
+    JOIN pg_class c ON c.oid = e.stxrelid
+    WHERE c.relname = ANY(%s)
+"""
+
+# anyarray -> text -> text[]: значения MCV/гистограммы в текстовом виде, типизирует потребитель
+_STATS_SQL = """
+    SELECT schemaname AS schema, tablename AS relname, attname, null_frac, avg_width, n_distinct, correlation,
+           most_common_vals::text::text[] AS mcv, most_common_freqs AS mcf,
+           histogram_bounds::text::text[] AS histogram
+    FROM pg_stats
+    WHERE tablename = ANY(%s) AND NOT inherited
+"""
+
+_PROBE_SQL = f"""
+    SELECT n.nspname AS schema, c.relname, c.xmin::text AS xmin,
+           greatest(s.last_analyze, s.last_autoanalyze)::text AS analyzed,
+           greatest(s.last_vacuum, s.last_autovacuum)::text AS vacuumed,
+           (SELECT count(*) FROM pg_constraint k WHERE k.conrelid = c.oid) AS constraints,
+           pg_table_is_visible(c.oid) AS visible
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE c.relname = ANY(%s) AND c.relkind IN {_RELKINDS}
+"""
+
+_QUERIES = (("relations", _RELATIONS_SQL), ("indexes", _INDEXES_SQL), ("fks", _FKS_SQL),
+            ("ext_stats", _EXT_STATS_SQL), ("stats", _STATS_SQL))
+
+
+def _pick_visible(rows: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Одна таблица на имя: при совпадении имён в разных схемах — видимая по search_path."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        cur = out.get(r["relname"])
+        if cur is None or (r.get("visible") and not cur.get("visible")):
+            out[r["relname"]] = r
+    return out
+
+def build_snapshot(results: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Строки каталогов -> {relname: факты о таблице}."""
+    rels = _pick_visible(results.get("relations") or [])
+    by_oid: Dict[Any, Dict[str, Any]] = {}
+    snap: Dict[str, Dict[str, Any]] = {}
+    for name, r in rels.items():
+        entry = {
+            "schema": r["schema"],
+            "reltuples": r["reltuples"],
+            "relpages": r["relpages"],
+            "n_live_tup": r.get("n_live_tup"),
+            "n_dead_tup": r.get("n_dead_tup"),
+            "n_mod_since_analyze": r.get("n_mod_since_analyze"),
+            "last_analyze": r.get("last_analyze"),
+            "last_autoanalyze": r.get("last_autoanalyze"),
+            "indexes": [],
+            "fks": [],
+            "ext_stats": [],
+            "columns": {},
+        }
+        snap[name] = entry
+        by_oid[r["oid"]] = entry
+    for r in results.get("indexes") or []:
+        if r["oid"] in by_oid:
+            by_oid[r["oid"]]["indexes"].append(
+                {"name": r["name"], "cols": list(r["cols"] or []), "unique": r["unique"], "partial": r["partial"]})
+    for r in results.get("fks") or []:
+        if r["oid"] in by_oid:
+            by_oid[r["oid"]]["fks"].append({"name": r["name"], "cols": list(r["cols"] or []), "refTable": r["ref_table"]})
+    for r in results.get("ext_stats") or []:
+        if r["oid"] in by_oid:
+            by_oid[r["oid"]]["ext_stats"].append(sorted(r["cols"] or []))
+    for r in results.get("stats") or []:
+        entry = snap.get(r["relname"])
+        if entry is None or entry["schema"] != r["schema"]:
+            continue
+        entry["columns"][r["attname"]] = {
+            "null_frac": r["null_frac"],
+            "avg_width": r["avg_width"],
+            "n_distinct": r["n_distinct"],
+            "correlation": r["correlation"],
+            "mcv": r.get("mcv"),
+            "mcf": r.get("mcf"),
+            "histogram": r.get("histogram"),
+        }
+    return snap
+
+def _stamp(r: Dict[str, Any]) -> Tuple:
+    return (r["schema"], r["xmin"], r["analyzed"], r["vacuumed"], r["constraints"])
+
+
+async def _run_queries(queries: List[Tuple[str, str]], relations: List[str],
+                       target: Optional[str], search_path: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Все запросы одним pipeline-пакетом (или по очереди, если pipeline недоступен)."""
+    ctx = _ctx_query(search_path, 0)
+    pool = await resolve_pool(target)
+    async with _connection(pool, target) as conn:
+        t_db = time.perf_counter()
+        curs = [conn.cursor(row_factory=dict_row) for _ in queries]
+        try:
+            async with (conn.pipeline() if USE_PIPELINE else nullcontext()), \
+                    (conn.transaction() if ctx is not None else nullcontext()):
+                if ctx is not None:
+                    await conn.execute(*ctx)   # SET LOCAL search_path: видимость как у запроса
+                for cur, (_, sql) in zip(curs, queries):
+                    await cur.execute(sql, (relations,))
+            out = {name: await cur.fetchall() for cur, (name, _) in zip(curs, queries)}
+        finally:
+            for cur in curs:
+                await cur.close()
+        DB_SECONDS.observe(time.perf_counter() - t_db, op="catalog")
+    return out
+
+async def fetch_snapshot_async(relations: List[str], target: Optional[str] = None,
+                               search_path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    results = await _run_queries(list(_QUERIES) + [("probe", _PROBE_SQL)], relations, target, search_path)
+    snap = build_snapshot(results)
+    for name, r in _pick_visible(results["probe"]).items():
+        if name in snap:
+            snap[name]["_stamp"] = _stamp(r)
+    return snap
+
+async def fetch_stamps_async(relations: List[str], target: Optional[str] = None,
+                             search_path: Optional[str] = None) -> Dict[str, Tuple]:
+    res = await _run_queries([("probe", _PROBE_SQL)], relations, target, search_path)
+    return {name: _stamp(r) for name, r in _pick_visible(res["probe"]).items()}
+
+
+class _Entry:
+    __slots__ = ("facts", "created", "checked")
+
+    def __init__(self, facts: Optional[Dict[str, Any]]):
+        self.facts = facts   # None — таблицы нет (CTE, функция и т.п.), тоже кэшируем
+        self.created = self.checked = time.monotonic()
+
+
+class CatalogCache:
+    def __init__(self, ttl_s: float = CATALOG_TTL_S, check_s: float = CATALOG_CHECK_S,
+                 max_entries: int = CATALOG_MAX_ENTRIES, fetch=fetch_snapshot_async, probe=fetch_stamps_async):
+        self.ttl_s = ttl_s
+        self.check_s = check_s
+        self.max_entries = max_entries
+        self._fetch = fetch
+        self._probe = probe
+        self._data: Dict[Tuple[str, str, str], _Entry] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.fetches = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    async def get(self, relations: Iterable[str], target: Optional[str] = None,
+                  search_path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Факты по таблицам; отсутствующие, истёкшие и изменившиеся — одним пакетным запросом."""
+        rels = sorted(set(relations))
+        if not rels:
+            return {}
+        if not self.enabled:
+            return await self._fetch(rels, target, search_path)
+        t, sp = target or "", search_path or ""
+        now = time.monotonic()
+        fresh: Dict[str, _Entry] = {}
+        missing: List[str] = []
+        to_check: List[str] = []
+        with self._lock:
+            for rel in rels:
+                e = self._data.get((t, sp, rel))
+                if e is None or now - e.created > self.ttl_s:
+                    missing.append(rel)
+                else:
+                    fresh[rel] = e
+                    if e.facts is not None and now - e.checked >= self.check_s:
+                        to_check.append(rel)
+        if to_check:
+            stamps = await self._probe(to_check, target, search_path)
+            for rel in to_check:
+                e = fresh[rel]
+                if stamps.get(rel) != e.facts.get("_stamp"):
+                    self.stale += 1
+                    missing.append(rel)
+                    del fresh[rel]
+                else:
+                    e.checked = now
+        if missing:
+            self.fetches += 1
+            snap = await self._fetch(missing, target, search_path)
+            with self._lock:
+                for rel in missing:
+                    fresh[rel] = self._data[(t, sp, rel)] = _Entry(snap.get(rel))
+                while len(self._data) > self.max_entries:
+                    self._data.pop(next(iter(self._data)))
+        self.misses += len(missing)
+        self.hits += len(rels) - len(missing)
+        return {rel: e.facts for rel, e in fresh.items() if e.facts is not None}
+
+    def invalidate(self, relation: Optional[str] = None, target: Optional[str] = None) -> int:
+        with self._lock:
+            drop = [k for k in self._data
+                    if (relation is None or k[2] == relation) and (target is None or k[0] == target)]
+            for k in drop:
+                del self._data[k]
+            return len(drop)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "ttl_s": self.ttl_s,
+                "check_s": self.check_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "fetches": self.fetches,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,261 @@
+# src/db/history.py
+# История анализов во встроенной SQLite.
+#   * запись — вне пути запроса: эндпоинт кладёт результат в очередь,
+#     фоновый поток пишет пачками в одной транзакции;
+#   * чтение — keyset-пагинация по (created_at, id): стоимость страницы не
+#     зависит от её номера, в отличие от OFFSET;
+#   * WAL: чтение не блокирует писателя.
+import base64, json, logging, os, queue, sqlite3, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("pg_sql_advisor")
+
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1").lower() not in ("0", "false", "no")
+HISTORY_DB = os.getenv("HISTORY_DB", "var/history.sqlite3")
+HISTORY_QUEUE_MAX = int(os.getenv("HISTORY_QUEUE_MAX", "10000"))
+HISTORY_BATCH = int(os.getenv("HISTORY_BATCH", "500"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id          INTEGER PRIMARY KEY,
+    created_at  REAL    NOT NULL,
+    source      TEXT    NOT NULL,
+    query_id    TEXT,
+    target      TEXT,
+    sql_text    TEXT,
+    risk_score  INTEGER,
+    severity    TEXT,
+    total_cost  REAL,
+    rule_ids    TEXT,
+    result      TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_analyses_created  ON analyses(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS ix_analyses_query    ON analyses(query_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS ix_analyses_score    ON analyses(risk_score, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS ix_analyses_severity ON analyses(severity, created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS analysis_rules (
+    rule_id     TEXT    NOT NULL,
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    PRIMARY KEY (rule_id, analysis_id)
+) WITHOUT ROWID;
+"""
+
+_COLUMNS = "id, created_at, source, query_id, target, sql_text, risk_score, severity, total_cost, rule_ids"
+
+
+def encode_cursor(created_at: float, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}:{row_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    ts, row_id = raw.split(":", 1)
+    return float(ts), int(row_id)
+
+
+def _plan_cost(result: Dict[str, Any]) -> Optional[float]:
+    plan = result.get("plan") or {}
+    cost = (plan.get("Plan") or plan).get("Total Cost") if isinstance(plan, dict) else None
+    return float(cost) if cost is not None else None
+
+def make_record(source: str, result: Dict[str, Any], sql: Optional[str] = None,
+                query_id: Optional[str] = None, target: Optional[str] = None) -> Dict[str, Any]:
+    risk = result.get("risk") or {}
+    total_cost = _plan_cost(result)
+    if result.get("plan_hash"):
+        # сам план уже лежит в plan_store — в истории только ссылка
+        result = {k: v for k, v in result.items() if k != "plan"}
+    rule_ids = sorted({r.get("rule_id") for r in result.get("recommendations") or [] if r.get("rule_id")})
+    return {
+        "created_at": time.time(),
+        "source": source,
+        "query_id": query_id,
+        "target": target,
+        "sql_text": sql,
+        "risk_score": risk.get("score"),
+        "severity": risk.get("severity"),
+        "total_cost": total_cost,
+        "rule_ids": rule_ids,
+        "result": result,   # сериализуется в потоке-писателе, не на пути запроса
+    }
+
+
+class HistoryStore:
+    def __init__(self, path: str = HISTORY_DB, enabled: bool = HISTORY_ENABLED,
+                 queue_max: int = HISTORY_QUEUE_MAX, batch: int = HISTORY_BATCH):
+        self.path = path
+        self.enabled = enabled
+        self.batch = batch
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_max)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_ready = False
+        self.written = self.dropped = self.errors = 0
+
+    # ---- соединения ----
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # по соединению на поток: sqlite3.Connection не потокобезопасен
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    # ---- запись ----
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            # после fork поток родителя в воркере не существует — поднимаем свой
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._writer, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        t = self._thread
+        if t is None or not t.is_alive():
+            return
+        self._queue.put(None)
+        t.join(timeout)
+        self._thread = None
+
+    def record(self, rec: Dict[str, Any]) -> bool:
+        """Неблокирующая постановка в очередь; при переполнении запись теряется."""
+        if not self.enabled:
+            return False
+        if self._thread is None or self._pid != os.getpid():
+            self.start()
+        try:
+            self._queue.put_nowait(rec)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Дождаться записи всего, что уже в очереди (тесты, остановка)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _writer(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                items = [item]
+                while item is not None and len(items) < self.batch:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    items.append(item)
+                recs = [r for r in items if r is not None]
+                try:
+                    if recs:
+                        self._write(conn, recs)
+                except Exception as e:  # поток не должен умирать из-за одной пачки
+                    self.errors += 1
+                    logger.exception("history: write failed: %s", e)
+                finally:
+                    for _ in items:
+                        self._queue.task_done()
+                if len(recs) != len(items):
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn: sqlite3.Connection, recs: List[Dict[str, Any]]) -> None:
+        conn.execute("BEGIN")
+        try:
+            for r in recs:
+                cur = conn.execute(
+                    "INSERT INTO analyses (created_at, source, query_id, target, sql_text, risk_score,"
+                    " severity, total_cost, rule_ids, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (r["created_at"], r["source"], r.get("query_id"), r.get("target"), r.get("sql_text"),
+                     r.get("risk_score"), r.get("severity"), r.get("total_cost"),
+                     ",".join(r.get("rule_ids") or []),
+                     json.dumps(r.get("result"), default=str, ensure_ascii=False)),
+                )
+                if r.get("rule_ids"):
+                    conn.executemany("INSERT OR IGNORE INTO analysis_rules (rule_id, analysis_id) VALUES (?, ?)",
+                                     [(rid, cur.lastrowid) for rid in r["rule_ids"]])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.written += len(recs)
+
+    # ---- чтение ----
+    def list(self, *, limit: int = 50, cursor: Optional[str] = None, severity: Optional[str] = None,
+             rule_id: Optional[str] = None, query_id: Optional[str] = None,
+             min_score: Optional[int] = None) -> Dict[str, Any]:
+        where: List[str] = []
+        args: List[Any] = []
+        if cursor:
+            ts, row_id = decode_cursor(cursor)
+            where.append("(created_at, id) < (?, ?)")
+            args += [ts, row_id]
+        if severity:
+            where.append("severity = ?")
+            args.append(severity)
+        if query_id:
+            where.append("query_id = ?")
+            args.append(query_id)
+        if min_score is not None:
+            where.append("risk_score >= ?")
+            args.append(min_score)
+        if rule_id:
+            where.append("id IN (SELECT analysis_id FROM analysis_rules WHERE rule_id = ?)")
+            args.append(rule_id)
+        sql = f"SELECT {_COLUMNS} FROM analyses"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        rows = self._reader().execute(sql, (*args, limit + 1)).fetchall()
+        items = [self._row(r) for r in rows[:limit]]
+        nxt = encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": nxt}
+
+    def get(self, row_id: int) -> Optional[Dict[str, Any]]:
+        r = self._reader().execute(f"SELECT {_COLUMNS}, result FROM analyses WHERE id = ?", (row_id,)).fetchone()
+        if r is None:
+            return None
+        out = self._row(r)
+        out["result"] = json.loads(r["result"]) if r["result"] else None
+        return out
+
+    @staticmethod
+    def _row(r: sqlite3.Row) -> Dict[str, Any]:
+        d = {k: r[k] for k in _COLUMNS.split(", ")}
+        d["rule_ids"] = [x for x in (d["rule_ids"] or "").split(",") if x]
+        return d
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "writer_alive": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+history = HistoryStore()
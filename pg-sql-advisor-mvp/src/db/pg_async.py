@@ -0,0 +1,283 @@
+# src/db/pg_async.py
+# Асинхронный бэкенд поверх psycopg AsyncConnectionPool: async-эндпоинты
+# ходят в БД напрямую, не занимая потоки starlette threadpool.
+import asyncio, json, logging, os, time
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row
+from src.db.pg import (
+    DATABASE_URL, PG_CANCEL_TIMEOUT_S, USE_PIPELINE, _RESET_SQL, _STAMPS_SQL, _check_read_only, _ctx_query, _explain_options,
+    _plan_result, _reset_names, _session_ctx,
+)
+from src.db.plan_cache import plan_cache, plan_relations
+from src.db.targets import targets
+from src.utils.cancellation import cancel_reason
+from src.utils.metrics import DB_SECONDS, POOL_WAIT_SECONDS, QUERY_CANCELLATIONS, record_stage, register_collector
+
+logger = logging.getLogger("pg_sql_advisor")
+
+ASYNC_POOL_MIN_SIZE = int(os.getenv("PG_ASYNC_POOL_MIN_SIZE", "1"))
+ASYNC_POOL_MAX_SIZE = int(os.getenv("PG_ASYNC_POOL_MAX_SIZE", "20"))
+
+# потоковая выдача /sql/run: предел строк и размер пачки FETCH серверного курсора
+STREAM_MAX_ROWS = int(os.getenv("SQL_STREAM_MAX_ROWS", "100000"))
+STREAM_ITERSIZE = int(os.getenv("SQL_STREAM_ITERSIZE", "1000"))
+
+_pool: Optional[AsyncConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = asyncio.Lock()
+
+async def get_pool() -> AsyncConnectionPool:
+    """Пул открывается при первом обращении в воркере, а не на импорте."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        async with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                p = AsyncConnectionPool(
+                    DATABASE_URL,
+                    min_size=ASYNC_POOL_MIN_SIZE,
+                    max_size=ASYNC_POOL_MAX_SIZE,
+                    kwargs={"autocommit": True},
+                    open=False,
+                )
+                await p.open(wait=False)
+                _pool, _pool_pid = p, os.getpid()
+    return _pool
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None and _pool_pid == os.getpid():
+        await _pool.close()
+    _pool = None
+    await targets.close_all()
+
+async def resolve_pool(target: Optional[str] = None) -> AsyncConnectionPool:
+    """Пул именованной цели или пул по умолчанию (DATABASE_URL)."""
+    return await targets.get_pool(target) if target else await get_pool()
+
+@asynccontextmanager
+async def _connection(pool: AsyncConnectionPool, target: Optional[str] = None):
+    """pool.connection() с замером ожидания свободного соединения."""
+    t0 = time.perf_counter()
+    async with pool.connection() as conn:
+        waited = time.perf_counter() - t0
+        POOL_WAIT_SECONDS.observe(waited, pool=target or "default")
+        record_stage("pool_wait", waited)
+        yield conn
+
+@register_collector
+def _pool_metrics():
+    """Насыщенность пулов снимается в момент выдачи /metrics."""
+    pools = [("default", _pool)] if _pool is not None and _pool_pid == os.getpid() else []
+    pools += [(t.name, t.pool) for t in targets._targets.values() if t.pool is not None]
+    stats = [(name, p.get_stats(), p.max_size) for name, p in pools]
+    return [
+        ("advisor_pool_size", "Open connections in the pool", "gauge",
+         [({"pool": n}, st.get("pool_size", 0)) for n, st, _ in stats]),
+        ("advisor_pool_available", "Idle connections in the pool", "gauge",
+         [({"pool": n}, st.get("pool_available", 0)) for n, st, _ in stats]),
+        ("advisor_pool_requests_waiting", "Clients waiting for a connection", "gauge",
+         [({"pool": n}, st.get("requests_waiting", 0)) for n, st, _ in stats]),
+        ("advisor_pool_saturation", "Busy connections / max_size", "gauge",
+         [({"pool": n}, (st.get("pool_size", 0) - st.get("pool_available", 0)) / mx if mx else 0)
+          for n, st, mx in stats]),
+    ]
+
+async def _cancel_backend(conn, exc: BaseException) -> None:
+    """
+    Корутину отменили посреди запроса (клиент ушёл, дедлайн), а backend
+    продолжает работать. Отменяем его на сервере; соединение в состоянии
+    ACTIVE пул при возврате закроет и заменит, так что слот освобождается сразу.
+    """
+    QUERY_CANCELLATIONS.inc(reason=cancel_reason(exc))
+    try:
+        await conn.cancel_safe(timeout=PG_CANCEL_TIMEOUT_S)
+    except Exception as e:
+        logger.warning("pg: cancel failed: %s", e)
+
+async def _execute_session(conn, cur, sql: str, params: Any, ctx: Tuple[str, List[str]]) -> List[Dict[str, Any]]:
+    """Async-версия src.db.pg._execute_session: запрос вне транзакции с параметрами на сессию."""
+    await conn.execute(*ctx)
+    try:
+        await cur.execute(sql, params)
+        return await cur.fetchall() if cur.description else []
+    finally:
+        try:
+            await conn.execute(_RESET_SQL, (_reset_names(ctx),))
+        except Exception as e:
+            logger.warning("pg: session reset failed, dropping connection: %s", e)
+            await conn.close()
+
+async def _execute(conn, cur, sql: str, params: Any = None,
+                   ctx: Optional[Tuple[str, List[str]]] = None, *, rollback: bool = False,
+                   session: bool = False) -> List[Dict[str, Any]]:
+    """Async-версия src.db.pg._execute: контекст и запрос одним pipeline-пакетом в транзакции."""
+    try:
+        if session and ctx is not None:
+            return await _execute_session(conn, cur, sql, params, ctx)
+        if ctx is None and not rollback:
+            await cur.execute(sql, params)
+            return await cur.fetchall() if cur.description else []
+        try:
+            async with (conn.pipeline() if USE_PIPELINE else nullcontext()), conn.transaction(force_rollback=rollback):
+                if ctx is not None:
+                    await conn.execute(*ctx)
+                await cur.execute(sql, params)
+        except Exception:
+            if conn.info.transaction_status == TransactionStatus.INERROR:
+                await conn.rollback()
+            raise
+        return await cur.fetchall() if cur.description else []
+    except asyncio.CancelledError as e:
+        await _cancel_backend(conn, e)
+        raise
+
+async def run_sql_async(sql: str,
+                        params: Optional[Dict[str, Any]] = None,
+                        *,
+                        timeout_ms: int = 5000,
+                        search_path: Optional[str] = None,
+                        allow_write: bool = False,
+                        target: Optional[str] = None) -> Dict[str, Any]:
+    s = _check_read_only(sql, allow_write)
+    t0 = time.perf_counter()
+    pool = await resolve_pool(target)
+    async with _connection(pool, target) as conn, conn.cursor(row_factory=dict_row) as cur:
+        t_db = time.perf_counter()
+        session, ctx = _session_ctx(s, search_path, timeout_ms)
+        rows = await _execute(conn, cur, s, params or None, ctx, session=session)
+        DB_SECONDS.observe(time.perf_counter() - t_db, op="run")
+    return {"rows": rows, "row_count": len(rows), "duration_ms": round((time.perf_counter()-t0)*1000, 2)}
+
+def _ndjson(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, default=str, ensure_ascii=False) + "\n"
+
+async def stream_sql_async(sql: str,
+                           params: Optional[Dict[str, Any]] = None,
+                           *,
+                           timeout_ms: int = 5000,
+                           search_path: Optional[str] = None,
+                           max_rows: Optional[int] = None,
+                           itersize: Optional[int] = None,
+                           target: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    NDJSON-поток строк через именованный (серверный) курсор: в памяти
+    держим не больше itersize строк. Последняя строка — {"_meta": ...}
+    с количеством строк и признаком обрезки по max_rows.
+    """
+    s = _check_read_only(sql, False)
+    max_rows = min(max_rows or STREAM_MAX_ROWS, STREAM_MAX_ROWS)
+    itersize = max(1, min(itersize or STREAM_ITERSIZE, max_rows))
+    t0 = time.perf_counter()
+    n, truncated = 0, False
+    pool = await resolve_pool(target)
+    async with _connection(pool, target) as conn:
+        # серверный курсор живёт только внутри транзакции
+        async with conn.transaction():
+            ctx = _ctx_query(search_path, timeout_ms)
+            if ctx is not None:
+                await conn.execute(*ctx)
+            async with conn.cursor(name="advisor_stream", row_factory=dict_row) as cur:
+                cur.itersize = itersize
+                chunk: List[str] = []
+                try:
+                    await cur.execute(s, params or None)
+                    async for row in cur:
+                        if n >= max_rows:
+                            truncated = True
+                            break
+                        chunk.append(_ndjson(row))
+                        n += 1
+                        if len(chunk) >= itersize:
+                            yield "".join(chunk).encode("utf-8")
+                            chunk = []
+                except asyncio.CancelledError as e:
+                    # клиент закрыл поток: starlette отменяет генератор, FETCH ещё идёт
+                    await _cancel_backend(conn, e if e.args else asyncio.CancelledError("disconnect"))
+                    raise
+                if chunk:
+                    yield "".join(chunk).encode("utf-8")
+    yield _ndjson({"_meta": {
+        "row_count": n,
+        "truncated": truncated,
+        "max_rows": max_rows,
+        "duration_ms": round((time.perf_counter()-t0)*1000, 2),
+    }}).encode("utf-8")
+
+async def explain_sql_async(sql: str,
+                            *,
+                            analyze: bool = False,
+                            buffers: bool = True,
+                            verbose: bool = False,
+                            settings: bool = False,
+                            timeout_ms: int = 5000,
+                            search_path: Optional[str] = None,
+                            fmt: str = "json",
+                            target: Optional[str] = None,
+                            generic_plan: bool = False) -> Dict[str, Any]:
+    opts = _explain_options(analyze, buffers, verbose, settings, fmt, generic_plan)
+    q = f"EXPLAIN ({', '.join(opts)}) {sql.strip()}"
+
+    cache_key = None
+    if not analyze and plan_cache.enabled:
+        cache_key = plan_cache.make_key(sql, search_path, opts, target)
+        hit = await plan_cache.aget(cache_key, lambda rels: _fetch_analyze_stamps(rels, target))
+        if hit is not None:
+            return {**hit, "cached": True}
+
+    pool = await resolve_pool(target)
+    async with _connection(pool, target) as conn, conn.cursor(row_factory=dict_row) as cur:
+        t_db = time.perf_counter()
+        res = _plan_result(await _execute(conn, cur, q, None, _ctx_query(search_path, timeout_ms)), fmt)
+        DB_SECONDS.observe(time.perf_counter() - t_db, op="explain_analyze" if analyze else "explain")
+        if cache_key is not None:
+            plan_cache.put(cache_key, res, await _query_analyze_stamps(cur, plan_relations(res.get("plan"))))
+    return {**res, "cached": False} if cache_key is not None else res
+
+async def explain_with_settings_async(sql: str,
+                                      settings: Dict[str, str],
+                                      *,
+                                      timeout_ms: int = 5000,
+                                      search_path: Optional[str] = None,
+                                      target: Optional[str] = None) -> Dict[str, Any]:
+    """EXPLAIN под временными настройками: set_config(..., true) в транзакции, которая всегда откатывается."""
+    opts = _explain_options(False, False, False, False, "json")
+    pool = await resolve_pool(target)
+    async with _connection(pool, target) as conn, conn.cursor(row_factory=dict_row) as cur:
+        rows = await _execute(conn, cur, f"EXPLAIN ({', '.join(opts)}) {sql.strip()}", None,
+                              _ctx_query(search_path, timeout_ms, settings), rollback=True)
+        return _plan_result(rows, "json")
+
+async def _query_analyze_stamps(cur, relations: List[str]) -> Dict[str, Any]:
+    if not relations:
+        return {}
+    await cur.execute(_STAMPS_SQL, (list(relations),))
+    return {r["relname"]: (r["last_analyze"], r["last_autoanalyze"]) for r in await cur.fetchall()}
+
+async def _fetch_analyze_stamps(relations: List[str], target: Optional[str] = None) -> Dict[str, Any]:
+    pool = await resolve_pool(target)
+    async with _connection(pool, target) as conn, conn.cursor(row_factory=dict_row) as cur:
+        return await _query_analyze_stamps(cur, relations)
+
+_PGSS_SQL = """
+    SELECT queryid, query, calls, {total} AS total_exec_time, {mean} AS mean_exec_time, rows,
+           sum({total}) OVER () AS db_total_exec_time   -- окно считается до LIMIT: всё время БД
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    ORDER BY {total} DESC
+    LIMIT %s
+"""
+
+async def fetch_pg_stat_statements_async(limit: int = 500, target: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Снимок pg_stat_statements текущей БД, по убыванию total_exec_time."""
+    pool = await resolve_pool(target)
+    async with _connection(pool, target) as conn, conn.cursor(row_factory=dict_row) as cur:
+        try:
+            await cur.execute(_PGSS_SQL.format(total="total_exec_time", mean="mean_exec_time"), (limit,))
+        except psycopg.errors.UndefinedColumn:
+            # PG12 и старше: колонки называются total_time/mean_time
+            await cur.execute(_PGSS_SQL.format(total="total_time", mean="mean_time"), (limit,))
+        return await cur.fetchall()
@@ -0,0 +1,213 @@
+# src/db/plan_cache.py
+import os, threading, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+# relation -> (last_analyze, last_autoanalyze) в строковом виде
+Stamps = Dict[str, Tuple[Optional[str], Optional[str]]]
+StampsFetcher = Callable[[List[str]], Stamps]
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Косметическая нормализация для ключа кэша: убирает комментарии,
+    схлопывает пробелы и хвостовые ';'. Содержимое литералов и
+    квотированных идентификаторов не трогаем — от них зависит план.
+    """
+    out: List[str] = []
+    i, n = 0, len(sql)
+    pending_space = False
+    while i < n:
+        ch = sql[i]
+        # -- комментарий до конца строки
+        if ch == "-" and sql.startswith("--", i):
+            j = sql.find("\n", i)
+            i = n if j < 0 else j
+            pending_space = True
+            continue
+        # /* блочный */ комментарий, в PG они вкладываются
+        if ch == "/" and sql.startswith("/*", i):
+            depth, i = 1, i + 2
+            while i < n and depth:
+                if sql.startswith("/*", i):
+                    depth, i = depth + 1, i + 2
+                elif sql.startswith("*/", i):
+                    depth, i = depth - 1, i + 2
+                else:
+                    i += 1
+            pending_space = True
+            continue
+        if ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+        if pending_space and out:
+            out.append(" ")
+        pending_space = False
+        if ch in ("'", '"'):
+            j = i + 1
+            while j < n:
+                if sql[j] == ch:
+                    if j + 1 < n and sql[j + 1] == ch:  # '' / "" — экранирование
+                        j += 2
+                        continue
+                    break
+                j += 1
+            out.append(sql[i:j + 1])
+            i = j + 1
+            continue
+        if ch == "$":
+            j = sql.find("$", i + 1)
+            tag = sql[i:j + 1] if j > 0 else ""
+            if tag and (len(tag) == 2 or tag[1:-1].replace("_", "a").isalnum()) and not tag[1].isdigit():
+                end = sql.find(tag, j + 1)
+                end = n if end < 0 else end + len(tag)
+                out.append(sql[i:end])
+                i = end
+                continue
+        out.append(ch)
+        i += 1
+    return "".join(out).rstrip("; ")
+
+
+def plan_relations(plan: Any) -> List[str]:
+    """Имена таблиц из JSON-плана (итеративный обход)."""
+    rels = set()
+    stack = list(plan) if isinstance(plan, list) else [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "Plan" in node:
+            stack.append(node["Plan"])
+        rn = node.get("Relation Name")
+        if rn:
+            rels.add(rn)
+        stack.extend(node.get("Plans", []) or [])
+    return sorted(rels)
+
+
+class _Entry:
+    __slots__ = ("value", "stamps", "created", "checked")
+
+    def __init__(self, value: Any, stamps: Stamps):
+        self.value = value
+        self.stamps = stamps
+        self.created = self.checked = time.monotonic()
+
+
+class PlanCache:
+    """
+    LRU+TTL кэш результатов EXPLAIN (без ANALYZE).
+    Запись считается устаревшей, если у её таблиц изменились
+    last_analyze/last_autoanalyze в pg_stat_user_tables — проверяем не
+    чаще, чем раз в stats_check_s секунд на запись.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_s: float = 300.0, stats_check_s: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.stats_check_s = stats_check_s
+        self._data: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expired = self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(sql: str, search_path: Optional[str], options: Iterable[str], target: Optional[str] = None) -> Tuple:
+        return (target or "", normalize_sql(sql), (search_path or "").replace(" ", ""), tuple(options))
+
+    def _lookup(self, key: Tuple) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - entry.created > self.ttl_s:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def _needs_check(self, entry: _Entry) -> bool:
+        return bool(entry.stamps) and time.monotonic() - entry.checked >= self.stats_check_s
+
+    def _confirm(self, key: Tuple, entry: _Entry, fresh: Optional[Stamps]) -> bool:
+        with self._lock:
+            if fresh is not None and fresh != entry.stamps:
+                if self._data.get(key) is entry:
+                    del self._data[key]
+                self.stale += 1
+                self.misses += 1
+                return False
+            entry.checked = time.monotonic()
+            self.hits += 1
+            return True
+
+    def get(self, key: Tuple, fetch_stamps: Optional[StampsFetcher] = None) -> Optional[Any]:
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        fresh = None
+        if fetch_stamps is not None and self._needs_check(entry):
+            fresh = fetch_stamps(list(entry.stamps))
+        return entry.value if self._confirm(key, entry, fresh) else None
+
+    async def aget(self, key: Tuple, fetch_stamps: Optional[Callable[[List[str]], Awaitable[Stamps]]] = None) -> Optional[Any]:
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        fresh = None
+        if fetch_stamps is not None and self._needs_check(entry):
+            fresh = await fetch_stamps(list(entry.stamps))
+        return entry.value if self._confirm(key, entry, fresh) else None
+
+    def put(self, key: Tuple, value: Any, stamps: Optional[Stamps] = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = _Entry(value, stamps or {})
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, relation: Optional[str] = None) -> int:
+        """Сбросить всё или только планы, затрагивающие relation."""
+        with self._lock:
+            if relation is None:
+                n = len(self._data)
+                self._data.clear()
+                return n
+            rel = relation.strip('"').split(".")[-1]
+            drop = [k for k, e in self._data.items() if rel in e.stamps]
+            for k in drop:
+                del self._data[k]
+            return len(drop)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "stale_invalidations": self.stale,
+            }
+
+
+plan_cache = PlanCache(
+    max_entries=int(os.getenv("PLAN_CACHE_SIZE", "512")),
+    ttl_s=float(os.getenv("PLAN_CACHE_TTL_S", "300")),
+    stats_check_s=float(os.getenv("PLAN_CACHE_STATS_CHECK_S", "5")),
+)
@@ -0,0 +1,123 @@
+# src/db/plan_store.py
+# Контентно-адресуемое хранилище планов EXPLAIN: ключ — sha256 канонического
+# JSON плана, каждый различный план хранится один раз и сжатым (zstd, если
+# установлен пакет zstandard, иначе zlib). Ответы и история ссылаются на
+# план по хэшу вместо того, чтобы тащить мегабайты JSON каждый раз.
+import hashlib, json, os, sqlite3, threading, time, zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from src.db.history import HISTORY_DB
+
+try:  # необязательная зависимость
+    import zstandard
+except ImportError:  # pragma: no cover - зависит от окружения
+    zstandard = None
+
+PLAN_STORE_DB = os.getenv("PLAN_STORE_DB", HISTORY_DB)
+# хэши, уже лежащие в БД: повторный план не сжимаем и не пишем заново
+PLAN_STORE_KNOWN_MAX = int(os.getenv("PLAN_STORE_KNOWN_MAX", "100000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    hash        TEXT    PRIMARY KEY,
+    codec       TEXT    NOT NULL,
+    raw_size    INTEGER NOT NULL,
+    data        BLOB    NOT NULL,
+    created_at  REAL    NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def canonical_json(plan: Any) -> bytes:
+    return json.dumps(plan, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+def plan_hash(plan: Any) -> str:
+    return hashlib.sha256(canonical_json(plan)).hexdigest()
+
+def _compress(raw: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("plan stored with zstd, but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class PlanStore:
+    def __init__(self, path: str = PLAN_STORE_DB, known_max: int = PLAN_STORE_KNOWN_MAX):
+        self.path = path
+        self.known_max = known_max
+        self._known: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_ready = False
+        self.stored = self.deduplicated = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                conn.executescript(_SCHEMA)
+                self._schema_ready = True
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _remember(self, h: str) -> None:
+        with self._lock:
+            self._known[h] = None
+            self._known.move_to_end(h)
+            while len(self._known) > self.known_max:
+                self._known.popitem(last=False)
+
+    def put(self, plan: Any) -> str:
+        """Сохранить план (если его ещё нет) и вернуть его хэш."""
+        raw = canonical_json(plan)
+        h = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            if h in self._known:
+                self._known.move_to_end(h)
+                self.deduplicated += 1
+                return h
+        codec, data = _compress(raw)
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO plans (hash, codec, raw_size, data, created_at) VALUES (?, ?, ?, ?, ?)",
+            (h, codec, len(raw), data, time.time()),
+        )
+        if cur.rowcount:
+            self.stored += 1
+        else:
+            self.deduplicated += 1
+        self._remember(h)
+        return h
+
+    def get(self, h: str) -> Optional[Any]:
+        row = self._conn().execute("SELECT codec, data FROM plans WHERE hash = ?", (h,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(_decompress(row[0], row[1]))
+
+    def stats(self) -> Dict[str, Any]:
+        plans, raw, stored = self._conn().execute(
+            "SELECT count(*), coalesce(sum(raw_size), 0), coalesce(sum(length(data)), 0) FROM plans"
+        ).fetchone()
+        return {
+            "path": self.path,
+            "codec": "zstd" if zstandard is not None else "zlib",
+            "plans": plans,
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "ratio": round(raw / stored, 2) if stored else None,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+        }
+
+
+plan_store = PlanStore()
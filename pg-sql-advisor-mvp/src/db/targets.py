@@ -0,0 +1,255 @@
+# src/db/targets.py
+# Реестр именованных целевых БД (регистрируются со страницы Settings).
+# Для каждой цели лениво создаётся свой AsyncConnectionPool, который
+# переиспользуется между запросами и закрывается после простоя.
+# Пароли в DB_TARGETS_FILE не пишутся: воркер, узнавший о цели из файла,
+# берёт пароль из переменной окружения (password_env, по умолчанию
+# DB_TARGET_<NAME>_PASSWORD).
+import asyncio, json, logging, os, re, time
+from typing import Any, Dict, List, Optional, Set
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+logger = logging.getLogger("pg_sql_advisor")
+
+TARGET_POOL_MAX_SIZE = int(os.getenv("PG_TARGET_POOL_MAX_SIZE", "5"))
+TARGET_IDLE_TIMEOUT_S = float(os.getenv("PG_TARGET_IDLE_TIMEOUT_S", "300"))
+# как часто фоновая задача закрывает простаивающие пулы
+TARGET_SWEEP_S = float(os.getenv("PG_TARGET_SWEEP_S", "30"))
+AUTH_PROBE_TTL_S = float(os.getenv("PG_AUTH_PROBE_TTL_S", "3600"))
+# необязательный JSON-файл с целями: общий для всех воркеров
+TARGETS_FILE = os.getenv("DB_TARGETS_FILE")
+
+
+class UnknownTarget(KeyError):
+    pass
+
+
+def password_env(name: str) -> str:
+    return "DB_TARGET_" + re.sub(r"\W", "_", name).upper() + "_PASSWORD"
+
+def _conn_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "host": params.get("host"),
+        "port": int(params["port"]) if params.get("port") is not None else 5432,
+        "dbname": params.get("database") or params.get("dbname"),
+        "user": params.get("user"),
+        "password": params.get("password"),
+    }
+
+def _without_secret(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in params.items() if k != "password"}
+
+
+class _Target:
+    __slots__ = ("name", "params", "password_env", "conninfo", "pool", "last_used")
+
+    def __init__(self, name: str, params: Dict[str, Any]):
+        self.name = name
+        self.password_env = params.get("password_env") or password_env(name)
+        self.params = _conn_params(params)
+        if self.params["password"] is None:
+            self.params["password"] = os.getenv(self.password_env)
+        self.conninfo = make_conninfo(**{k: v for k, v in self.params.items() if v is not None})
+        self.pool: Optional[AsyncConnectionPool] = None
+        self.last_used = time.monotonic()
+
+    def public(self) -> Dict[str, Any]:
+        p = self.params
+        return {
+            "name": self.name,
+            "host": p["host"], "port": p["port"], "database": p["dbname"], "user": p["user"],
+            "pool_open": self.pool is not None,
+            "idle_s": round(time.monotonic() - self.last_used, 1),
+        }
+
+
+class TargetRegistry:
+    def __init__(self, max_size: int = TARGET_POOL_MAX_SIZE, idle_timeout_s: float = TARGET_IDLE_TIMEOUT_S,
+                 targets_file: Optional[str] = TARGETS_FILE):
+        self.max_size = max_size
+        self.idle_timeout_s = idle_timeout_s
+        self.targets_file = targets_file
+        self._targets: Dict[str, _Target] = {}
+        self._lock = asyncio.Lock()
+        # (host, port, db, user) -> (checked_at, auth_requires_password)
+        self._auth_probe: Dict[tuple, tuple] = {}
+        self._pid = os.getpid()
+        self._sweeper: Optional[asyncio.Task] = None
+        # фоновые закрытия вытесненных пулов: держим ссылки, иначе задачу может собрать GC
+        self._closing: Set[asyncio.Task] = set()
+        self._load_file()
+
+    # ---- реестр ----
+    def _load_file(self) -> None:
+        if not self.targets_file or not os.path.exists(self.targets_file):
+            return
+        try:
+            with open(self.targets_file, "r", encoding="utf-8") as f:
+                data = json.load(f) or {}
+        except Exception as e:
+            logger.warning("targets: cannot read %s: %s", self.targets_file, e)
+            return
+        for name, params in data.items():
+            cur = self._targets.get(name)
+            # пароль, полученный при регистрации в этом воркере, не затираем
+            if cur is None or _without_secret(cur.params) != _without_secret(_conn_params(params)):
+                self._targets[name] = _Target(name, params)
+
+    def _save_file(self) -> None:
+        if not self.targets_file:
+            return
+        data = {n: {**_without_secret(t.params), "database": t.params["dbname"], "password_env": t.password_env}
+                for n, t in self._targets.items()}
+        tmp = self.targets_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.targets_file)
+
+    def has(self, name: str) -> bool:
+        if name not in self._targets:
+            self._load_file()
+        return name in self._targets
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [t.public() for t in self._targets.values()]
+
+    async def register(self, name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._lock:
+            old = self._targets.get(name)
+            new = _Target(name, params)
+            if old is not None and old.params == new.params:
+                return old.public()
+            self._targets[name] = new
+            self._save_file()
+        if old is not None and old.pool is not None:
+            await old.pool.close()
+        return new.public()
+
+    async def unregister(self, name: str) -> bool:
+        async with self._lock:
+            t = self._targets.pop(name, None)
+            if t is not None:
+                self._save_file()
+        if t is not None and t.pool is not None:
+            await t.pool.close()
+        return t is not None
+
+    # ---- пулы ----
+    async def get_pool(self, name: str) -> AsyncConnectionPool:
+        if not self.has(name):
+            raise UnknownTarget(name)
+        t = self._targets[name]
+        t.last_used = time.monotonic()
+        if self._pid != os.getpid():
+            # реестр унаследован через fork: пулы родителя не трогаем, открываем свои
+            for other in self._targets.values():
+                other.pool = None
+            self._pid = os.getpid()
+        if t.pool is None:
+            async with self._lock:
+                if t.pool is None:
+                    p = AsyncConnectionPool(
+                        t.conninfo, min_size=1, max_size=self.max_size,
+                        kwargs={"autocommit": True}, open=False,
+                    )
+                    await p.open(wait=False)
+                    t.pool = p
+        self._evict_idle(skip=name)
+        return t.pool
+
+    def start(self, interval_s: float = TARGET_SWEEP_S) -> None:
+        """Периодически закрывать простаивающие пулы, даже если запросов нет."""
+        if interval_s <= 0 or (self._sweeper is not None and not self._sweeper.done()):
+            return
+        self._sweeper = asyncio.get_running_loop().create_task(self._sweep(interval_s))
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep(self, interval_s: float) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                self._evict_idle()
+            except Exception as e:  # задача не должна умирать из-за одной ошибки
+                logger.exception("targets: sweep failed: %s", e)
+
+    def _evict_idle(self, skip: Optional[str] = None) -> List[str]:
+        now = time.monotonic()
+        evicted = []
+        for t in self._targets.values():
+            if t.name == skip or t.pool is None or now - t.last_used < self.idle_timeout_s:
+                continue
+            st = t.pool.get_stats()
+            if st.get("pool_size", 0) - st.get("pool_available", 0) > 0:
+                continue  # соединения ещё в работе
+            p, t.pool = t.pool, None
+            # закрываем в фоне, чтобы не задерживать текущий запрос
+            task = asyncio.get_running_loop().create_task(p.close())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+            evicted.append(t.name)
+        if evicted:
+            logger.info("targets: closed idle pools %s", evicted)
+        return evicted
+
+    async def close_all(self) -> None:
+        for t in self._targets.values():
+            if t.pool is not None:
+                p, t.pool = t.pool, None
+                await p.close()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    # ---- проверка подключения ----
+    async def check(self, name: str) -> Dict[str, Any]:
+        pool = await self.get_pool(name)
+        async with pool.connection() as conn:
+            return await self._info(conn, self._targets[name])
+
+    async def probe(self, name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Проверить параметры одноразовым соединением, ничего не регистрируя."""
+        t = _Target(name, params)
+        conn = await psycopg.AsyncConnection.connect(t.conninfo, autocommit=True)
+        try:
+            return await self._info(conn, t)
+        finally:
+            await conn.close()
+
+    async def _info(self, conn, t: _Target) -> Dict[str, Any]:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT current_user, current_database(), version()")
+            user, db, version = await cur.fetchone()
+        info = {"ok": True, "target": t.name, "current_user": user, "database": db, "version": version}
+        info["auth_requires_password"] = await self._probe_auth(t)
+        if not info["auth_requires_password"]:
+            info["note"] = "Подключение успешно даже с неверным паролем: вероятно trust/peer-авторизация."
+        return info
+
+    async def _probe_auth(self, t: _Target) -> bool:
+        # негативная проверка неверным паролем — дорогой handshake, кэшируем результат
+        p = t.params
+        key = (p["host"], p["port"], p["dbname"], p["user"])
+        cached = self._auth_probe.get(key)
+        if cached and time.monotonic() - cached[0] < AUTH_PROBE_TTL_S:
+            return cached[1]
+        wrong = dict(p, password=str(p.get("password") or "") + "_wrong_" + os.urandom(4).hex())
+        try:
+            c = await psycopg.AsyncConnection.connect(**wrong, autocommit=True)
+            await c.close()
+            requires = False
+        except Exception:
+            requires = True
+        self._auth_probe[key] = (time.monotonic(), requires)
+        return requires
+
+
+targets = TargetRegistry()
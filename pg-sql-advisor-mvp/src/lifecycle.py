@@ -0,0 +1,51 @@
+# src/lifecycle.py
+# Жизненный цикл API-процесса:
+#   * импорт src.app ничего не загружает и не подключается к БД;
+#   * preload() — правила и каталог feature_kinds: один раз в мастере до fork
+#     (gunicorn on_starting, см. gunicorn.conf.py) или в lifespan воркера;
+#   * пулы соединений открываются в воркере при первом обращении.
+import gc, logging, threading
+from contextlib import asynccontextmanager
+from src.advisor.feature_catalog import load_feature_kinds
+from src.advisor.rules_manager import RulesetManager
+from src.db import pg, pg_async
+from src.db.history import history
+from src.db.targets import targets
+
+logger = logging.getLogger("pg_sql_advisor")
+
+rules_manager = RulesetManager()
+
+_preload_lock = threading.Lock()
+_preloaded = False
+
+def preload(freeze: bool = False) -> None:
+    """Загрузить и «заморозить» неизменяемые данные. Повторный вызов — no-op."""
+    global _preloaded
+    with _preload_lock:
+        if _preloaded:
+            return
+        kinds = load_feature_kinds()
+        rules_manager.reload()
+        _preloaded = True
+        logger.info("preload: %d feature kinds, rules v%s", len(kinds), rules_manager.current.version)
+    if freeze:
+        # перенести загруженные объекты в permanent generation: GC воркеров
+        # не будет их трогать и copy-on-write страницы останутся общими
+        gc.collect()
+        gc.freeze()
+
+@asynccontextmanager
+async def lifespan(app):
+    preload()
+    rules_manager.start()
+    history.start()
+    targets.start()
+    try:
+        yield
+    finally:
+        rules_manager.stop()
+        history.stop()
+        await targets.stop()
+        await pg_async.close_pool()
+        pg.close_pool()
@@ -45,6 +45,7 @@ class AdviseInput(BaseModel):
     statsUsed: Optional[List[StatRef]] = []
     dbSettings: Optional[Dict[str, Any]] = {}
     sqlText: Optional[str] = None
+    plan: Optional[Dict[str, Any]] = None   # EXPLAIN JSON: доказательства из плана в отчёте
 
 class Recommendation(BaseModel):
     id: str
@@ -0,0 +1,140 @@
+# src/utils/admission.py
+# Admission control: у каждого класса запросов свой бюджет одновременных
+# выполнений и своя ограниченная очередь ожидания. Тяжёлый EXPLAIN ANALYZE
+# упирается в собственный бюджет и не отнимает слоты у дешёвых EXPLAIN и
+# /advise. Переполненная очередь — быстрый отказ (429 + Retry-After),
+# а не бесконечное ожидание; время в очереди — в Server-Timing и /metrics.
+import asyncio, math, os, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict
+from src.utils.metrics import counter, histogram, record_stage, register_collector
+
+# класс -> (одновременно, мест в очереди)
+_DEFAULTS = {
+    "analyze": (2, 8),     # EXPLAIN ANALYZE: реально выполняет запрос
+    "explain": (8, 64),    # EXPLAIN без выполнения
+    "run": (4, 32),        # /sql/run
+    "advise": (16, 256),   # чистое применение правил (CPU, threadpool)
+}
+
+ADMISSION_WAIT_SECONDS = histogram("advisor_admission_wait_seconds", "Time spent in the admission queue", ("klass",),
+                                   buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0))
+ADMISSION_REJECTED = counter("advisor_admission_rejected_total", "Requests rejected with 429", ("klass",))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, klass: str, retry_after: int):
+        super().__init__(f"{klass}: queue is full")
+        self.klass = klass
+        self.retry_after = retry_after
+
+
+class Budget:
+    """Семафор с ограниченной FIFO-очередью; слот передаётся ожидающему напрямую."""
+
+    def __init__(self, name: str, limit: int, queue_max: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_max = max(0, queue_max)
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_s = 0.1   # EWMA времени выполнения — для Retry-After
+        self.admitted = self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        # сколько «поколений» слотов должно смениться, прежде чем подойдёт новая очередь
+        return max(1, math.ceil((self.queued + 1) / self.limit * self._service_s))
+
+    def _release(self) -> None:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)   # active не меняется: слот переходит к ожидающему
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, reject: bool = True) -> AsyncIterator[None]:
+        """reject=False — ждать без отказа (элементы batch уже ограничены своим семафором)."""
+        t0 = time.perf_counter()
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+        else:
+            if reject and self.queued >= self.queue_max:
+                self.rejected += 1
+                ADMISSION_REJECTED.inc(klass=self.name)
+                raise AdmissionRejected(self.name, self.retry_after())
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self._release()   # слот уже был передан нам — отдаём следующему
+                else:
+                    try:
+                        self._waiters.remove(fut)
+                    except ValueError:
+                        pass
+                raise
+        waited = time.perf_counter() - t0
+        self.admitted += 1
+        ADMISSION_WAIT_SECONDS.observe(waited, klass=self.name)
+        record_stage("queue", waited)
+        t_run = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._service_s = 0.8 * self._service_s + 0.2 * (time.perf_counter() - t_run)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "queue_max": self.queue_max,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_service_ms": round(self._service_s * 1000, 2),
+        }
+
+
+class AdmissionController:
+    def __init__(self, budgets: Dict[str, Budget]):
+        self.budgets = budgets
+
+    def slot(self, klass: str, reject: bool = True):
+        return self.budgets[klass].slot(reject)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: b.stats() for name, b in self.budgets.items()}
+
+
+def _from_env() -> AdmissionController:
+    budgets = {}
+    for name, (limit, queue_max) in _DEFAULTS.items():
+        env = name.upper()
+        budgets[name] = Budget(name,
+                               int(os.getenv(f"ADMISSION_{env}_CONCURRENCY", str(limit))),
+                               int(os.getenv(f"ADMISSION_{env}_QUEUE", str(queue_max))))
+    return AdmissionController(budgets)
+
+
+admission = _from_env()
+
+
+@register_collector
+def _admission_metrics():
+    budgets = admission.budgets.values()
+    return [
+        ("advisor_admission_active", "Requests executing per class", "gauge",
+         [({"klass": b.name}, b.active) for b in budgets]),
+        ("advisor_admission_queued", "Requests waiting per class", "gauge",
+         [({"klass": b.name}, b.queued) for b in budgets]),
+    ]
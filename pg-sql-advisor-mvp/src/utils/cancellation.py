@@ -0,0 +1,55 @@
+# src/utils/cancellation.py
+# Отмена запроса, который больше никому не нужен: клиент закрыл соединение
+# или истёк дедлайн. Корутина обработчика отменяется с причиной в
+# CancelledError, а слой БД (src.db.pg_async) по этой причине отменяет
+# запрос на сервере и сразу освобождает соединение пула.
+import asyncio, os
+from contextlib import suppress
+from typing import Any, Awaitable, Optional
+
+# как часто проверять, что клиент ещё на связи
+DISCONNECT_POLL_MS = int(os.getenv("DISCONNECT_POLL_MS", "250"))
+# дедлайн запроса по умолчанию (0 — только по отключению клиента)
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "0"))
+
+REASONS = ("disconnect", "deadline")
+
+
+class RequestAbandoned(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def cancel_reason(exc: BaseException) -> str:
+    """Причина из CancelledError(msg); всё прочее (shutdown и т.п.) — 'cancelled'."""
+    msg = exc.args[0] if exc.args else None
+    return msg if msg in REASONS else "cancelled"
+
+async def _wait_disconnect(request: Any) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_MS / 1000)
+
+async def run_cancellable(request: Any, coro: Awaitable[Any], deadline_ms: Optional[int] = None) -> Any:
+    """
+    Выполнить coro, пока клиент на связи и не истёк дедлайн. Иначе — отменить
+    её (с причиной), дождаться отмены запроса в БД и бросить RequestAbandoned.
+    """
+    deadline_ms = deadline_ms or REQUEST_DEADLINE_MS
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, timeout=deadline_ms / 1000 if deadline_ms else None,
+                                     return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task in done:
+        return task.result()
+    reason = "disconnect" if watcher in done else "deadline"
+    task.cancel(reason)
+    with suppress(asyncio.CancelledError, Exception):
+        await task
+    raise RequestAbandoned(reason)
@@ -0,0 +1,235 @@
+# src/utils/metrics.py
+# Лёгкая инструментовка без внешних сервисов:
+#   * stage(name) — замер этапа запроса; суммы этапов уходят в заголовок
+#     Server-Timing и в гистограмму advisor_stage_seconds;
+#   * Counter/Histogram в памяти процесса, экспорт — GET /metrics в
+#     текстовом формате Prometheus;
+#   * значения «по требованию» (размер пула и т.п.) собирают коллекторы
+#     в момент выдачи /metrics, а не на каждом запросе.
+# METRICS_ENABLED=0 превращает всё в no-op.
+import os, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# тайминги этапов текущего HTTP-запроса: stage -> секунды
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("advisor_timings", default=None)
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts по бакетам (+Inf последним), sum]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            st = self._values.get(key)
+            if st is None:
+                st = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            st[0][i] += 1
+            st[1] += value
+
+    def count(self, **labels: Any) -> int:
+        st = self._values.get(self._key(labels))
+        return sum(st[0]) if st else 0
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        out = []
+        for key, (counts, total) in items:
+            acc = 0
+            for le, c in zip((*map(_fmt_num, self.buckets), "+Inf"), counts):
+                acc += c
+                le_label = 'le="%s"' % le
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le_label)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {acc}")
+        return out
+
+
+# коллектор: () -> [(name, help, type, [(labels, value)])]
+Collector = Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict[str, Any], float]]]]]
+
+_METRICS: List[_Metric] = []
+_COLLECTORS: List[Collector] = []
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    m = Counter(name, help, labelnames)
+    _METRICS.append(m)
+    return m
+
+def histogram(name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    m = Histogram(name, help, labelnames, buckets)
+    _METRICS.append(m)
+    return m
+
+def register_collector(fn: Collector) -> Collector:
+    _COLLECTORS.append(fn)
+    return fn
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for m in _METRICS:
+        body = m.expose()
+        if body:
+            lines += m.header() + body
+    for fn in _COLLECTORS:
+        try:
+            families = list(fn())
+        except Exception:  # сломанный коллектор не должен ронять /metrics
+            continue
+        for name, help, kind, samples in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                names = tuple(labels)
+                lines.append(f"{name}{_fmt_labels(names, tuple(labels[n] for n in names))} {_fmt_num(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- метрики сервиса ----------
+REQUEST_SECONDS = histogram("advisor_request_seconds", "HTTP request latency", ("method", "route", "status"))
+STAGE_SECONDS = histogram("advisor_stage_seconds", "Time spent per request stage", ("stage",))
+DB_SECONDS = histogram("advisor_db_seconds", "Time spent in PostgreSQL per statement group", ("op",))
+POOL_WAIT_SECONDS = histogram("advisor_pool_wait_seconds", "Time waiting for a pooled connection", ("pool",),
+                              buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+QUERY_CANCELLATIONS = counter("advisor_query_cancellations_total",
+                              "Backend queries cancelled because the request was abandoned", ("reason",))
+RULE_MATCHES = counter("advisor_rule_matches_total", "Recommendations produced per rule", ("rule_id",))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Замер этапа: гистограмма + накопление для Server-Timing текущего запроса."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, stage=name)
+        t = _timings.get()
+        if t is not None:
+            t[name] = t.get(name, 0.0) + dt
+
+def record_stage(name: str, seconds: float) -> None:
+    """Для этапов, время которых уже измерено (например, ожидание пула)."""
+    if not METRICS_ENABLED:
+        return
+    t = _timings.get()
+    if t is not None:
+        t[name] = t.get(name, 0.0) + seconds
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    parts = [f"{name};dur={dt * 1000:.2f}" for name, dt in timings.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def _route_of(scope: Dict[str, Any]) -> str:
+    # шаблон маршрута, а не сырой путь: /history/{analysis_id}, а не /history/123
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        return getattr(endpoint, "__name__", "unknown")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность запросов и заголовок Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+        t0 = time.perf_counter()
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", server_timing(timings, time.perf_counter() - t0).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _timings.reset(token)
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, method=scope.get("method", ""),
+                                    route=_route_of(scope), status=status["code"])
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# история анализов в тестах пишется во временный каталог, а не в var/ репозитория
+os.environ.setdefault("HISTORY_DB", os.path.join(tempfile.mkdtemp(prefix="advisor-history-"), "history.sqlite3"))
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.app import app
+from src.utils.admission import AdmissionRejected, Budget, admission
+
+
+def test_budget_queues_then_rejects_and_hands_over():
+    async def scenario():
+        b = Budget("t", limit=1, queue_max=1)
+        order = []
+        release = asyncio.Event()
+
+        async def holder():
+            async with b.slot():
+                order.append("holder")
+                await release.wait()
+
+        async def waiter(reject=True):
+            async with b.slot(reject):
+                order.append("waiter")
+
+        h = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        w = asyncio.ensure_future(waiter())
+        await asyncio.sleep(0)
+        assert (b.active, b.queued) == (1, 1)
+        with pytest.raises(AdmissionRejected) as ei:
+            async with b.slot():
+                pass
+        assert ei.value.retry_after >= 1
+        # без отказа — ждёт даже при полной очереди
+        nr = asyncio.ensure_future(waiter(reject=False))
+        await asyncio.sleep(0)
+        assert b.queued == 2
+        release.set()
+        await asyncio.gather(h, w, nr)
+        assert order == ["holder", "waiter", "waiter"]
+        assert (b.active, b.queued, b.rejected) == (0, 0, 1)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        b = Budget("t", limit=1, queue_max=4)
+        async with b.slot():
+            w = asyncio.ensure_future(b.slot().__aenter__())
+            await asyncio.sleep(0)
+            w.cancel()
+            await asyncio.sleep(0)
+            assert b.queued == 0
+        assert b.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_returns_429_with_retry_after():
+    b = admission.budgets["advise"]
+    saved = (b.active, b.queue_max)
+    b.active, b.queue_max = b.limit, 0
+    try:
+        r = TestClient(app).post("/advise", json={"features": []})
+    finally:
+        b.active, b.queue_max = saved
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+
+
+def test_measure_explains_wait_for_explain_slot(monkeypatch):
+    import src.app as app_mod
+
+    seen = {}
+
+    async def fake_explain(sql, analyze, timeout_ms, search_path, target=None, generic_plan=False, reject=True):
+        seen["reject"] = reject
+        return {"plan": [{"Plan": {"Total Cost": 10.0, "Plan Rows": 1}}]}
+
+    async def fake_explain_set(sql, settings, **kw):
+        seen["explain_active"] = admission.budgets["explain"].active
+        return {"plan": [{"Plan": {"Total Cost": 5.0, "Plan Rows": 1}}]}
+
+    monkeypatch.setattr(app_mod, "_explain_for_advise", fake_explain)
+    monkeypatch.setattr(app_mod, "explain_with_settings_async", fake_explain_set)
+    item = app_mod.AdviseSqlIn(sql="SELECT 1", measure_gain=True)
+    rec = {"rule_id": "R_SORT_SPILL", "type": "db_setting", "title": "t",
+           "action": {"alter": "SET LOCAL work_mem = '128MB';"}, "expected_gain": {}}
+    res = {"recommendations": [rec], "features": [], "plan": {}, "risk": {"score": 0, "severity": "info"}}
+    asyncio.run(app_mod._measure(item, res))
+    assert seen == {"reject": False, "explain_active": 1}
+    assert rec["expected_gain"]["value"]["cost_delta"] == -5.0
+    assert admission.budgets["explain"].active == 0
+
+
+def test_explain_for_advise_takes_explain_slot(monkeypatch):
+    import src.app as app_mod
+
+    async def fake_explain_sql(sql, **kw):
+        return {"plan": [{"Plan": {"Total Cost": 1.0}}], "active": admission.budgets["explain"].active}
+
+    monkeypatch.setattr(app_mod, "explain_sql_async", fake_explain_sql)
+    res = asyncio.run(app_mod._explain_for_advise("SELECT 1", False, 1000, None))
+    assert res["active"] == 1 and admission.budgets["explain"].active == 0
@@ -8,3 +8,147 @@ def test_health():
     resp = client.get("/health")
     assert resp.status_code == 200
     assert resp.json()["ok"] == True
+
+def test_advise_batch():
+    item = {"features": [{"nodeId": 1, "kind": "seq_scan_big_table", "relation": "users", "selectivity": 0.01}]}
+    resp = client.post("/advise/batch", json={"items": [item, {"features": []}]})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["count"] == 2
+    assert body["results"][0]["risk"]["drivers"] == ["R_SEQ_SCAN_BIG_TABLE"]
+    assert body["results"][1]["recommendations"] == []
+
+
+def test_advise_workload_offline_snapshot():
+    def scan(rel):
+        return [{"Plan": {"Node Type": "Seq Scan", "Relation Name": rel, "Plan Rows": 500_000,
+                          "Filter": "(to_char(created_at, 'YYYY-MM-DD'::text) >= '2024-01-01'::text)"}}]
+    snapshot = [
+        {"queryid": "1", "query": "SELECT * FROM users WHERE ...", "calls": 10, "total_exec_time": 900, "plan": scan("users")},
+        {"queryid": "2", "query": "SELECT * FROM users WHERE ... LIMIT 1", "calls": 5, "total_exec_time": 100, "plan": scan("users")},
+        {"queryid": "3", "query": "BEGIN", "calls": 99, "total_exec_time": 0},
+    ]
+    resp = client.post("/advise/workload", json={"source": "snapshot", "snapshot": snapshot, "top_n": 5})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["snapshot"]["statements"] == 3
+    assert body["coverage"] == 1.0
+    top = body["recommendations"][0]
+    assert top["rule_id"] == "R_CAST_PREVENTS_INDEX"
+    assert top["weight"] == 1.0 and top["queries"] == ["1", "2"]
+
+
+def test_advise_result_cache_hits_on_repeated_payload():
+    from src.advisor.result_cache import result_cache
+    result_cache.clear()
+    payload = {"features": [{"nodeId": 1, "kind": "seq_scan_big_table", "relation": "public.cache_t",
+                             "estRows": 500_000, "selectivity": 0.01}]}
+    first = client.post("/advise", json=payload).json()
+    before = result_cache.stats()
+    second = client.post("/advise", json=payload).json()
+    after = result_cache.stats()
+    assert second == first
+    assert after["hits"] == before["hits"] + 1 and after["size"] == 1
+    # другое число в фиче — другой ключ, хотя fingerprint совпадает
+    payload["features"][0]["estRows"] = 10
+    client.post("/advise", json=payload)
+    assert result_cache.stats()["size"] == 2
+
+
+def test_advise_result_cache_does_not_mix_close_payloads():
+    from src.advisor.result_cache import result_cache
+    result_cache.clear()
+    spill = {"nodeId": 1, "kind": "sort_spill_risk", "memEstMB": 4.0, "workMemMB": 4.0}
+    assert client.post("/advise", json={"features": [spill]}).json()["recommendations"] == []
+    recs = client.post("/advise", json={"features": [dict(spill, memEstMB=4.9)]}).json()["recommendations"]
+    assert [r["rule_id"] for r in recs] == ["R_SORT_SPILL"]
+
+    fk = {"nodeId": 1, "kind": "fk_missing_index", "relation": "orders"}
+    for col in ("b", "c"):
+        recs = client.post("/advise", json={"features": [dict(fk, fkCol=col)]}).json()["recommendations"]
+        assert recs[0]["action"]["ddl"] == f"CREATE INDEX CONCURRENTLY idx_public_orders_{col}_fk ON public.orders({col});"
+
+
+def test_advise_workload_bad_plan_is_per_item_error():
+    snapshot = [
+        {"queryid": "1", "query": "SELECT * FROM a", "calls": 1, "total_exec_time": 50, "plan": "{not json"},
+        {"queryid": "2", "query": "SELECT * FROM b", "calls": 1, "total_exec_time": 50,
+         "plan": [{"Plan": {"Node Type": "Result", "Plan Rows": 1}}]},
+    ]
+    resp = client.post("/advise/workload", json={"source": "snapshot", "snapshot": snapshot})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["failed"] == 1
+    bad = next(q for q in body["queries"] if q["queryid"] == "1")
+    assert not bad["ok"] and "invalid plan JSON" in bad["error"]
+
+
+def test_advise_workload_share_is_of_whole_db_time():
+    # live-снимок обрезан LIMIT: строки покрывают 100 мс из 1000 мс времени БД
+    snapshot = [{"queryid": "1", "query": "SELECT * FROM a", "calls": 1, "total_exec_time": 100,
+                 "db_total_exec_time": 1000, "plan": [{"Plan": {"Node Type": "Result", "Plan Rows": 1}}]}]
+    body = client.post("/advise/workload", json={"source": "snapshot", "snapshot": snapshot}).json()
+    assert body["snapshot"]["total_exec_time_ms"] == 1000
+    assert body["queries"][0]["share"] == 0.1 and body["coverage"] == 0.1
+
+
+@pytest.fixture
+def fake_sql_batch(monkeypatch):
+    """async-слой БД подменён: EXPLAIN отдаёт готовый план, 'bad' — ошибка одного элемента."""
+    import asyncio
+    import src.app as app_mod
+
+    state = {"active": 0, "peak": 0}
+
+    async def fake_explain(sql, **kwargs):
+        if "bad" in sql:
+            raise RuntimeError("syntax error at or near \"bad\"")
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        return {"plan": [{"Plan": {"Node Type": "Seq Scan", "Relation Name": "users", "Plan Rows": 500_000,
+                                   "Total Cost": 1000.0}}]}
+
+    monkeypatch.setattr(app_mod, "explain_sql_async", fake_explain)
+    monkeypatch.setattr(app_mod, "CATALOG_ENABLED", False)
+    monkeypatch.setattr(app_mod.plan_store, "put", lambda plan: "h")
+    monkeypatch.setattr(app_mod.history, "record", lambda rec: None)
+    return state
+
+
+def test_advise_sql_batch_isolates_item_failures(fake_sql_batch):
+    items = [{"sql": "SELECT * FROM users"}, {"sql": "bad"}, {"sql": "SELECT * FROM users WHERE id > 0"}]
+    body = client.post("/advise/sql/batch", json={"items": items}).json()
+    assert (body["count"], body["failed"]) == (3, 1)
+    assert [r["index"] for r in body["results"]] == [0, 1, 2]
+    ok0, bad, ok2 = body["results"]
+    assert ok0["ok"] and ok2["ok"] and "recommendations" in ok0
+    assert not bad["ok"] and "syntax error" in bad["error"]
+
+
+def test_advise_sql_batch_clamps_concurrency(fake_sql_batch, monkeypatch):
+    import src.app as app_mod
+    monkeypatch.setattr(app_mod, "BATCH_CONCURRENCY", 2)
+    items = [{"sql": f"SELECT * FROM users WHERE id = {i}"} for i in range(6)]
+    body = client.post("/advise/sql/batch", json={"items": items, "concurrency": 50}).json()
+    assert body["concurrency"] == 2 and body["failed"] == 0
+    assert fake_sql_batch["peak"] <= 2
+    assert client.post("/advise/sql/batch", json={"items": items[:1], "concurrency": -3}).json()["concurrency"] == 1
+    assert client.post("/advise/sql/batch", json={"items": items[:1]}).json()["concurrency"] == 2
+
+
+def test_advise_sql_batch_timings_shape(fake_sql_batch):
+    body = client.post("/advise/sql/batch", json={"items": [{"sql": "SELECT * FROM users"}, {"sql": "bad"}]}).json()
+    assert set(body["timings"]) == {"total_ms"} and body["timings"]["total_ms"] >= 0
+    ok, bad = body["results"]
+    assert set(ok["timings"]) == {"explain_ms", "advise_ms"}
+    # упавший на EXPLAIN элемент не успел ничего замерить
+    assert bad["timings"] == {}
+
+
+def test_advise_sql_batch_plan_mode_hash(fake_sql_batch):
+    items = [{"sql": "SELECT * FROM users", "plan_mode": "hash"}, {"sql": "SELECT * FROM users"}]
+    hashed, full = client.post("/advise/sql/batch", json={"items": items}).json()["results"]
+    assert "plan" not in hashed and hashed["plan_hash"] == "h"
+    assert full["plan"] and full["plan_hash"] == "h"
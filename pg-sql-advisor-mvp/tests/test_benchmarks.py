@@ -0,0 +1,23 @@
+import copy
+
+from benchmarks.corpus import SHAPES, count_nodes
+from benchmarks.run import compare, run
+
+
+def test_corpus_sizes():
+    for shape, gen in SHAPES.items():
+        for n in (10, 1_000):
+            assert abs(count_nodes(gen(n)) - n) <= 2, shape
+
+
+def test_run_and_compare_offline():
+    res = run(sizes=[10], shapes=["to_char_scans"], rule_counts=[10, 100], repeat=1)
+    keys = set(res["results"])
+    assert {"plan_to_features/to_char_scans/10", "apply_rules/to_char_scans/10/rules=100",
+            "render_report/to_char_scans/10"} <= keys
+    assert compare(res, res, threshold=0.25) == []
+    slower = copy.deepcopy(res)
+    for r in slower["results"].values():
+        r["best_s"] = r["best_s"] * 3 + 0.01
+    bad = compare(res, slower, threshold=0.25)
+    assert len(bad) == len(keys)
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from src.utils import cancellation
+from src.utils.cancellation import RequestAbandoned, cancel_reason, run_cancellable
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after: float = None):
+        self.disconnect_after = disconnect_after
+        self.t0 = None
+
+    async def is_disconnected(self) -> bool:
+        loop = asyncio.get_running_loop()
+        self.t0 = self.t0 or loop.time()
+        return self.disconnect_after is not None and loop.time() - self.t0 >= self.disconnect_after
+
+
+def _scenario(request, deadline_ms):
+    seen = []
+
+    async def slow_query():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError as e:
+            seen.append(cancel_reason(e))   # так же причину видит слой БД
+            raise
+
+    async def main():
+        with pytest.raises(RequestAbandoned) as ei:
+            await run_cancellable(request, slow_query(), deadline_ms)
+        return ei.value.reason
+
+    return asyncio.run(main()), seen
+
+
+def test_deadline_cancels_query():
+    reason, seen = _scenario(FakeRequest(), 50)
+    assert reason == "deadline" and seen == ["deadline"]
+
+
+def test_disconnect_cancels_query(monkeypatch):
+    monkeypatch.setattr(cancellation, "DISCONNECT_POLL_MS", 10)
+    reason, seen = _scenario(FakeRequest(disconnect_after=0.03), None)
+    assert reason == "disconnect" and seen == ["disconnect"]
+
+
+def test_finished_query_returns_result():
+    async def fast():
+        return 42
+    assert asyncio.run(run_cancellable(FakeRequest(), fast(), 1000)) == 42
@@ -0,0 +1,191 @@
+import asyncio
+
+from src.advisor.rule_engine import apply_rules
+from src.advisor.rules_loader import load_rules
+from src.analyzer.extract import plan_stats_used, plan_to_features
+from src.db.catalog import CatalogCache, build_snapshot
+from src.models import AdviseInput
+
+
+def _snapshot():
+    return build_snapshot({
+        "relations": [
+            {"oid": 1, "schema": "sales", "relname": "orders", "visible": True, "reltuples": 1_000_000,
+             "relpages": 40_000, "n_live_tup": 1_000_000, "n_dead_tup": 400_000, "n_mod_since_analyze": 300_000,
+             "last_analyze": None, "last_autoanalyze": "2024-01-01 00:00:00+00"},
+            {"oid": 2, "schema": "public", "relname": "users", "visible": True, "reltuples": 5_000,
+             "relpages": 50, "n_live_tup": 5_000, "n_dead_tup": 10, "n_mod_since_analyze": 0,
+             "last_analyze": "2024-01-02 00:00:00+00", "last_autoanalyze": None},
+        ],
+        "indexes": [{"oid": 1, "name": "orders_user_idx", "cols": ["user_id"], "unique": False, "partial": False}],
+        "fks": [
+            {"oid": 1, "name": "orders_user_fk", "cols": ["user_id"], "ref_table": "users"},
+            {"oid": 1, "name": "orders_shop_fk", "cols": ["shop_id", "region_id"], "ref_table": "shops"},
+        ],
+        "ext_stats": [],
+        "stats": [
+            {"schema": "sales", "relname": "orders", "attname": a, "null_frac": 0.0, "avg_width": 8,
+             "n_distinct": nd, "correlation": 0.1}
+            for a, nd in (("status", 5), ("region_id", 80), ("user_id", -0.2), ("shop_id", 300))
+        ],
+    })
+
+PLAN = {"Plan": {"Node Type": "Nested Loop", "Plan Rows": 1, "Plans": [
+    {"Node Type": "Seq Scan", "Relation Name": "orders", "Plan Rows": 1,
+     "Filter": "((status = 'new'::text) AND (region_id = 7))"},
+    {"Node Type": "Index Scan", "Relation Name": "users", "Plan Rows": 1, "Index Cond": "(id = orders.user_id)"},
+]}}
+
+
+def test_catalog_features_from_snapshot():
+    feats = plan_to_features(PLAN, "", catalog=_snapshot())
+    kinds = {f["kind"]: f for f in feats}
+    assert kinds["outdated_stats"]["relation"] == "sales.orders"
+    assert kinds["dead_tuples_high"]["deadTup"] == 400_000
+    assert kinds["table_bloat_high"]["bloatRatio"] >= 2
+    assert kinds["missing_multicol_stats"]["cols"] == ["status", "region_id"]
+    # FK по user_id покрыт индексом, составной — нет
+    fks = [f for f in feats if f["kind"] == "fk_missing_index"]
+    assert [f["fkCols"] for f in fks] == [["shop_id", "region_id"]]
+    # users в порядке: ни одной табличной фичи
+    assert all(f["relation"] != "public.users" for f in feats)
+
+    used = plan_stats_used(PLAN, _snapshot())
+    assert {(u["table"], u["columns"][0]) for u in used} == {("sales.orders", "status"), ("sales.orders", "region_id")}
+
+    recs, _ = apply_rules(AdviseInput(features=feats, statsUsed=used), load_rules())
+    ddl = {r["rule_id"]: r["action"]["ddl"] for r in recs}
+    assert ddl["R_FK_MISSING_INDEX"] == \
+        "CREATE INDEX CONCURRENTLY idx_sales_orders_shop_id_region_id_fk ON sales.orders(shop_id, region_id);"
+    assert ddl["R_MISSING_MULTICOL_STATS"].startswith(
+        "CREATE STATISTICS st_sales_orders_status_region_id (dependencies, ndistinct, mcv) ON status, region_id")
+    assert ddl["R_DEAD_TUPLES_HIGH"] == "VACUUM (ANALYZE) sales.orders;"
+
+
+def test_plan_without_catalog_is_unchanged():
+    assert plan_to_features(PLAN, "") == plan_to_features(PLAN, "", catalog=None)
+    assert all(f["kind"] != "outdated_stats" for f in plan_to_features(PLAN, ""))
+
+
+def test_cache_fetches_in_bulk_and_refreshes_changed_relations():
+    calls = {"fetch": [], "probe": 0}
+    stamps = {"a": 1, "b": 1}
+
+    async def fetch(rels, target, search_path):
+        calls["fetch"].append(list(rels))
+        return {r: {"schema": "public", "_stamp": stamps[r]} for r in rels if r in stamps}
+
+    async def probe(rels, target, search_path):
+        calls["probe"] += 1
+        return {r: stamps[r] for r in rels if r in stamps}
+
+    async def scenario():
+        cache = CatalogCache(ttl_s=60, check_s=0, fetch=fetch, probe=probe)
+        first = await cache.get(["a", "b", "cte"])
+        assert set(first) == {"a", "b"} and calls["fetch"] == [["a", "b", "cte"]]
+        await cache.get(["a", "b", "cte"])
+        assert len(calls["fetch"]) == 1 and calls["probe"] == 1
+        stamps["b"] = 2   # ANALYZE/DDL на b
+        await cache.get(["a", "b"])
+        assert calls["fetch"][-1] == ["b"]
+        assert cache.stats()["stale"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cache_is_keyed_by_search_path():
+    # orders есть и в public, и в app: какая видима — решает search_path запроса
+    schemas = {"public": "public", "app, public": "app"}
+    seen = []
+
+    async def fetch(rels, target, search_path):
+        seen.append(search_path)
+        return {r: {"schema": schemas[search_path or "public"], "_stamp": 1} for r in rels}
+
+    async def probe(rels, target, search_path):
+        return {r: 1 for r in rels}
+
+    async def scenario():
+        cache = CatalogCache(ttl_s=60, check_s=60, fetch=fetch, probe=probe)
+        assert (await cache.get(["orders"], None, "public"))["orders"]["schema"] == "public"
+        assert (await cache.get(["orders"], None, "app, public"))["orders"]["schema"] == "app"
+        assert (await cache.get(["orders"], None, "public"))["orders"]["schema"] == "public"
+        assert seen == ["public", "app, public"]
+        assert cache.invalidate("orders") == 2
+
+    asyncio.run(scenario())
+
+
+def test_catalog_queries_run_under_request_search_path(monkeypatch):
+    from contextlib import asynccontextmanager
+    from src.db import catalog
+
+    log = []
+
+    class Cur:
+        async def execute(self, sql, params=None):
+            log.append("query")
+
+        async def fetchall(self):
+            return []
+
+        async def close(self):
+            pass
+
+    class Conn:
+        async def execute(self, sql, params=None):
+            log.append(("set_config", params))
+
+        def cursor(self, row_factory=None):
+            return Cur()
+
+        @asynccontextmanager
+        async def transaction(self):
+            log.append("BEGIN")
+            yield
+            log.append("COMMIT")
+
+        @asynccontextmanager
+        async def pipeline(self):
+            yield
+
+    @asynccontextmanager
+    async def connection(pool, target):
+        yield Conn()
+
+    async def resolve(target):
+        return None
+
+    monkeypatch.setattr(catalog, "resolve_pool", resolve)
+    monkeypatch.setattr(catalog, "_connection", connection)
+    asyncio.run(catalog.fetch_stamps_async(["orders"], None, "app, public"))
+    assert log == ["BEGIN", ("set_config", ["search_path", "app, public"]), "query", "COMMIT"]
+
+
+def test_workload_passes_catalog_to_advise(monkeypatch):
+    from fastapi.testclient import TestClient
+    import src.app as app_mod
+
+    calls = []
+
+    async def fake_catalog_get(rels, target=None, search_path=None):
+        calls.append((sorted(rels), search_path))
+        return _snapshot()
+
+    async def fake_pgss(target=None):
+        return [{"queryid": "1", "query": "SELECT * FROM orders", "calls": 1, "total_exec_time": 10,
+                 "plan": [PLAN]}]
+
+    monkeypatch.setattr(app_mod, "CATALOG_ENABLED", True)
+    monkeypatch.setattr(app_mod.catalog_cache, "get", fake_catalog_get)
+    monkeypatch.setattr(app_mod, "fetch_pg_stat_statements_async", fake_pgss)
+    client = TestClient(app_mod.app)
+    body = client.post("/advise/workload", json={"source": "live", "searchPath": "sales, public"}).json()
+    assert calls == [(["orders", "users"], "sales, public")]
+    assert "R_DEAD_TUPLES_HIGH" in body["queries"][0]["rule_ids"]
+
+    # файловый снимок без target каталог не трогает
+    snapshot = [{"queryid": "1", "query": "SELECT * FROM orders", "calls": 1, "total_exec_time": 10,
+                 "plan": [PLAN]}]
+    client.post("/advise/workload", json={"source": "snapshot", "snapshot": snapshot})
+    assert len(calls) == 1
@@ -0,0 +1,38 @@
+import time
+
+from src.models import AdviseInput
+from src.advisor.explainer import render_report
+from src.advisor.rule_engine import apply_rules
+from src.advisor.risk_score import aggregate_score
+from src.advisor.rules_loader import load_rules
+
+RULES = load_rules()
+
+
+def _payload(n_nodes: int) -> AdviseInput:
+    # Append над партициями: у каждой партиции свой Seq Scan и своя фича
+    scans = [{"Node Type": "Seq Scan", "Relation Name": f"orders_p{i}", "Plan Rows": 500_000,
+              "Filter": "(status = 'new'::text)", "Total Cost": 1000.0} for i in range(n_nodes - 1)]
+    feats = [{"nodeId": i + 1, "kind": "seq_scan_big_table", "relation": f"orders_p{i}",
+              "estRows": 500_000, "selectivity": 0.01} for i in range(n_nodes - 1)]
+    return AdviseInput(features=feats, plan={"Plan": {"Node Type": "Append", "Plans": scans}})
+
+
+def _render_time(n_nodes: int) -> float:
+    payload = _payload(n_nodes)
+    recs, contribs = apply_rules(payload, RULES)
+    risk = aggregate_score(contribs, payload)
+    best = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        md = render_report(recs, risk, payload)
+        best = min(best, time.perf_counter() - t0)
+    assert "orders_p0" in md
+    return best
+
+
+def test_render_report_scales_linearly_on_5000_node_plan():
+    small, large = _render_time(1000), _render_time(5000)
+    # рекомендаций и узлов в 5 раз больше: линейно — ~5x, квадратично — ~25x
+    # абсолютное время — в benchmarks.run (render_report/*), сравнение с baseline
+    assert large / small < 12, (small, large)
@@ -0,0 +1,37 @@
+import copy
+
+from src.analyzer.extract import plan_to_features
+
+
+def _seq_scan(rel, flt=None, rows=1000):
+    node = {"Node Type": "Seq Scan", "Relation Name": rel, "Alias": rel, "Plan Rows": rows, "Plan Width": 8}
+    if flt:
+        node["Filter"] = flt
+    return node
+
+
+def test_node_ids_are_preorder_and_stable():
+    plan = {"Plan": {"Node Type": "Append", "Plans": [
+        {"Node Type": "Result", "Plans": [_seq_scan("p1", "(a > 1)")]},
+        _seq_scan("p2", "(a > 1)"),
+    ]}}
+    feats = plan_to_features(plan, "")
+    assert [(f["nodeId"], f["relation"]) for f in feats] == [(2, "p1"), (3, "p2")]
+    assert plan_to_features(copy.deepcopy(plan), "") == feats
+
+
+def test_deep_plan_does_not_hit_recursion_limit():
+    node = _seq_scan("leaf", "(x = 1)")
+    for _ in range(5000):
+        node = {"Node Type": "Materialize", "Plan Rows": 1, "Plan Width": 8, "Plans": [node]}
+    feats = plan_to_features({"Plan": node}, "")
+    assert [(f["kind"], f["nodeId"]) for f in feats] == [("seq_scan_big_table", 5000)]
+
+
+def test_detectors_by_node_type():
+    inner = _seq_scan("users", "((email)::text ~~ '%abc'::text)", rows=200_000)
+    plan = {"Plan": {"Node Type": "Nested Loop", "Join Filter": "(o.user_id = users.id)",
+                     "Plans": [_seq_scan("o"), inner]}}
+    kinds = {(f["kind"], f["nodeId"]) for f in plan_to_features(plan, "")}
+    assert ("nested_loop_no_inner_index", 0) in kinds
+    assert ("like_leading_wildcard", 2) in kinds
@@ -0,0 +1,74 @@
+from src.db.history import HistoryStore, make_record
+
+
+def _result(score, severity, rules):
+    return {"risk": {"score": score, "severity": severity},
+            "recommendations": [{"rule_id": r} for r in rules],
+            "plan": {"Plan": {"Total Cost": 10.5}}}
+
+
+def test_keyset_pagination_and_filters(tmp_path):
+    store = HistoryStore(path=str(tmp_path / "h.sqlite3"), enabled=True)
+    for i in range(25):
+        sev = "critical" if i % 5 == 0 else "info"
+        store.record(make_record("advise", _result(i, sev, ["R_A"] if i % 2 else ["R_B"]),
+                                 sql=f"SELECT {i}", query_id="q1" if i < 10 else "q2"))
+    store.flush()
+    assert store.written == 25
+
+    seen, cursor = [], None
+    while True:
+        page = store.list(limit=10, cursor=cursor)
+        seen += [it["id"] for it in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 25 and seen == sorted(seen, reverse=True)
+
+    crit = store.list(limit=50, severity="critical")["items"]
+    assert [it["risk_score"] for it in crit] == [20, 15, 10, 5, 0]
+    assert len(store.list(limit=50, rule_id="R_B")["items"]) == 13
+    assert len(store.list(limit=50, query_id="q1", min_score=5)["items"]) == 5
+
+    full = store.get(seen[0])
+    assert full["result"]["risk"]["score"] == 24 and full["total_cost"] == 10.5
+    store.stop()
+
+
+def test_advise_sql_hash_mode_keeps_total_cost(monkeypatch):
+    from fastapi.testclient import TestClient
+    import src.app as app_mod
+
+    async def fake_explain(*args, **kwargs):
+        return {"plan": [{"Plan": {"Node Type": "Result", "Total Cost": 42.0, "Plan Rows": 1}}]}
+
+    records = []
+    monkeypatch.setattr(app_mod, "_explain_for_advise", fake_explain)
+    monkeypatch.setattr(app_mod.plan_store, "put", lambda plan: "h")
+    monkeypatch.setattr(app_mod.history, "record", records.append)
+
+    body = TestClient(app_mod.app).post("/advise/sql", json={"sql": "SELECT 1", "plan_mode": "hash"}).json()
+    assert "plan" not in body and body["plan_hash"] == "h"
+    assert records[0]["total_cost"] == 42.0
+
+
+def test_advise_sql_batch_records_each_successful_item(monkeypatch):
+    from fastapi import HTTPException
+    from fastapi.testclient import TestClient
+    import src.app as app_mod
+
+    async def fake_explain(sql, *args, **kwargs):
+        if "bad" in sql:
+            raise HTTPException(status_code=400, detail="syntax error")
+        return {"plan": [{"Plan": {"Node Type": "Result", "Total Cost": 7.0, "Plan Rows": 1}}]}
+
+    records = []
+    monkeypatch.setattr(app_mod, "_explain_for_advise", fake_explain)
+    monkeypatch.setattr(app_mod.plan_store, "put", lambda plan: "h")
+    monkeypatch.setattr(app_mod.history, "record", records.append)
+
+    items = [{"sql": "SELECT 1", "plan_mode": "hash"}, {"sql": "bad"}, {"sql": "SELECT 2"}]
+    body = TestClient(app_mod.app).post("/advise/sql/batch", json={"items": items}).json()
+    assert body["failed"] == 1
+    assert sorted(r["sql_text"] for r in records) == ["SELECT 1", "SELECT 2"]
+    assert all(r["source"] == "advise_sql" and r["total_cost"] == 7.0 for r in records)
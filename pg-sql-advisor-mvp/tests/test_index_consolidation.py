@@ -0,0 +1,41 @@
+from src.advisor.index_consolidation import consolidate_indexes, parse_index_ddl
+
+
+def _c(ddl, q):
+    return {"ddl": ddl, "query": q, "rule_id": "R"}
+
+
+def test_parse_index_ddl():
+    ix = parse_index_ddl('CREATE INDEX CONCURRENTLY idx_a ON public.users(lower(email), "Age" DESC) '
+                         "INCLUDE(name) WHERE deleted_at IS NULL;")
+    assert ix["table"] == "public.users" and ix["method"] == "btree"
+    assert ix["keys"] == ["lower(email)", '"Age" DESC']
+    assert ix["include"] == ["name"] and ix["where"] == "deleted_at IS NULL"
+    assert parse_index_ddl("ANALYZE public.users;") is None
+
+
+def test_prefix_and_include_are_folded():
+    res = consolidate_indexes([
+        _c("CREATE INDEX CONCURRENTLY i1 ON public.users(country);", 1),
+        _c("CREATE INDEX CONCURRENTLY i2 ON public.users(country, age);", 2),
+        _c("CREATE INDEX CONCURRENTLY i3 ON public.users(country) INCLUDE(email);", 3),
+        _c("CREATE INDEX CONCURRENTLY i4 ON public.users(age);", 4),
+        _c("CREATE INDEX CONCURRENTLY i5 ON public.users USING gin (email gin_trgm_ops);", 5),
+    ])
+    assert res["input"] == 5 and res["output"] == 3
+    top = res["indexes"][0]
+    assert top["keys"] == ["country", "age"] and top["include"] == ["email"]
+    assert top["queries"] == [2, 1, 3]
+    assert top["ddl"] == "CREATE INDEX CONCURRENTLY i2 ON public.users(country, age) INCLUDE(email);"
+    assert {tuple(i["keys"]) for i in res["indexes"][1:]} == {("age",), ("email gin_trgm_ops",)}
+
+
+def test_unique_and_partial_not_merged():
+    res = consolidate_indexes([
+        _c("CREATE UNIQUE INDEX u1 ON t(a);", 1),
+        _c("CREATE INDEX i1 ON t(a, b);", 2),
+        _c("CREATE INDEX i2 ON t(a) WHERE b > 0;", 3),
+        _c("CREATE INDEX i1 ON t(a, b);", 4),
+    ])
+    assert res["output"] == 3
+    assert [i["queries"] for i in res["indexes"]][0] == [2, 4]
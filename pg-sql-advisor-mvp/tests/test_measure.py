@@ -0,0 +1,90 @@
+import asyncio
+
+from src.advisor.measure import measure_gains, parse_set_local, rewrite_time_range
+
+SQL = ("SELECT * FROM orders WHERE to_char(created_at, 'YYYY-MM-DD') >= '2024-01-01' "
+       "AND to_char(created_at, 'YYYY-MM-DD') <= '2024-01-31' AND status = 'new'")
+
+
+def _plan(cost, rows):
+    return {"plan": [{"Plan": {"Node Type": "Seq Scan", "Total Cost": cost, "Plan Rows": rows}}]}
+
+
+def test_rewrite_time_range():
+    out = rewrite_time_range(SQL, "created_at", "2024-01-01", "2024-02-01")
+    assert out == ("SELECT * FROM orders WHERE \"created_at\" >= DATE '2024-01-01' "
+                   "AND \"created_at\" < DATE '2024-02-01' AND status = 'new'")
+    assert rewrite_time_range("SELECT 1", "created_at", "2024-01-01", "2024-02-01") is None
+
+
+def test_parse_set_local_is_strict():
+    assert parse_set_local("SET LOCAL work_mem = '128MB';") == ("work_mem", "128MB")
+    assert parse_set_local("SET LOCAL work_mem TO 65536") == ("work_mem", "65536")
+    assert parse_set_local("SET LOCAL role = 'postgres';") is None
+    assert parse_set_local("SET LOCAL work_mem = '1MB'; DROP TABLE t;") is None
+
+
+def test_measure_gains_fills_expected_gain():
+    seen = {}
+
+    async def explain(sql):
+        seen.setdefault("explain", []).append(sql)
+        return _plan(100.0, 10) if "DATE" in sql else _plan(5000.0, 25)
+
+    async def explain_set(sql, settings):
+        seen["settings"] = settings
+        return _plan(4000.0, 25)
+
+    recs = [
+        {"rule_id": "R_CAST_PREVENTS_INDEX", "type": "sql_rewrite", "evidence": [{"nodeId": 1}],
+         "expected_gain": {"source": "heuristic"}},
+        {"type": "db_setting", "action": {"alter": "SET LOCAL work_mem = '128MB';"}, "expected_gain": {}},
+        {"type": "index", "action": {"ddl": "CREATE INDEX ..."}, "expected_gain": {}},
+    ]
+    feats = [{"nodeId": 1, "kind": "range_time_query", "timeCol": "created_at",
+              "fromDate": "2024-01-01", "toDate_next": "2024-02-01"}]
+    n = asyncio.run(measure_gains(SQL, recs, feats, explain, explain_set))
+    assert n == 2
+    assert recs[0]["expected_gain"]["source"] == "measured"
+    assert recs[0]["expected_gain"]["value"]["cost_delta"] == -4900.0
+    assert recs[0]["expected_gain"]["value"]["rows_delta"] == -15
+    assert recs[1]["expected_gain"]["value"]["cost_delta_pct"] == -20.0
+    assert seen["settings"] == {"work_mem": "128MB"}
+    assert "value" not in recs[2]["expected_gain"]
+
+
+def test_rewrite_delta_only_for_range_rule_and_explained_once():
+    from src.advisor.rule_engine import apply_rules
+    from src.advisor.rules_loader import load_rules
+    from src.analyzer.extract import plan_to_features
+    from src.models import AdviseInput
+
+    sql = SQL + " AND email LIKE '%x'"
+    plan = {"Plan": {"Node Type": "Seq Scan", "Relation Name": "orders", "Plan Rows": 500_000, "Total Cost": 5000.0,
+                     "Filter": "((to_char(created_at, 'YYYY-MM-DD'::text) >= '2024-01-01'::text) AND "
+                               "(to_char(created_at, 'YYYY-MM-DD'::text) <= '2024-01-31'::text) AND "
+                               "(email ~~ '%x'::text))"}}
+    feats = plan_to_features(plan, sql)
+    recs, _ = apply_rules(AdviseInput(features=feats, sqlText=sql), load_rules())
+    # два одинаковых переписывания одного запроса — один EXPLAIN варианта
+    recs.append(dict(next(r for r in recs if r["rule_id"] == "R_CAST_PREVENTS_INDEX"), expected_gain={}))
+    rule_ids = {r["rule_id"] for r in recs}
+    assert {"R_CAST_PREVENTS_INDEX", "R_LIKE_LEADING_WILDCARD"} <= rule_ids
+
+    explained = []
+
+    async def explain(s):
+        explained.append(s)
+        return _plan(10.0, 1) if "DATE" in s else _plan(1000.0, 1)
+
+    async def explain_set(s, settings):
+        raise AssertionError("no settings to measure")
+
+    asyncio.run(measure_gains(sql, recs, feats, explain, explain_set))
+    assert len(explained) == 2   # исходный запрос + один вариант
+    for r in recs:
+        gain = r.get("expected_gain") or {}
+        if r["rule_id"] == "R_CAST_PREVENTS_INDEX":
+            assert gain["source"] == "measured" and gain["value"]["cost_delta"] == -990.0
+        else:
+            assert gain.get("source") != "measured"
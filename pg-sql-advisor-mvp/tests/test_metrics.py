@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+
+from src.app import app
+from src.utils.metrics import Histogram, server_timing
+
+client = TestClient(app)
+
+
+def test_server_timing_and_prometheus_export():
+    payload = {"features": [{"nodeId": 1, "kind": "seq_scan_big_table", "relation": "public.metrics_t",
+                             "estRows": 500_000, "selectivity": 0.01}]}
+    resp = client.post("/advise", json=payload)
+    assert resp.status_code == 200
+    timing = resp.headers["server-timing"]
+    assert "rules;dur=" in timing and "render;dur=" in timing and "total;dur=" in timing
+
+    text = client.get("/metrics").text
+    assert 'advisor_request_seconds_count{method="POST",route="/advise",status="200"}' in text
+    assert 'advisor_stage_seconds_bucket{stage="rules",le="+Inf"}' in text
+    assert 'advisor_rule_matches_total{rule_id="R_SEQ_SCAN_BIG_TABLE"}' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("t_seconds", "test", ("op",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v, op="x")
+    lines = h.expose()
+    assert lines[:3] == ['t_seconds_bucket{op="x",le="0.1"} 1', 't_seconds_bucket{op="x",le="1"} 2',
+                         't_seconds_bucket{op="x",le="+Inf"} 3']
+    assert lines[-1] == 't_seconds_count{op="x"} 3'
+    assert server_timing({"explain": 0.0125}, 0.02) == "explain;dur=12.50, total;dur=20.00"
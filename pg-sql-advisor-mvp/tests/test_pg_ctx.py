@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+
+import pytest
+
+from src.db import pg
+from src.db.pg import _ctx_query, _execute, _session_ctx
+
+
+def test_ctx_query_single_statement():
+    sql, params = _ctx_query("public, app", 1500, {"enable_seqscan": "off"})
+    assert sql == "SELECT set_config(%s, %s, true), set_config(%s, %s, true), set_config(%s, %s, true)"
+    assert params == ["statement_timeout", "1500", "search_path", "public, app", "enable_seqscan", "off"]
+
+
+def test_ctx_query_empty_and_invalid():
+    assert _ctx_query(None, 0) is None
+    with pytest.raises(ValueError):
+        _ctx_query("public; drop table x", 1000)
+
+
+class _Info:
+    transaction_status = None
+
+
+class FakeConn:
+    """Пишет в log последовательность команд, как их увидел бы сервер."""
+
+    def __init__(self, fail_on=None):
+        self.log, self.fail_on, self.closed = [], fail_on, False
+        self.info = _Info()
+
+    def execute(self, sql, params=None):
+        if sql == pg._RESET_SQL:
+            sql = "RESET"
+        elif sql.startswith("SELECT set_config"):
+            sql = "SELECT set_config"
+        self.log.append(sql)
+        if self.fail_on and self.fail_on == sql:
+            raise RuntimeError("boom")
+
+    @contextmanager
+    def pipeline(self):
+        self.log.append("<pipeline>")
+        yield
+        self.log.append("</pipeline>")
+
+    @contextmanager
+    def transaction(self, force_rollback=False):
+        self.log.append("BEGIN")
+        try:
+            yield
+        except Exception:
+            self.log.append("ROLLBACK")
+            raise
+        self.log.append("ROLLBACK" if force_rollback else "COMMIT")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    description = None
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.execute(sql, params)
+
+    def fetchall(self):
+        return []
+
+
+def _run(sql, fail_on=None, pipeline=True, monkeypatch=None):
+    monkeypatch.setattr(pg, "USE_PIPELINE", pipeline)
+    conn = FakeConn(fail_on)
+    session, ctx = _session_ctx(sql, "app", 5000)
+    try:
+        _execute(conn, FakeCursor(conn), sql, None, ctx, session=session)
+    except RuntimeError:
+        pass
+    return conn
+
+
+def test_select_runs_in_one_pipelined_transaction(monkeypatch):
+    conn = _run("SELECT 1", monkeypatch=monkeypatch)
+    assert conn.log == ["<pipeline>", "BEGIN", "SELECT set_config", "SELECT 1", "COMMIT", "</pipeline>"]
+    assert _ctx_query("app", 5000)[0].count("true") == 2
+
+
+def test_statement_timeout_is_local_to_the_transaction(monkeypatch):
+    conn = _run("SELECT pg_sleep(10)", fail_on="SELECT pg_sleep(10)", pipeline=False, monkeypatch=monkeypatch)
+    assert conn.log == ["BEGIN", "SELECT set_config", "SELECT pg_sleep(10)", "ROLLBACK"]
+
+
+@pytest.mark.parametrize("sql", ["CREATE INDEX CONCURRENTLY idx_t_a ON t(a)", "VACUUM (ANALYZE) t"])
+def test_non_transactional_statements_use_session_settings(sql, monkeypatch):
+    conn = _run(sql, monkeypatch=monkeypatch)
+    # без BEGIN: иначе "cannot run inside a transaction block"
+    assert conn.log == ["SELECT set_config", sql, "RESET"]
+    assert "false" in _session_ctx(sql, "app", 5000)[1][0]
+    # сброс выполняется и после ошибки запроса
+    assert _run(sql, fail_on=sql, monkeypatch=monkeypatch).log[-1] == "RESET"
+
+
+def test_failed_reset_drops_connection(monkeypatch):
+    conn = _run("VACUUM t", fail_on="RESET", monkeypatch=monkeypatch)
+    assert conn.closed
@@ -0,0 +1,37 @@
+from src.db.plan_cache import PlanCache, normalize_sql, plan_relations
+
+
+def test_normalize_sql_ignores_cosmetics_but_keeps_literals():
+    a = "SELECT *  FROM users\n  -- comment\n WHERE country = 'USA  x';"
+    b = "SELECT * FROM users /* other */ WHERE country = 'USA  x'"
+    assert normalize_sql(a) == normalize_sql(b)
+    assert normalize_sql(a) != normalize_sql(b.replace("USA  x", "USA x"))
+
+
+def test_plan_relations():
+    plan = [{"Plan": {"Node Type": "Hash Join", "Plans": [
+        {"Node Type": "Seq Scan", "Relation Name": "users"},
+        {"Node Type": "Hash", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "orders"}]},
+    ]}}]
+    assert plan_relations(plan) == ["orders", "users"]
+
+
+def test_lru_eviction_and_counters():
+    cache = PlanCache(max_entries=2, ttl_s=60)
+    for i in range(3):
+        cache.put(("k", i), {"plan": i})
+    assert cache.get(("k", 0)) is None
+    assert cache.get(("k", 2)) == {"plan": 2}
+    st = cache.stats()
+    assert (st["hits"], st["misses"], st["evictions"], st["size"]) == (1, 1, 1, 2)
+
+
+def test_stale_stats_invalidate_entry():
+    cache = PlanCache(max_entries=8, ttl_s=60, stats_check_s=0)
+    key = PlanCache.make_key("select 1 from users", "public", ["FORMAT JSON"])
+    cache.put(key, {"plan": 1}, {"users": ("2024-01-01", None)})
+
+    assert cache.get(key, lambda rels: {"users": ("2024-01-01", None)}) == {"plan": 1}
+    assert cache.get(key, lambda rels: {"users": ("2024-02-01", None)}) is None
+    assert cache.stats()["stale_invalidations"] == 1
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,27 @@
+from src.db.history import make_record
+from src.db.plan_store import PlanStore, plan_hash
+
+
+def _plan(n):
+    return {"Plan": {"Node Type": "Append", "Total Cost": 1.0 * n,
+                     "Plans": [{"Node Type": "Seq Scan", "Relation Name": f"orders_p{i}"} for i in range(n)]}}
+
+
+def test_plans_stored_once_and_compressed(tmp_path):
+    store = PlanStore(path=str(tmp_path / "plans.sqlite3"))
+    a = store.put(_plan(2000))
+    # тот же план с другим порядком ключей — тот же хэш
+    same = {"Plan": dict(reversed(list(_plan(2000)["Plan"].items())))}
+    assert store.put(same) == a == plan_hash(_plan(2000))
+    b = store.put(_plan(3))
+    assert b != a
+    assert store.get(a) == _plan(2000) and store.get("0" * 64) is None
+    st = PlanStore(path=store.path).stats()     # свежий экземпляр: всё читается из БД
+    assert st["plans"] == 2 and st["ratio"] > 5
+
+
+def test_history_record_references_plan_by_hash():
+    res = {"risk": {"score": 1}, "recommendations": [], "plan": _plan(3), "plan_hash": "h"}
+    rec = make_record("advise_sql", res)
+    assert "plan" not in rec["result"] and rec["result"]["plan_hash"] == "h"
+    assert rec["total_cost"] == 3.0
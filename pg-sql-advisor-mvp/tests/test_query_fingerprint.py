@@ -0,0 +1,60 @@
+import time
+
+from src.advisor.workload import group_by_fingerprint, load_snapshot
+from src.analyzer.query_fingerprint import fingerprint, normalize_query
+
+
+def test_constants_do_not_change_query_id():
+    a = fingerprint("SELECT * FROM Users WHERE to_char(created_at, 'YYYY-MM-DD') >= '2024-01-01' AND id IN (1, 2, 3);")
+    b = fingerprint("select *\n from users -- comment\n where to_char(created_at,'YYYY-MM-DD')>=$1 and id in ($2)")
+    assert a == b
+    assert a[1] == "select * from users where to_char (created_at, ?) >= ? and id in (?)"
+    assert fingerprint('SELECT "Users".id FROM "Users"')[0] != fingerprint("SELECT users.id FROM users")[0]
+    assert normalize_query("SELECT $fn$ x ; y $fn$, ARRAY[1, 2.5e3], E'it''s'") == "select ?, array [?], ?"
+
+
+def test_query_id_is_signed_bigint():
+    qid, _ = fingerprint("SELECT 1")
+    assert -2 ** 63 <= qid < 2 ** 63
+
+
+def test_linear_on_large_statement():
+    def run(n):
+        sql = "SELECT * FROM t WHERE id IN (" + ", ".join(str(i) for i in range(n)) + ")"
+        t0 = time.perf_counter()
+        assert fingerprint(sql)[1] == "select * from t where id in (?)"
+        return time.perf_counter() - t0
+    small, large = run(20_000), run(200_000)
+    assert large / small < 25, (small, large)
+
+
+def test_workload_groups_by_fingerprint():
+    rows = load_snapshot([
+        {"queryid": "1", "query": "SELECT * FROM t WHERE id IN ($1, $2)", "calls": 2, "total_exec_time": 10},
+        {"queryid": "2", "query": "SELECT * FROM t WHERE id IN ($1, $2, $3)", "calls": 3, "total_exec_time": 30},
+        {"queryid": "3", "query": "SELECT 1", "calls": 1, "total_exec_time": 1},
+    ])
+    groups = group_by_fingerprint(rows)
+    assert len(groups) == 2
+    g = groups[0]
+    assert g["queryid"] == "2" and g["queryids"] == ["2", "1"]
+    assert g["calls"] == 5 and g["total_exec_time"] == 40 and g["mean_exec_time"] == 8
+
+
+def test_workload_advise_runs_off_event_loop():
+    import asyncio, threading
+    from src.advisor.workload import analyze_workload
+
+    rows = load_snapshot([{"queryid": "1", "query": "SELECT 1", "calls": 1, "total_exec_time": 1,
+                           "plan": [{"Plan": {"Node Type": "Result"}}]}])
+    threads = []
+
+    def advise(sql, exp, catalog):
+        threads.append(threading.get_ident())
+        return {"risk": None, "recommendations": []}
+
+    async def explain(sql, generic):
+        raise AssertionError("plan is in the snapshot")
+
+    res = asyncio.run(analyze_workload(rows, explain, advise))
+    assert res["failed"] == 0 and threads and threads[0] != threading.get_ident()
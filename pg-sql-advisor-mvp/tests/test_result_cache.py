@@ -0,0 +1,29 @@
+from src.advisor.result_cache import ResultCache
+
+
+def test_lru_evicts_by_bytes():
+    cache = ResultCache(max_bytes=100)
+    cache.put("a", {"v": "x" * 30})
+    cache.put("b", {"v": "y" * 30})
+    assert cache.get("a") is not None      # a — самый свежий
+    cache.put("c", {"v": "z" * 30})         # вытесняет b
+    assert cache.get("b") is None
+    st = cache.stats()
+    assert st["size"] == 2 and st["bytes"] <= 100 and st["evictions"] == 1
+    cache.put("big", {"v": "q" * 500})
+    assert cache.stats()["oversized"] == 1
+
+
+def _key(features):
+    from src.advisor.result_cache import make_key
+    from src.models import AdviseInput
+    return make_key(AdviseInput(features=features), "v1")
+
+
+def test_key_distinguishes_values_that_normalization_collapses():
+    # int(4.0) == int(4.9), но правило R_SORT_SPILL срабатывает только на втором
+    spill = {"nodeId": 1, "kind": "sort_spill_risk", "workMemMB": 4.0}
+    assert _key([dict(spill, memEstMB=4.0)]) != _key([dict(spill, memEstMB=4.9)])
+    # одинаковый fingerprint (kind, relation, nodeId), разные fkCol — разный DDL
+    fk = {"nodeId": 1, "kind": "fk_missing_index", "relation": "orders"}
+    assert _key([dict(fk, fkCol="b")]) != _key([dict(fk, fkCol="c")])
@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+
+from src.models import AdviseInput
+from src.advisor.rule_engine import apply_rules
+from src.advisor.risk_score import aggregate_score
+from src.advisor.rules_loader import load_rules
+
+GOLDEN = Path(__file__).parent / "golden"
+
+
+def test_golden_case_01():
+    payload = AdviseInput(**json.loads((GOLDEN / "in_case_01.json").read_text(encoding="utf-8")))
+    expected = json.loads((GOLDEN / "out_case_01.json").read_text(encoding="utf-8"))
+
+    recs, contribs = apply_rules(payload, load_rules())
+    risk = aggregate_score(contribs, payload)
+
+    assert risk["score"] == expected["risk"]["score"]
+    assert risk["severity"] == expected["risk"]["severity"]
+    assert risk["drivers"] == expected["risk"]["drivers"]
+    assert {r["rule_id"] for r in recs} == set(expected["risk"]["drivers"])
+
+
+def test_rules_dispatch_by_feature_kind():
+    ruleset = load_rules()
+    assert [cr.id for cr in ruleset.for_kind("like_leading_wildcard")] == ["R_LIKE_LEADING_WILDCARD", "R_LIKE_TRGM"]
+    assert ruleset.for_kind("select_star") == []
+
+
+def test_action_templates_resolve_context_placeholders():
+    payload = AdviseInput(features=[
+        {"nodeId": 1, "kind": "fk_missing_index", "relation": "sales.orders", "fkCol": "user_id"},
+        {"nodeId": 2, "kind": "index_only_possible", "relation": "users", "filterCols": ["age"]},
+    ])
+    recs, _ = apply_rules(payload, load_rules())
+    by_rule = {r["rule_id"]: r for r in recs}
+
+    fk = by_rule["R_FK_MISSING_INDEX"]
+    assert fk["action"]["ddl"] == "CREATE INDEX CONCURRENTLY idx_sales_orders_user_id_fk ON sales.orders(user_id);"
+    assert fk["title"] == "Индекс на внешний ключ sales.orders(user_id)"
+    # пустой INCLUDE() не попадает в DDL
+    assert by_rule["R_INDEX_ONLY_POSSIBLE"]["action"]["ddl"] == \
+        "CREATE INDEX CONCURRENTLY idx_public_users_age_cover ON public.users(age);"
+
+
+def test_like_leading_wildcard_yields_one_trgm_index():
+    payload = AdviseInput(features=[{"nodeId": 1, "kind": "like_leading_wildcard", "relation": "users",
+                                     "col": "email", "cols": ["email"]}])
+    recs, _ = apply_rules(payload, load_rules())
+    ddls = [r["action"]["ddl"] for r in recs if r["action"].get("ddl")]
+    # индекс даёт только R_LIKE_TRGM, правило-переписывание остаётся подсказкой
+    assert ddls == ["CREATE INDEX CONCURRENTLY idx_public_users_email_trgm ON public.users USING gin(email gin_trgm_ops);"]
+    assert {r["rule_id"] for r in recs} == {"R_LIKE_LEADING_WILDCARD", "R_LIKE_TRGM"}
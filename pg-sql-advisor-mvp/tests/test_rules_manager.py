@@ -0,0 +1,58 @@
+import os
+import shutil
+from pathlib import Path
+
+from src.advisor.rules_manager import RulesetManager
+
+RULES_SRC = Path("src/rules/ruleset-v1")
+
+
+def test_reload_swaps_version_and_keeps_old_set_for_readers(tmp_path):
+    rules_dir = tmp_path / "rules"
+    shutil.copytree(RULES_SRC, rules_dir)
+    mgr = RulesetManager(str(rules_dir), poll_s=0)
+
+    v1 = mgr.current
+    assert v1.version == 1 and len(v1) == 16
+
+    # без изменений в каталоге перезагрузка ничего не делает
+    assert mgr.reload()["version"] == 1
+
+    (rules_dir / "R_SORT_SPILL.yaml").unlink()
+    st = mgr.reload()
+    assert st["version"] == 2 and st["rules"] == 15
+    # ссылка, взятая до перезагрузки, по-прежнему указывает на старый набор
+    assert len(v1) == 16 and mgr.current is not v1
+
+
+def test_empty_ruleset_is_rejected(tmp_path):
+    rules_dir = tmp_path / "rules"
+    shutil.copytree(RULES_SRC, rules_dir)
+    mgr = RulesetManager(str(rules_dir), poll_s=0)
+    v1 = mgr.current
+
+    for f in rules_dir.iterdir():
+        f.write_text("id: broken\n", encoding="utf-8")
+    os.utime(rules_dir)
+    st = mgr.reload()
+    assert st["rejected"] == 1 and st["version"] == 1
+    assert mgr.current is v1
+
+
+def test_broken_rule_file_is_rejected(tmp_path):
+    rules_dir = tmp_path / "rules"
+    shutil.copytree(RULES_SRC, rules_dir)
+    mgr = RulesetManager(str(rules_dir), poll_s=0)
+    v1 = mgr.current
+
+    # полусохранённый файл: YAML не парсится
+    (rules_dir / "R_SORT_SPILL.yaml").write_text("id: R_SORT_SPILL\nmatch: [feature: \n", encoding="utf-8")
+    st = mgr.reload()
+    assert st["version"] == 1 and st["rules"] == 16 and st["rejected"] == 1
+    assert "R_SORT_SPILL.yaml" in st["last_error"]
+    assert mgr.current is v1
+
+    # файл дописан — перезагрузка проходит
+    shutil.copy(RULES_SRC / "R_SORT_SPILL.yaml", rules_dir / "R_SORT_SPILL.yaml")
+    st = mgr.reload()
+    assert st["version"] == 2 and st["rules"] == 16 and st["last_error"] is None
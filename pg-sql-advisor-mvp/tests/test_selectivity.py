@@ -0,0 +1,80 @@
+import pytest
+
+from src.advisor.rule_engine import apply_rules
+from src.advisor.rules_loader import load_rules
+from src.analyzer.extract import plan_to_features
+from src.analyzer.selectivity import clause_selectivity, estimate_selectivity, parse_filter
+from src.db.catalog import build_snapshot
+from src.models import AdviseInput
+
+STATUS = {"null_frac": 0.0, "n_distinct": 4, "mcv": ["done", "new"], "mcf": [0.9, 0.05]}
+AMOUNT = {"null_frac": 0.1, "n_distinct": -0.5, "mcv": [], "mcf": [],
+          "histogram": [str(v) for v in range(0, 1001, 100)]}
+
+
+def test_parse_filter_conjuncts():
+    preds = parse_filter("((status = 'new'::text) AND ((amount)::numeric > 100.5) "
+                         "AND (region_id = ANY ('{1,2,3}'::integer[])) AND (deleted_at IS NULL) "
+                         "AND (o.user_id = u.id) AND ((a = 1) OR (b = 2)))")
+    assert preds == [("status", "=", "new"), ("amount", ">", "100.5"),
+                     ("region_id", "any", ["1", "2", "3"]), ("deleted_at", "null", None)]
+
+
+def test_parse_filter_flips_constant_first():
+    preds = parse_filter("(('2024-01-01'::date < d) AND (100 >= (amount)::numeric) AND ('new'::text = status) "
+                         "AND (5 <> o.region_id) AND (o.user_id = u.id))")
+    assert preds == [("d", ">", "2024-01-01"), ("amount", "<=", "100"), ("status", "=", "new"),
+                     ("region_id", "<>", "5")]
+    # после разворота оценка та же, что у обычной формы
+    node = {"Filter": "(250 > amount)"}
+    facts = {"reltuples": 1000, "columns": {"amount": AMOUNT}}
+    assert estimate_selectivity(node, facts)[0] == pytest.approx(0.9 * 0.25)
+
+
+def test_equality_uses_mcv_then_rest():
+    assert clause_selectivity(STATUS, "=", "new", 1000) == pytest.approx(0.05)
+    # 2 не-MCV значения делят остаток 0.05 поровну
+    assert clause_selectivity(STATUS, "=", "old", 1000) == pytest.approx(0.025)
+    assert clause_selectivity(STATUS, "any", ["new", "old", "new"], 1000) == pytest.approx(0.075)
+
+
+def test_range_interpolates_inside_bucket():
+    st = dict(AMOUNT)
+    assert clause_selectivity(st, "<", "250", 1000) == pytest.approx(0.9 * 0.25)
+    assert clause_selectivity(st, ">=", "950", 1000) == pytest.approx(0.9 * 0.05)
+    assert clause_selectivity(st, ">", "5000", 1000) == 0.0
+    assert clause_selectivity(st, "null", None, 1000) == pytest.approx(0.1)
+
+
+def test_analyze_ratio_preferred_over_stats():
+    node = {"Filter": "(status = 'new'::text)", "Actual Rows": 30, "Rows Removed by Filter": 970}
+    facts = {"reltuples": 1000, "columns": {"status": STATUS}}
+    assert estimate_selectivity(node, facts) == (0.03, "analyze")
+    del node["Actual Rows"]
+    assert estimate_selectivity(node, facts) == (0.05, "stats")
+    assert estimate_selectivity(node, None) == (None, None)
+
+
+def test_seq_scan_rule_fires_with_catalog():
+    catalog = build_snapshot({
+        "relations": [{"oid": 1, "schema": "public", "relname": "orders", "visible": True, "reltuples": 1_000_000,
+                       "relpages": 10_000, "n_live_tup": 1_000_000, "n_dead_tup": 0, "n_mod_since_analyze": 0,
+                       "last_analyze": "2024-01-02 00:00:00+00", "last_autoanalyze": None}],
+        "indexes": [], "fks": [], "ext_stats": [],
+        "stats": [{"schema": "public", "relname": "orders", "attname": a, "avg_width": 8, "correlation": 0.1, **st}
+                  for a, st in (("status", STATUS), ("amount", AMOUNT))],
+    })
+    plan = {"Plan": {"Node Type": "Seq Scan", "Relation Name": "orders", "Plan Rows": 45_000,
+                     "Filter": "((amount > '100'::numeric) AND (status = 'new'::text))"}}
+
+    assert [f for f in plan_to_features(plan, "") if f["kind"] == "seq_scan_big_table"][0].get("selectivity") is None
+
+    feat = [f for f in plan_to_features(plan, "", catalog=catalog) if f["kind"] == "seq_scan_big_table"][0]
+    assert feat["selectivitySource"] == "stats"
+    assert feat["selectivity"] == pytest.approx(0.05 * 0.9 * 0.9)
+    assert feat["filterCols"] == ["status", "amount"]
+
+    recs, _ = apply_rules(AdviseInput(features=[feat]), load_rules())
+    ddl = {r["rule_id"]: r["action"]["ddl"] for r in recs}
+    assert ddl["R_SEQ_SCAN_BIG_TABLE"] == \
+        "CREATE INDEX CONCURRENTLY idx_public_orders_status_amount ON public.orders(status, amount);"
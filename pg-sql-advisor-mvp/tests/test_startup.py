@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+_PROBE = """
+import json
+import src.app
+from src import lifecycle
+from src.db import pg, pg_async
+from src.lifecycle import rules_manager
+print(json.dumps({
+    "preloaded": lifecycle._preloaded,
+    "sync_pool": pg._pool is not None,
+    "async_pool": pg_async._pool is not None,
+    "rules_loaded": rules_manager._current is not None,
+}))
+"""
+
+
+def test_import_is_cheap_and_side_effect_free():
+    env = dict(os.environ, DATABASE_URL="postgresql://nobody@127.0.0.1:1/none")
+    out = subprocess.run([sys.executable, "-c", _PROBE], capture_output=True, text=True, env=env, check=True)
+    res = json.loads(out.stdout.strip().splitlines()[-1])
+    # импорт ничего не поднимает: ни пулов, ни правил, ни preload — всё это делает lifespan
+    assert not res["preloaded"]
+    assert not res["sync_pool"] and not res["async_pool"] and not res["rules_loaded"]
+
+
+def test_health_cold_start_without_database():
+    from src.app import app
+    from src.db import pg_async
+
+    with TestClient(app) as client:   # прогоняет lifespan
+        resp = client.get("/health")
+        assert resp.status_code == 200
+        assert pg_async._pool is None
+        assert client.get("/rules/version").json()["version"] >= 1
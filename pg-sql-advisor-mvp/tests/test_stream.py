@@ -0,0 +1,125 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.app import app
+from src.db import pg_async
+from src.db.pg_async import stream_sql_async
+
+
+class FakeCursor:
+    def __init__(self, rows, log):
+        self.rows, self.log, self.itersize = rows, log, None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, params=None):
+        self.log.append(sql)
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for r in self.rows:
+            yield r
+
+
+class FakeConn:
+    def __init__(self, rows):
+        self.rows, self.log = rows, []
+
+    async def execute(self, sql, params=None):
+        self.log.append("set_config")
+
+    def cursor(self, name=None, row_factory=None):
+        assert name, "строки читаются серверным курсором"
+        return FakeCursor(self.rows, self.log)
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.log.append("BEGIN")
+        yield
+        self.log.append("COMMIT")
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    conn = FakeConn([{"id": i, "name": f"n{i}"} for i in range(5)])
+
+    @asynccontextmanager
+    async def connection(pool, target=None):
+        yield conn
+
+    async def resolve(target=None):
+        return None
+
+    monkeypatch.setattr(pg_async, "resolve_pool", resolve)
+    monkeypatch.setattr(pg_async, "_connection", connection)
+    return conn
+
+
+def _collect(**kw):
+    async def run():
+        return [c async for c in stream_sql_async("SELECT * FROM t", **kw)]
+    return asyncio.run(run())
+
+
+def test_ndjson_chunks_and_meta_trailer(fake_db):
+    chunks = _collect(itersize=2)
+    # 5 строк пачками по 2 + строка _meta
+    assert len(chunks) == 4
+    lines = [json.loads(l) for l in b"".join(chunks).decode().splitlines()]
+    assert lines[:5] == fake_db.rows
+    assert lines[5]["_meta"]["row_count"] == 5 and lines[5]["_meta"]["truncated"] is False
+    assert fake_db.log == ["BEGIN", "set_config", "SELECT * FROM t", "COMMIT"]
+
+
+def test_max_rows_is_capped_and_reported(fake_db, monkeypatch):
+    monkeypatch.setattr(pg_async, "STREAM_MAX_ROWS", 3)
+    lines = [json.loads(l) for l in b"".join(_collect(max_rows=100)).decode().splitlines()]
+    assert [l["id"] for l in lines[:-1]] == [0, 1, 2]
+    meta = lines[-1]["_meta"]
+    assert (meta["row_count"], meta["truncated"], meta["max_rows"]) == (3, True, 3)
+
+
+def test_stream_is_read_only(fake_db):
+    with pytest.raises(ValueError):
+        asyncio.run(stream_sql_async("DELETE FROM t").__anext__())
+    resp = TestClient(app).post("/sql/run/stream", json={"sql": "DELETE FROM t"})
+    assert resp.status_code == 400
+    assert fake_db.log == []
+
+
+def test_stream_endpoint(fake_db):
+    resp = TestClient(app).post("/sql/run/stream", json={"sql": "SELECT * FROM t", "max_rows": 2})
+    assert resp.status_code == 200 and resp.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(l) for l in resp.text.splitlines()]
+    assert [l.get("id") for l in lines[:-1]] == [0, 1]
+    assert lines[-1]["_meta"]["truncated"] is True
+
+
+def test_stream_holds_run_slot_and_rejects_when_full(fake_db, monkeypatch):
+    from src.utils.admission import Budget, admission
+
+    budget = Budget("run", limit=1, queue_max=0)
+    monkeypatch.setitem(admission.budgets, "run", budget)
+    seen = []
+
+    async def execute(sql, params=None):
+        seen.append(budget.active)
+
+    monkeypatch.setattr(FakeCursor, "execute", lambda self, sql, params=None: execute(sql))
+    client = TestClient(app)
+    assert client.post("/sql/run/stream", json={"sql": "SELECT * FROM t"}).status_code == 200
+    assert seen == [1] and budget.active == 0
+
+    budget.active = 1   # слот занят другим запросом, очереди нет
+    resp = client.post("/sql/run/stream", json={"sql": "SELECT * FROM t"})
+    assert resp.status_code == 429 and "Retry-After" in resp.headers
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from src.db.targets import TargetRegistry, UnknownTarget
+
+PARAMS = {"host": "db1.local", "port": 5432, "database": "sales", "user": "app", "password": "secret"}
+
+
+def test_register_list_unregister(tmp_path):
+    async def scenario():
+        reg = TargetRegistry(targets_file=str(tmp_path / "targets.json"))
+        await reg.register("sales", PARAMS)
+        assert [t["name"] for t in reg.list()] == ["sales"]
+        assert "password" not in reg.list()[0]
+
+        # другой воркер видит цель через общий файл
+        other = TargetRegistry(targets_file=str(tmp_path / "targets.json"))
+        assert other.has("sales")
+
+        assert await reg.unregister("sales")
+        with pytest.raises(UnknownTarget):
+            await reg.get_pool("sales")
+
+    asyncio.run(scenario())
+
+
+def test_password_is_not_persisted(tmp_path, monkeypatch):
+    path = tmp_path / "targets.json"
+
+    async def scenario():
+        reg = TargetRegistry(targets_file=str(path))
+        await reg.register("sales", PARAMS)
+        assert "secret" not in path.read_text()
+        # этот воркер помнит пароль, полученный при регистрации
+        reg._load_file()
+        assert reg._targets["sales"].params["password"] == "secret"
+        # другой воркер берёт пароль из окружения
+        monkeypatch.setenv("DB_TARGET_SALES_PASSWORD", "from-env")
+        assert TargetRegistry(targets_file=str(path))._targets["sales"].params["password"] == "from-env"
+
+    asyncio.run(scenario())
+
+
+class _IdlePool:
+    closed = False
+
+    def get_stats(self):
+        return {"pool_size": 1, "pool_available": 1}
+
+    async def close(self):
+        self.closed = True
+
+
+def test_sweeper_closes_idle_pools_without_traffic():
+    async def scenario():
+        reg = TargetRegistry(idle_timeout_s=0, targets_file=None)
+        await reg.register("sales", PARAMS)
+        pool = reg._targets["sales"].pool = _IdlePool()
+        reg.start(interval_s=0.01)
+        await asyncio.sleep(0.05)
+        await reg.stop()
+        assert reg._targets["sales"].pool is None and pool.closed
+
+    asyncio.run(scenario())
+
+
+def test_evicted_pool_close_is_tracked_until_done():
+    started = release = None
+
+    class _SlowPool(_IdlePool):
+        async def close(self):
+            started.set()
+            await release.wait()
+            self.closed = True
+
+    async def scenario():
+        nonlocal started, release
+        started, release = asyncio.Event(), asyncio.Event()
+        reg = TargetRegistry(idle_timeout_s=0, targets_file=None)
+        await reg.register("sales", PARAMS)
+        pool = reg._targets["sales"].pool = _SlowPool()
+        assert reg._evict_idle() == ["sales"]
+        await started.wait()
+        assert len(reg._closing) == 1          # задача закрытия не потеряна
+        release.set()
+        await reg.close_all()                  # дожидается фоновых закрытий
+        assert pool.closed and not reg._closing
+
+    asyncio.run(scenario())
+
+
+def test_failed_check_does_not_register_target():
+    from fastapi.testclient import TestClient
+    from src.app import app
+    from src.db.targets import targets
+
+    body = dict(PARAMS, host="127.0.0.1", port=1, name="broken")
+    resp = TestClient(app).post("/api/settings/db/test", json=body)
+    assert resp.status_code == 400
+    assert not targets.has("broken")